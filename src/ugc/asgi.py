@@ -14,3 +14,18 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ugc.settings')
 
 application = get_asgi_application()
+
+# Под runserver статические файлы отдает сам Django, в режиме отладки сохраняем это поведение и для сервера ASGI.
+from django.conf import settings  # noqa: E402
+
+if settings.DEBUG:
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler  # noqa: E402
+
+    application = ASGIStaticFilesHandler(application)
+
+# Прогрев кэша скомпилированных опросов процесса сервера. Запускается здесь, а не в AppConfig.ready(), чтобы
+# прогрев не выполнялся в командах управления (migrate, warm_survey_cache, ...).
+from ugc.surveys import warmup  # noqa: E402
+
+if warmup.get_settings().get('ON_STARTUP'):
+    warmup.start_warmup_thread()
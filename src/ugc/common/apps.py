@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CommonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ugc.common'
+
+    def ready(self):
+        # noinspection PyUnresolvedReferences
+        from ugc.common import signals  # noqa: F401
@@ -0,0 +1,58 @@
+"""
+Загрузка пользователя запроса через кэш.
+
+AuthenticationMiddleware на каждый запрос читает пользователя сессии из auth_user. CachedModelBackend хранит
+пользователя в кэше Django с коротким временем жизни (settings.AUTH_USER_CACHE). Запись сбрасывается после
+коммита изменения или удаления пользователя, в т.ч. смены пароля (см. ugc.common.signals). Изменения в обход
+моделей (QuerySet.update) становятся видны по истечении времени жизни.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+
+def get_settings() -> dict:
+    return getattr(settings, 'AUTH_USER_CACHE', {})
+
+
+def _get_cache():
+    return caches[get_settings().get('CACHE_ALIAS', 'default')]
+
+
+def _get_key(user_id) -> str:
+    return f'auth:user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    _get_cache().delete(_get_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который загружает пользователя сессии из кэша."""
+
+    def get_user(self, user_id):
+        cache = _get_cache()
+        key: str = _get_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user_cls = get_user_model()
+            try:
+                user = user_cls._default_manager.get(pk=user_id)
+            except user_cls.DoesNotExist:
+                return None
+            cache.set(key, user, timeout=get_settings().get('TTL', 60))
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        cache = _get_cache()
+        key: str = _get_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user_cls = get_user_model()
+            try:
+                user = await user_cls._default_manager.aget(pk=user_id)
+            except user_cls.DoesNotExist:
+                return None
+            await cache.aset(key, user, timeout=get_settings().get('TTL', 60))
+        return user if self.user_can_authenticate(user) else None
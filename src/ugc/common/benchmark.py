@@ -0,0 +1,146 @@
+import math
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Any, Callable
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """
+    Процентиль методом ближайшего ранга.
+    :param values: Отсортированные значения.
+    :param pct: Процентиль, 0-100.
+    :return: Значение процентиля или 0 для пустого списка значений.
+    """
+    if not values:
+        return 0
+    rank: int = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+@dataclass
+class LatencyStats:
+    count: int
+    errors: int
+    seconds: float
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+    @classmethod
+    def from_samples(cls, samples: list[float], errors: int = 0, seconds: float = 0) -> 'LatencyStats':
+        """
+        :param samples: Задержки в секундах.
+        :param errors: Кол-во неудачных операций.
+        :param seconds: Общее время прогона, для расчета пропускной способности.
+        """
+        values: list[float] = sorted(samples)
+        return cls(
+            count=len(values),
+            errors=errors,
+            seconds=round(seconds, 3),
+            rps=round(len(values) / seconds, 1) if seconds else 0,
+            p50_ms=round(percentile(values, 50) * 1000, 2),
+            p95_ms=round(percentile(values, 95) * 1000, 2),
+            p99_ms=round(percentile(values, 99) * 1000, 2),
+            max_ms=round(values[-1] * 1000, 2) if values else 0,
+        )
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class OperationStats:
+    latency: LatencyStats
+    # Кол-во SQL-запросов на вызов.
+    queries_median: float
+    queries_max: int
+    # Пик памяти, выделенной Python за один вызов, КиБ.
+    memory_peak_kib: float
+
+    def as_dict(self) -> dict:
+        return {
+            **self.latency.as_dict(),
+            'queries_median': self.queries_median,
+            'queries_max': self.queries_max,
+            'memory_peak_kib': self.memory_peak_kib,
+        }
+
+
+def measure(fn: Callable[[int], Any], iterations: int, warmup: int = 1) -> OperationStats:
+    """
+    Измерить операцию.
+
+    Задержка и кол-во запросов берутся из замеряемых вызовов. Память измеряется отдельным вызовом под
+    tracemalloc, так как трассировка замедляет выполнение.
+    :param fn: Операция, получает номер итерации.
+    :param iterations: Кол-во замеряемых вызовов.
+    :param warmup: Кол-во вызовов без замера перед измерением, например для заполнения кэшей.
+    """
+    for idx in range(warmup):
+        fn(idx)
+
+    samples: list[float] = []
+    queries: list[int] = []
+    started_at: float = time.perf_counter()
+    for idx in range(warmup, warmup + iterations):
+        with CaptureQueriesContext(connection) as context:
+            call_started_at: float = time.perf_counter()
+            fn(idx)
+            samples.append(time.perf_counter() - call_started_at)
+        queries.append(len(context.captured_queries))
+    seconds: float = time.perf_counter() - started_at
+
+    tracemalloc.start()
+    try:
+        fn(warmup + iterations)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return OperationStats(
+        latency=LatencyStats.from_samples(samples, seconds=seconds),
+        queries_median=statistics.median(queries) if queries else 0,
+        queries_max=max(queries, default=0),
+        memory_peak_kib=round(peak / 1024, 1),
+    )
+
+
+def compare_with_baseline(
+    operations: dict[str, dict],
+    baseline: dict[str, dict],
+    latency_threshold: float,
+    query_threshold: int,
+) -> list[str]:
+    """
+    Найти ухудшения относительно эталонного отчета.
+    :param operations: Текущие результаты по названиям операций, см. OperationStats.as_dict.
+    :param baseline: Эталонные результаты в том же формате. Операции, которых нет в одном из отчетов, пропускаются.
+    :param latency_threshold: Допустимый относительный рост задержки p95, например 0.2 для 20%.
+    :param query_threshold: Допустимый рост максимального кол-ва запросов на вызов.
+    :return: Описания ухудшений, пустой список, если их нет.
+    """
+    regressions: list[str] = []
+    for name, current in operations.items():
+        reference: dict | None = baseline.get(name)
+        if reference is None:
+            continue
+        if current['queries_max'] > reference['queries_max'] + query_threshold:
+            regressions.append(
+                f'{name}: запросов {current['queries_max']} > эталон {reference['queries_max']}'
+                f' + {query_threshold}'
+            )
+        limit: float = reference['p95_ms'] * (1 + latency_threshold)
+        if current['p95_ms'] > limit:
+            regressions.append(
+                f'{name}: p95 {current['p95_ms']} мс > эталон {reference['p95_ms']} мс'
+                f' + {latency_threshold:.0%}'
+            )
+    return regressions
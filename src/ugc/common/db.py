@@ -0,0 +1,66 @@
+import json
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Model, QuerySet
+
+
+def reserve_id_range(model: type[Model], amount: int, using: str = DEFAULT_DB_ALIAS) -> range:
+    """
+    Выделить непрерывный диапазон первичных ключей из последовательности таблицы.
+
+    Позволяет заранее связать создаваемые объекты между собой и вставить их массово, без повторного чтения
+    ключей и обновления ссылок. Ключи идут подряд, но только при отсутствии параллельных вставок в таблицу:
+    ключ, выданный другому соединению между чтением и сдвигом последовательности, попадет в диапазон.
+    :param model: Модель с автоинкрементным первичным ключом.
+    :param amount: Кол-во ключей.
+    :param using: Псевдоним БД.
+    :return: Диапазон ключей.
+    """
+    if amount <= 0:
+        return range(0)
+    # noinspection PyProtectedMember
+    meta = model._meta
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT setval(seq, nextval(seq) + %s - 1) '
+            'FROM (SELECT pg_get_serial_sequence(%s, %s)::regclass AS seq) AS sequence',
+            [amount, meta.db_table, meta.pk.column],
+        )
+        last: int = cursor.fetchone()[0]
+    return range(last - amount + 1, last + 1)
+
+
+def get_estimated_count(model: type[Model], using: str = DEFAULT_DB_ALIAS) -> int:
+    """
+    Оценка кол-ва строк таблицы по статистике PostgreSQL (pg_class.reltuples), без чтения таблицы.
+
+    Для секционированной таблицы суммируются оценки секций.
+    :param model: Модель.
+    :param using: Псевдоним БД.
+    :return: Оценка кол-ва строк. 0, если статистики еще нет.
+    """
+    # noinspection PyProtectedMember
+    meta = model._meta
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint '
+            'FROM pg_partition_tree(%s::regclass) AS t JOIN pg_class AS c ON c.oid = t.relid '
+            'WHERE t.isleaf',
+            [connections[using].ops.quote_name(meta.db_table)],
+        )
+        return cursor.fetchone()[0]
+
+
+def get_planned_count(queryset: QuerySet) -> int:
+    """
+    Оценка кол-ва строк запроса по плану выполнения (EXPLAIN), без выполнения запроса.
+    :param queryset: Запрос.
+    :return: Оценка кол-ва строк.
+    """
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
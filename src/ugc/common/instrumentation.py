@@ -0,0 +1,273 @@
+"""
+Инструментирование запросов: SQL, шаблоны и общее время.
+
+Для каждого запроса считаются кол-во SQL-запросов, время в БД и повторяющиеся запросы (через
+execute_wrappers всех соединений), а также время рендеринга шаблонов. Итоги отдаются клиенту в
+заголовке Server-Timing и накапливаются по представлениям в скользящем окне, которое выводится в текстовом
+формате Prometheus (см. ugc.common.middleware и ugc.common.views).
+
+Метрики хранятся в памяти процесса, при нескольких процессах каждый отдает свои.
+"""
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+
+DEFAULT_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Метрики текущего запроса. None - запрос не инструментируется.
+_current: ContextVar['RequestMetrics | None'] = ContextVar('request_metrics', default=None)
+
+
+def get_settings() -> dict:
+    return getattr(settings, 'REQUEST_INSTRUMENTATION', {})
+
+
+@dataclass
+class RequestMetrics:
+    queries: int = 0
+    db_seconds: float = 0
+    # Кол-во выполнений каждого запроса с одинаковыми SQL и параметрами.
+    statements: Counter = field(default_factory=Counter)
+    template_seconds: float = 0
+    # Время в БД во время рендеринга шаблонов, не входит в собственное время шаблонов.
+    template_db_seconds: float = 0
+    template_depth: int = 0
+    total_seconds: float = 0
+
+    @property
+    def duplicates(self) -> int:
+        return self.queries - len(self.statements)
+
+    @property
+    def template_self_seconds(self) -> float:
+        return max(self.template_seconds - self.template_db_seconds, 0)
+
+    @property
+    def app_seconds(self) -> float:
+        return max(self.total_seconds - self.db_seconds - self.template_self_seconds, 0)
+
+    def execute(self, execute: Callable, sql: str, params: Any, many: bool, context: dict):
+        """Обертка выполнения запроса для connection.execute_wrapper."""
+        started_at: float = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds: float = time.perf_counter() - started_at
+            self.queries += 1
+            self.db_seconds += seconds
+            if self.template_depth:
+                self.template_db_seconds += seconds
+            self.statements[(sql, repr(params))] += 1
+
+    def get_server_timing(self) -> str:
+        """Значение заголовка Server-Timing, длительности в миллисекундах."""
+        return ', '.join((
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries, {self.duplicates} duplicates"',
+            f'tpl;dur={self.template_self_seconds * 1000:.1f}',
+            f'app;dur={self.app_seconds * 1000:.1f}',
+            f'total;dur={self.total_seconds * 1000:.1f}',
+        ))
+
+
+def start_request() -> tuple[RequestMetrics, Any]:
+    """Начать сбор метрик запроса. Возвращает метрики и токен для finish_request."""
+    metrics: RequestMetrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request(token: Any):
+    _current.reset(token)
+
+
+def _execute(execute: Callable, sql: str, params: Any, many: bool, context: dict):
+    metrics: RequestMetrics | None = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.execute(execute, sql, params, many, context)
+
+
+def _add_execute_wrapper(connection):
+    # В начало списка: connection.execute_wrapper() снимает последнюю обертку при выходе из блока.
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _add_execute_wrapper(connection)
+
+
+def instrument_connections():
+    """Замерять SQL-запросы всех соединений с БД. Метрики берутся из контекста запроса, поэтому учитываются и
+    запросы, выполненные под ASGI в потоках sync_to_async со своими соединениями."""
+    connection_created.connect(_on_connection_created, dispatch_uid='ugc.common.instrumentation')
+    for connection in connections.all(initialized_only=True):
+        _add_execute_wrapper(connection)
+
+
+_templates_instrumented: bool = False
+
+
+def instrument_templates():
+    """Замерять рендеринг шаблонов Django. Вложенный рендеринг (render_to_string в шаблоне и т.п.) не
+    учитывается повторно."""
+    global _templates_instrumented
+    if _templates_instrumented:
+        return
+    _templates_instrumented = True
+
+    render = Template.render
+
+    @wraps(render)
+    def instrumented_render(self, context=None, request=None):
+        metrics: RequestMetrics | None = _current.get()
+        if metrics is None:
+            return render(self, context, request)
+
+        metrics.template_depth += 1
+        started_at: float = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_seconds += time.perf_counter() - started_at
+
+    Template.render = instrumented_render
+
+
+@dataclass
+class _Series:
+    bucket_counts: list[int]
+    count: int = 0
+    seconds: float = 0
+    queries: int = 0
+    duplicates: int = 0
+    db_seconds: float = 0
+    template_seconds: float = 0
+
+    def add(self, other: '_Series'):
+        for idx, value in enumerate(other.bucket_counts):
+            self.bucket_counts[idx] += value
+        self.count += other.count
+        self.seconds += other.seconds
+        self.queries += other.queries
+        self.duplicates += other.duplicates
+        self.db_seconds += other.db_seconds
+        self.template_seconds += other.template_seconds
+
+
+class RollingHistogram:
+    """
+    Потокобезопасная гистограмма длительности запросов по представлениям за скользящее окно.
+
+    Окно делится на интервалы, устаревшие интервалы отбрасываются целиком, поэтому окно сдвигается шагами
+    длиной в интервал.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, window: float = 60, slices: int = 6):
+        """
+        :param buckets: Верхние границы корзин в секундах.
+        :param window: Длина окна в секундах.
+        :param slices: Кол-во интервалов в окне.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self.slices = slices
+        self._slice_seconds: float = window / slices
+        # Пары (номер интервала, серии по представлениям).
+        self._data: deque[tuple[int, dict[str, _Series]]] = deque()
+        self._lock = threading.Lock()
+
+    def _drop_expired(self, current: int):
+        while self._data and self._data[0][0] <= current - self.slices:
+            self._data.popleft()
+
+    def observe(self, view: str, metrics: RequestMetrics):
+        current: int = int(time.monotonic() // self._slice_seconds)
+        bucket: int = next(
+            (idx for idx, bound in enumerate(self.buckets) if metrics.total_seconds <= bound),
+            len(self.buckets),
+        )
+        with self._lock:
+            self._drop_expired(current)
+            if not self._data or self._data[-1][0] != current:
+                self._data.append((current, {}))
+            series: _Series = self._data[-1][1].setdefault(view, _Series([0] * (len(self.buckets) + 1)))
+            series.bucket_counts[bucket] += 1
+            series.count += 1
+            series.seconds += metrics.total_seconds
+            series.queries += metrics.queries
+            series.duplicates += metrics.duplicates
+            series.db_seconds += metrics.db_seconds
+            series.template_seconds += metrics.template_self_seconds
+
+    def snapshot(self) -> dict[str, _Series]:
+        """Серии по представлениям за окно."""
+        result: dict[str, _Series] = {}
+        with self._lock:
+            self._drop_expired(int(time.monotonic() // self._slice_seconds))
+            for _, views in self._data:
+                for view, series in views.items():
+                    result.setdefault(view, _Series([0] * (len(self.buckets) + 1))).add(series)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _create_histogram() -> RollingHistogram:
+    options: dict = get_settings()
+    return RollingHistogram(
+        buckets=options.get('BUCKETS', DEFAULT_BUCKETS),
+        window=options.get('WINDOW', 60),
+        slices=options.get('SLICES', 6),
+    )
+
+
+histogram: RollingHistogram = _create_histogram()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(source: RollingHistogram) -> str:
+    """Метрики гистограммы в текстовом формате Prometheus."""
+    data: dict[str, _Series] = source.snapshot()
+    window: float = source.window
+    lines: list[str] = [
+        f'# HELP ugc_request_duration_seconds Длительность запросов за последние {window:g} с.',
+        '# TYPE ugc_request_duration_seconds histogram',
+    ]
+    for view, series in sorted(data.items()):
+        label: str = f'view="{_escape_label(view)}"'
+        cumulative: int = 0
+        for bound, value in zip(source.buckets + (float('inf'),), series.bucket_counts):
+            cumulative += value
+            le: str = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f'ugc_request_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+        lines.append(f'ugc_request_duration_seconds_sum{{{label}}} {series.seconds:.6f}')
+        lines.append(f'ugc_request_duration_seconds_count{{{label}}} {series.count}')
+
+    gauges: tuple[tuple[str, str, Callable[[_Series], float]], ...] = (
+        ('ugc_request_queries', 'Кол-во SQL-запросов', lambda s: s.queries),
+        ('ugc_request_duplicate_queries', 'Кол-во повторяющихся SQL-запросов', lambda s: s.duplicates),
+        ('ugc_request_db_seconds', 'Время в БД', lambda s: round(s.db_seconds, 6)),
+        ('ugc_request_template_seconds', 'Время рендеринга шаблонов без БД', lambda s: round(s.template_seconds, 6)),
+    )
+    for name, description, getter in gauges:
+        lines.append(f'# HELP {name} {description} за последние {window:g} с.')
+        lines.append(f'# TYPE {name} gauge')
+        for view, series in sorted(data.items()):
+            lines.append(f'{name}{{view="{_escape_label(view)}"}} {getter(series)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,119 @@
+"""
+Массовая загрузка строк в таблицы моделей.
+
+Основной путь - COPY ... FROM STDIN: строки кодируются в текстовый формат COPY во временный буфер в памяти
+и передаются в PostgreSQL порциями, без создания экземпляров моделей и параметризованных INSERT. Запасной
+путь - bulk_create.
+"""
+import io
+from datetime import date, datetime
+from typing import Any, Iterable, Sequence
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Model
+
+# Размер буфера, после заполнения которого данные передаются в БД, байт.
+BUFFER_SIZE = 8 * 1024 * 1024
+
+_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def _encode_value(value: Any) -> str:
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, str):
+        return value.translate(_ESCAPES)
+    return str(value)
+
+
+def _get_copy_sql(model: type[Model], fields: Sequence[str], using: str) -> str:
+    quote_name = connections[using].ops.quote_name
+    # noinspection PyProtectedMember
+    meta = model._meta
+    columns: str = ', '.join(quote_name(meta.get_field(name).column) for name in fields)
+    return f'COPY {quote_name(meta.db_table)} ({columns}) FROM STDIN'
+
+
+def copy_rows(
+    model: type[Model],
+    fields: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    using: str = DEFAULT_DB_ALIAS,
+    buffer_size: int = BUFFER_SIZE,
+) -> int:
+    """
+    Загрузить строки в таблицу модели через COPY.
+
+    Значения по умолчанию полей модели не подставляются, все обязательные поля без значения по умолчанию
+    в БД должны быть в строках.
+    :param model: Модель.
+    :param fields: Имена полей (или их attname, например author_id) в порядке значений строки.
+    :param rows: Строки значений.
+    :param using: Псевдоним БД.
+    :param buffer_size: Размер буфера в байтах.
+    :return: Кол-во загруженных строк.
+    """
+    sql: str = _get_copy_sql(model, fields, using)
+    count: int = 0
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy'):
+            # psycopg 3 сам буферизует данные COPY.
+            with raw_cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write('\t'.join(map(_encode_value, row)) + '\n')
+                    count += 1
+            return count
+
+        buffer: io.StringIO = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(map(_encode_value, row)))
+            buffer.write('\n')
+            count += 1
+            if buffer.tell() >= buffer_size:
+                buffer.seek(0)
+                raw_cursor.copy_expert(sql, buffer)
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            buffer.seek(0)
+            raw_cursor.copy_expert(sql, buffer)
+    return count
+
+
+def load_rows(
+    model: type[Model],
+    fields: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    copy: bool = True,
+    using: str = DEFAULT_DB_ALIAS,
+    batch_size: int | None = None,
+) -> int:
+    """
+    Загрузить строки в таблицу модели через COPY или bulk_create.
+    :param model: Модель.
+    :param fields: Имена полей (или их attname) в порядке значений строки.
+    :param rows: Строки значений.
+    :param copy: Использовать ли COPY. Иначе строки превращаются в экземпляры модели для bulk_create.
+    :param using: Псевдоним БД.
+    :param batch_size: Размер пакета bulk_create.
+    :return: Кол-во загруженных строк.
+    """
+    if copy:
+        return copy_rows(model, fields, rows, using=using)
+    objects: list[Model] = model.objects.using(using).bulk_create(
+        (model(**dict(zip(fields, row))) for row in rows),
+        batch_size=batch_size,
+    )
+    return len(objects)
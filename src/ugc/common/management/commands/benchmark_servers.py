@@ -0,0 +1,224 @@
+import http.client
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from typing import Type
+from urllib.parse import urlsplit, urlencode, SplitResult
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management import BaseCommand, CommandError
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.utils.crypto import get_random_string
+
+from ugc.common.benchmark import LatencyStats
+from ugc.surveys.models import SurveyResult
+
+logger = logging.getLogger(__name__)
+
+CHOICE_RE = re.compile(r'name="choice" value="(\d+)"')
+
+
+class Client:
+    """HTTP-клиент одного пользователя с keep-alive соединением."""
+
+    def __init__(self, url: SplitResult, session_key: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self.csrf_secret = get_random_string(CSRF_SECRET_LENGTH, allowed_chars=CSRF_ALLOWED_CHARS)
+        self.cookie = (
+            f'{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={self.csrf_secret}'
+        )
+        self._connection: http.client.HTTPConnection | None = None
+
+    def request(self, method: str, body: dict | None = None) -> tuple[int, str]:
+        headers: dict[str, str] = {'Cookie': self.cookie}
+        data: str | None = None
+        if body is not None:
+            data = urlencode({**body, 'csrfmiddlewaretoken': self.csrf_secret})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+            try:
+                self._connection.request(method, self.url.path, body=data, headers=headers)
+                response = self._connection.getresponse()
+                return response.status, response.read().decode()
+            except (http.client.HTTPException, ConnectionError):
+                # Сервер мог закрыть keep-alive соединение, пробуем еще раз с новым.
+                self._connection.close()
+                self._connection = None
+                if attempt:
+                    raise
+        raise AssertionError('Недостижимо')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+
+
+class Command(BaseCommand):
+    """Команда сравнивает серверы (например, WSGI и ASGI) на сценарии прохождения опроса при одинаковой
+    конкурентности.
+
+    Каждый виртуальный клиент авторизован под отдельным пользователем и в цикле запрашивает страницу опроса
+    и отправляет первый вариант ответа текущего вопроса. Перед прогоном каждого сервера результаты этих
+    пользователей по опросу удаляются.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            '--target',
+            dest='targets',
+            action='append',
+            required=True,
+            help='Сервер в виде имя=URL страницы опроса, например wsgi=http://localhost:8001/surveys/1/. '
+                 'Можно указать несколько раз.',
+        )
+        parser.add_argument(
+            '--survey-id',
+            dest='survey_id',
+            type=int,
+            required=True,
+            help='Опрос, указанный в URL.',
+        )
+        parser.add_argument(
+            '--concurrency',
+            dest='concurrency',
+            type=int,
+            default=50,
+            help='Кол-во одновременных клиентов.',
+        )
+        parser.add_argument(
+            '--iterations',
+            dest='iterations',
+            type=int,
+            default=20,
+            help='Кол-во пар GET + POST на клиента.',
+        )
+        parser.add_argument(
+            '--timeout',
+            dest='timeout',
+            type=float,
+            default=30,
+            help='Таймаут запроса, сек.',
+        )
+        parser.add_argument(
+            '--output',
+            dest='output',
+            help='Файл для сохранения результатов в JSON.',
+        )
+
+    # noinspection PyMethodMayBeStatic
+    def _create_sessions(self, users: list[User]) -> list[str]:
+        session_cls: Type[SessionBase] = import_module(settings.SESSION_ENGINE).SessionStore
+        keys: list[str] = []
+        for user in users:
+            session: SessionBase = session_cls()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.create()
+            keys.append(session.session_key)
+        return keys
+
+    # noinspection PyMethodMayBeStatic
+    def _run_client(
+        self,
+        client: Client,
+        iterations: int,
+        samples: dict[str, list[float]],
+        errors: list[int],
+        lock: threading.Lock,
+    ):
+        local_samples: dict[str, list[float]] = {'GET': [], 'POST': []}
+        local_errors: int = 0
+        try:
+            for _ in range(iterations):
+                started_at: float = time.perf_counter()
+                status, content = client.request('GET')
+                local_samples['GET'].append(time.perf_counter() - started_at)
+                if status != 200:
+                    local_errors += 1
+                    continue
+
+                match = CHOICE_RE.search(content)
+                if match is None:
+                    # Опрос пройден.
+                    continue
+
+                started_at = time.perf_counter()
+                status, _ = client.request('POST', {'choice': match.group(1)})
+                local_samples['POST'].append(time.perf_counter() - started_at)
+                if status != 200:
+                    local_errors += 1
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+        finally:
+            client.close()
+
+        with lock:
+            for method, values in local_samples.items():
+                samples[method].extend(values)
+            errors[0] += local_errors
+
+    def handle(self, *args, **options):
+        concurrency: int = options['concurrency']
+        survey_id: int = options['survey_id']
+
+        user_cls: Type[User] = get_user_model()
+        users: list[User] = list(user_cls.objects.order_by('id')[:concurrency])
+        if len(users) < concurrency:
+            raise CommandError(f'Недостаточно пользователей: нужно {concurrency}, есть {len(users)}.')
+        session_keys: list[str] = self._create_sessions(users)
+
+        report: dict[str, dict] = {}
+        for target in options['targets']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError(f'Неверный формат сервера: {target}')
+
+            SurveyResult.objects.filter(survey_id=survey_id, user__in=users).delete()
+
+            logger.info(f'{name}: {concurrency} клиентов x {options['iterations']} итераций ...')
+            samples: dict[str, list[float]] = {'GET': [], 'POST': []}
+            errors: list[int] = [0]
+            lock: threading.Lock = threading.Lock()
+            clients: list[Client] = [Client(urlsplit(url), key, options['timeout']) for key in session_keys]
+
+            started_at: float = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for client in clients:
+                    executor.submit(self._run_client, client, options['iterations'], samples, errors, lock)
+            seconds: float = time.perf_counter() - started_at
+
+            report[name] = {
+                method: LatencyStats.from_samples(values, seconds=seconds).as_dict()
+                for method, values in samples.items()
+            }
+            report[name]['errors'] = errors[0]
+
+            for method in ('GET', 'POST'):
+                stats: dict = report[name][method]
+                logger.info(
+                    f'{name} {method}: {stats['count']} запр. | {stats['rps']} запр./с | '
+                    f'p50 {stats['p50_ms']} мс | p95 {stats['p95_ms']} мс | p99 {stats['p99_ms']} мс'
+                )
+            logger.info(f'{name}: ошибок {errors[0]}')
+
+        SurveyResult.objects.filter(survey_id=survey_id, user__in=users).delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+
+        logger.info(f'Готово')
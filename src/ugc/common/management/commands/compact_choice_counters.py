@@ -0,0 +1,58 @@
+import logging
+import time
+
+from django.core.management import BaseCommand
+
+from ugc.surveys.counters import compact_deltas
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Команда сворачивает приращения счетчиков ответов в счетчики (см. ugc.surveys.counters)."""
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=50000,
+            help='Кол-во приращений, обрабатываемых за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--interval',
+            dest='interval',
+            type=float,
+            default=5.0,
+            help='Пауза между проходами, сек.',
+        )
+        parser.add_argument(
+            '--once',
+            dest='once',
+            action='store_true',
+            default=False,
+            help='Свернуть накопленные приращения один раз и завершиться.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size: int = options['batch_size']
+
+        logger.info(f'Сворачиваем приращения счетчиков ответов ...')
+
+        while True:
+            total: int = 0
+            started_at: float = time.monotonic()
+            while True:
+                moved: int = compact_deltas(batch_size=batch_size)
+                total += moved
+                if moved < batch_size:
+                    break
+            if total:
+                logger.info(f'Свернуто: {total} за {time.monotonic() - started_at:.3f} с')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        logger.info(f'Готово')
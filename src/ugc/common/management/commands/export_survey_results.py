@@ -0,0 +1,70 @@
+import logging
+import sys
+import time
+
+from django.core.management import BaseCommand
+
+from ugc.surveys.export import FORMATS, get_answers, iter_rows, stream_export
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Команда выгружает ответы в CSV или NDJSON, по строке на ответ.
+
+    Ответы читаются курсором на стороне сервера БД, поэтому потребление памяти не зависит от объема выгрузки.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            '--survey-id',
+            dest='survey_id',
+            type=int,
+            help='Выгрузить ответы только одного опроса.',
+        )
+        parser.add_argument(
+            '--format',
+            dest='format',
+            choices=FORMATS,
+            default='csv',
+            help='Формат выгрузки.',
+        )
+        parser.add_argument(
+            '--gzip',
+            dest='gzip',
+            action='store_true',
+            help='Сжимать выгрузку gzip.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=10000,
+            help='Кол-во ответов, читаемых из БД за раз.',
+        )
+        parser.add_argument(
+            '--output',
+            dest='output',
+            default='-',
+            help='Файл для выгрузки, по умолчанию стандартный вывод.',
+        )
+
+    def handle(self, *args, **options):
+        logger.info(f'Выгружаем ответы ...')
+        started_at: float = time.monotonic()
+        size: int = 0
+        file = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            rows = iter_rows(get_answers(survey_id=options['survey_id']), chunk_size=options['chunk_size'])
+            for block in stream_export(rows, fmt=options['format'], compress=options['gzip']):
+                file.write(block)
+                size += len(block)
+        finally:
+            if file is not sys.stdout.buffer:
+                file.close()
+            else:
+                file.flush()
+
+        logger.info(f'Готово, {size} байт за {time.monotonic() - started_at:.2f} с')
@@ -0,0 +1,58 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from ugc.surveys.ingestion import FlushStats, flush_spool, get_spool
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Команда переносит ответы из буфера отложенной записи в БД (см. ugc.surveys.ingestion)."""
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        options: dict = getattr(settings, 'SURVEYS_ANSWER_BUFFER', {})
+        parser.add_argument(
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=options.get('FLUSH_BATCH_SIZE', 10000),
+            help='Кол-во ответов, записываемых в БД одним запросом.',
+        )
+        parser.add_argument(
+            '--interval',
+            dest='interval',
+            type=float,
+            default=options.get('FLUSH_INTERVAL', 1.0),
+            help='Пауза между переносами, сек.',
+        )
+        parser.add_argument(
+            '--once',
+            dest='once',
+            action='store_true',
+            default=False,
+            help='Перенести накопленные ответы один раз и завершиться.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size: int = options['batch_size']
+        interval: float = options['interval']
+
+        logger.info(f'Переносим ответы из {get_spool().directory} ...')
+
+        while True:
+            stats: FlushStats = flush_spool(batch_size=batch_size)
+            if stats.rows:
+                logger.info(
+                    f'Перенесено: {stats.rows} за {stats.seconds:.3f} с | {stats.throughput:.0f} отв./с | '
+                    f'задержка до {stats.max_lag:.3f} с | в буфере {get_spool().pending_bytes()} байт'
+                )
+            if options['once']:
+                break
+            time.sleep(interval)
+
+        logger.info(f'Готово')
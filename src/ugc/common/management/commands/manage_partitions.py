@@ -0,0 +1,73 @@
+import logging
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from ugc.surveys import partitions
+from ugc.surveys.partitions import Partition
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Команда обслуживает секции результатов опросов (см. ugc.surveys.partitions): заранее создает секции для
+    новых опросов и отсоединяет секции старых.
+
+    Запускается периодически, чтобы у новых опросов всегда были свои секции. Иначе их результаты попадают в секцию
+    по умолчанию и переносятся при создании секции.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        options: dict = partitions.get_settings()
+        parser.add_argument(
+            '--size',
+            dest='size',
+            type=int,
+            default=options.get('SIZE', 100000),
+            help='Кол-во опросов в новой секции.',
+        )
+        parser.add_argument(
+            '--ahead',
+            dest='ahead',
+            type=int,
+            default=options.get('AHEAD', 2),
+            help='Кол-во секций, создаваемых заранее после секции последнего опроса.',
+        )
+        parser.add_argument(
+            '--detach-after-days',
+            dest='detach_after_days',
+            type=int,
+            default=options.get('DETACH_AFTER_DAYS'),
+            help='Отсоединить секции, в которых не было новых опросов и результатов дольше этого кол-ва дней. '
+                 'По умолчанию секции не отсоединяются.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            dest='dry_run',
+            action='store_true',
+            default=False,
+            help='Только показать, какие секции будут созданы и отсоединены.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run: bool = options['dry_run']
+
+        missing: list[tuple[int, int]] = partitions.get_missing_partitions(options['size'], options['ahead'])
+        for start, end in missing:
+            logger.info(f'Создаем секции опросов [{start}, {end}) ...')
+            if not dry_run:
+                partitions.create_partition(start, end)
+
+        stale: list[Partition] = []
+        if options['detach_after_days'] is not None:
+            before = timezone.now() - timedelta(days=options['detach_after_days'])
+            stale = partitions.get_stale_partitions(before)
+        for partition in stale:
+            logger.info(f'Отсоединяем секции опросов [{partition.start}, {partition.end}) ...')
+            if not dry_run:
+                partitions.detach_partition(partition.start, partition.end)
+
+        logger.info(f'Готово, создано секций: {len(missing)}, отсоединено: {len(stale)}')
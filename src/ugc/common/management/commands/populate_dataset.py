@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import platform
+import random
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Type, Any
+
+import django
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.utils import timezone
+
+from ugc.surveys.models import Survey, Question, Choice, SurveyResult, SurveyResultChoice
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DatasetProfile:
+    users: int
+    surveys: int
+    # Мин. и макс. кол-во вопросов в опросе и вариантов ответа на вопрос.
+    questions: tuple[int, int]
+    choices: tuple[int, int]
+    # Кол-во первых опросов, которые проходят пользователи, и кол-во опросов на пользователя.
+    surveys_with_results: int
+    results_per_user: int
+    completion_rate: float
+    answer_skew: float
+    batch_size: int
+
+
+PROFILES: dict[str, DatasetProfile] = {
+    'small': DatasetProfile(
+        users=1000,
+        surveys=200,
+        questions=(5, 15),
+        choices=(3, 5),
+        surveys_with_results=200,
+        results_per_user=5,
+        completion_rate=0.9,
+        answer_skew=1.0,
+        batch_size=1000,
+    ),
+    'medium': DatasetProfile(
+        users=100000,
+        surveys=20000,
+        questions=(5, 15),
+        choices=(3, 5),
+        surveys_with_results=10000,
+        results_per_user=5,
+        completion_rate=0.8,
+        answer_skew=1.0,
+        batch_size=10000,
+    ),
+    'large': DatasetProfile(
+        users=1000000,
+        surveys=200000,
+        questions=(5, 15),
+        choices=(3, 5),
+        surveys_with_results=100000,
+        results_per_user=5,
+        completion_rate=0.8,
+        answer_skew=1.0,
+        batch_size=20000,
+    ),
+    'xl': DatasetProfile(
+        users=15000000,
+        surveys=1000000,
+        questions=(5, 15),
+        choices=(3, 5),
+        surveys_with_results=100000,
+        results_per_user=5,
+        completion_rate=0.8,
+        answer_skew=1.0,
+        batch_size=20000,
+    ),
+}
+
+
+class Command(BaseCommand):
+    """Команда генерирует воспроизводимый набор данных для нагрузочного тестирования: пользователей, опросы
+    и результаты опросов с параметрами профиля и заданным зерном, после чего пересчитывает счетчики ответов.
+
+    Генерация выполняется на БД без опросов и результатов опросов, поэтому при одинаковых профиле и зерне
+    получаются одни и те же данные. Ключи пакетов выделяются заранее в родительском процессе, поэтому и они не
+    зависят от кол-ва процессов. Параметры, окружение, длительность шагов и итоговые объемы сохраняются в манифест.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            '--profile',
+            dest='profile',
+            choices=PROFILES.keys(),
+            required=True,
+            help='Профиль набора данных.',
+        )
+        parser.add_argument(
+            '--seed',
+            dest='seed',
+            type=int,
+            default=0,
+            help='Зерно генератора случайных чисел.',
+        )
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Кол-во процессов для генерации данных. На сами данные не влияет.',
+        )
+        parser.add_argument(
+            '--manifest',
+            dest='manifest',
+            help='Файл манифеста. По умолчанию var/datasets/<профиль>-<зерно>.json.',
+        )
+
+    # noinspection PyMethodMayBeStatic
+    def _get_counts(self) -> dict[str, int]:
+        user_cls: Type[User] = get_user_model()
+        return {
+            'users': user_cls.objects.count(),
+            'surveys': Survey.objects.count(),
+            'questions': Question.objects.count(),
+            'choices': Choice.objects.count(),
+            'survey_results': SurveyResult.objects.count(),
+            'completed_survey_results': SurveyResult.objects.filter(current_question__isnull=True).count(),
+            'answers': SurveyResultChoice.objects.count(),
+        }
+
+    def handle(self, *args, **options):
+        profile: DatasetProfile = PROFILES[options['profile']]
+        seed: int = options['seed']
+        if Survey.objects.exists() or SurveyResult.objects.exists():
+            raise CommandError(
+                'В БД уже есть опросы или результаты опросов, набор данных не будет воспроизводимым.'
+            )
+
+        # Зерна шагов выводятся из общего, чтобы шаги не повторяли одни и те же случайные последовательности.
+        seeds: random.Random = random.Random(seed)
+        common: dict[str, Any] = {
+            'copy': True,
+            'workers': options['workers'],
+            'batch_size': profile.batch_size,
+        }
+        steps: list[tuple[str, dict[str, Any]]] = [
+            ('populate_test_users', {
+                **common,
+                'amount': profile.users,
+                'seed': seeds.getrandbits(32),
+            }),
+            ('populate_test_surveys', {
+                **common,
+                'amount': profile.surveys,
+                'questions': profile.questions,
+                'choices': profile.choices,
+                'seed': seeds.getrandbits(32),
+            }),
+            # Секции результатов для созданных опросов.
+            ('manage_partitions', {}),
+            ('populate_test_survey_results', {
+                **common,
+                'surveys_amount': profile.surveys_with_results,
+                'results_per_user': profile.results_per_user,
+                'completion_rate': profile.completion_rate,
+                'answer_skew': profile.answer_skew,
+                'seed': seeds.getrandbits(32),
+            }),
+            ('rebuild_choice_counters', {}),
+        ]
+
+        logger.info(f'Генерируем набор данных {options['profile']} с зерном {seed} ...')
+        existing_counts: dict[str, int] = self._get_counts()
+        executed: list[dict[str, Any]] = []
+        for name, step_options in steps:
+            logger.info(f'Шаг {name} ...')
+            started_at: float = time.monotonic()
+            call_command(name, **step_options)
+            executed.append({
+                'command': name,
+                'options': step_options,
+                'seconds': round(time.monotonic() - started_at, 3),
+            })
+
+        manifest: dict[str, Any] = {
+            'profile': options['profile'],
+            'seed': seed,
+            'parameters': asdict(profile),
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'numpy': np.__version__,
+                'postgresql': connection.pg_version,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'existing': existing_counts,
+            'steps': executed,
+            'counts': self._get_counts(),
+        }
+
+        path: Path = Path(
+            options['manifest'] or settings.BASE_DIR.parent / 'var' / 'datasets' / f'{options['profile']}-{seed}.json'
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False))
+        logger.info(f'Готово, манифест: {path}')
@@ -1,21 +1,33 @@
 import logging
 import random
+from itertools import repeat
 from math import floor
-from typing import Type
+from typing import Type, Any
 
+import numpy as np
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
 from django.db import transaction
-from django.db.models import Prefetch
+from django.utils import timezone
 
+from ugc.common.db import reserve_id_range
 from ugc.common.decorators import gc_collect
-from ugc.surveys.models import Question, Survey, Choice, SurveyResult, SurveyResultChoice
+from ugc.common.loader import load_rows
+from ugc.common.parallel import run_batches
+from ugc.surveys.catalog import SurveyCatalog
+from ugc.surveys.models import SurveyResult, SurveyResultChoice
 
 logger = logging.getLogger(__name__)
 
+RESULT_FIELDS = ('id', 'survey_id', 'user_id', 'current_question_id', 'created_at')
+RESULT_CHOICE_FIELDS = ('id', 'result_id', 'survey_id', 'choice_id', 'created_at')
+
 
 class Command(BaseCommand):
+    user_ids: np.ndarray
+    catalog: SurveyCatalog
+
     def add_arguments(self, parser):
         super().add_arguments(parser)
 
@@ -33,72 +45,145 @@ class Command(BaseCommand):
             default=100000,
             help='Кол-во опросов, для которых создаются результаты.',
         )
+        parser.add_argument(
+            '--results-per-user',
+            dest='results_per_user',
+            type=int,
+            default=5,
+            help='Кол-во опросов, которые проходит каждый пользователь.',
+        )
+        parser.add_argument(
+            '--completion-rate',
+            dest='completion_rate',
+            type=float,
+            default=1.0,
+            help='Доля завершенных опросов от 0 до 1, остальные прерываются на случайном вопросе.',
+        )
+        parser.add_argument(
+            '--answer-skew',
+            dest='answer_skew',
+            type=float,
+            default=0,
+            help='Перекос популярности вариантов ответа: вероятность k-го варианта пропорциональна '
+                 '1 / k ** skew. 0 - равномерно.',
+        )
+        parser.add_argument(
+            '--copy',
+            dest='copy',
+            action='store_true',
+            default=False,
+            help='Загружать данные через COPY вместо bulk_create.',
+        )
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Кол-во процессов для генерации данных.',
+        )
+        parser.add_argument(
+            '--seed',
+            dest='seed',
+            type=int,
+            help='Зерно генератора случайных чисел. По умолчанию случайное.',
+        )
 
     @gc_collect
     def _create_results(
         self,
         amount_per_user: int,
-        user_ids: list[int],
-        surveys: list[tuple[int, list[tuple[int, list[int]]]]],
-    ):
-        results: list[SurveyResult] = []
-        result_choices: list[SurveyResultChoice] = []
-
-        for user_id in user_ids:
-            for _ in range(amount_per_user):
-                survey = random.choice(surveys)
-                result: SurveyResult = SurveyResult(survey_id=survey[0], user_id=user_id)
-                results.append(result)
-
-                questions: list[tuple[int, list[int]]] = survey[1]
-                for question in questions:
-                    choice_id: int = random.choice(question[1])
-                    result_choices.append(SurveyResultChoice(result=result, choice_id=choice_id))
+        start_idx: int,
+        end_idx: int,
+        result_start_id: int,
+        answer_start_id: int,
+        completion_rate: float,
+        answer_skew: float,
+        copy: bool,
+    ) -> int:
+        catalog: SurveyCatalog = self.catalog
+        user_ids: np.ndarray = self.user_ids[start_idx:end_idx]
+        # Зерно берем из random, который засеян для пакета.
+        rng: np.random.Generator = np.random.default_rng(random.getrandbits(64))
+
+        # Пользователь проходит каждый опрос не более одного раза.
+        surveys: np.ndarray = catalog.sample_surveys(rng, len(user_ids), amount_per_user)
+        result_user_ids: np.ndarray = np.repeat(user_ids, surveys.shape[1])
+        surveys = surveys.ravel()
+        answered: np.ndarray = catalog.sample_progress(rng, surveys, completion_rate)
+        answer_results, answer_choice_ids = catalog.sample_answers(rng, surveys, answered, skew=answer_skew)
+        current_question_ids: np.ndarray = catalog.get_current_questions(surveys, answered)
+        created_at = timezone.now()
 
         with transaction.atomic():
-            SurveyResult.objects.bulk_create(results)
-            SurveyResultChoice.objects.bulk_create(result_choices)
+            # Ключи результатов и ответов выделены заранее, поэтому на результаты сразу ссылаются ответы.
+            result_ids: np.ndarray = np.arange(result_start_id, result_start_id + len(surveys), dtype=np.int64)
+            result_survey_ids: np.ndarray = catalog.survey_ids[surveys]
+            load_rows(
+                SurveyResult,
+                RESULT_FIELDS,
+                zip(
+                    result_ids.tolist(),
+                    result_survey_ids.tolist(),
+                    result_user_ids.tolist(),
+                    (question_id or None for question_id in current_question_ids.tolist()),
+                    repeat(created_at),
+                ),
+                copy=copy,
+            )
+            load_rows(
+                SurveyResultChoice,
+                RESULT_CHOICE_FIELDS,
+                zip(
+                    range(answer_start_id, answer_start_id + len(answer_results)),
+                    result_ids[answer_results].tolist(),
+                    result_survey_ids[answer_results].tolist(),
+                    answer_choice_ids.tolist(),
+                    repeat(created_at),
+                ),
+                copy=copy,
+            )
+        return len(user_ids)
 
     def handle(self, *args, **options):
         user_cls: Type[User] = get_user_model()
-        user_ids: list[int] = list(user_cls.objects.values_list('id', flat=True))
-        qs = (
-            Survey.objects
-            .only('id')
-            .prefetch_related(
-                Prefetch(
-                    'question_set',
-                    queryset=Question.objects.only('id', 'survey').prefetch_related(
-                        Prefetch(
-                            'choice_set',
-                            queryset=Choice.objects.only('id', 'question')
-                        )
-                    )
-                )
-            )
+        # Наследуются процессами пула при fork.
+        self.user_ids = np.fromiter(user_cls.objects.order_by('id').values_list('id', flat=True).iterator(),
+                                    dtype=np.int64)
+        self.catalog = SurveyCatalog.load(surveys_amount=options['surveys_amount'])
+        logger.info(
+            f'Каталог: опросов {len(self.catalog.survey_ids)}, вопросов {len(self.catalog.question_ids)}, '
+            f'вариантов ответа {len(self.catalog.choice_ids)}, {self.catalog.nbytes / 2 ** 20:.1f} МБ'
         )
-        surveys: list[tuple[int, list[tuple[int, list[int]]]]] = []
-        for survey in qs[:options['surveys_amount']]:
-            questions: list[tuple[int, list[int]]] = []
-            surveys.append((survey.id, questions))
-            for question in survey.question_set.all():
-                choices: list[int] = [
-                    choice.id
-                    for choice in question.choice_set.all()
-                ]
-                questions.append((question.id, choices))
-
-        logger.info(f'Создаем результаты ...')
-
-        length: int = len(user_ids)
-        batch_size: int = min(options['batch_size'], length)
-        start_idx: int = 0
-        end_idx: int
-        while start_idx < length:
-            end_idx = start_idx + batch_size
-            user_batch: list[int] = user_ids[start_idx:end_idx]
-            self._create_results(amount_per_user=5, user_ids=user_batch, surveys=surveys)
-            start_idx = end_idx
-            logger.info(f'Создано {start_idx} | {floor(start_idx * 100 / length)}%')
+
+        length: int = len(self.user_ids)
+        batch_size: int = options['batch_size']
+        seed: int = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+
+        logger.info(f'Создаем результаты, процессов: {options['workers']}, зерно: {seed} ...')
+
+        # Ключи выделяем заранее, чтобы они не зависели от порядка выполнения пакетов процессами. Кол-во ответов
+        # пакета известно только после генерации, поэтому на результат выделяется по ответу на каждый вопрос
+        # самого длинного опроса.
+        results_per_user: int = min(options['results_per_user'], len(self.catalog.survey_ids))
+        max_answers: int = int(np.diff(self.catalog.question_offsets).max(initial=0))
+        result_ids: range = reserve_id_range(SurveyResult, length * results_per_user)
+        answer_ids: range = reserve_id_range(SurveyResultChoice, length * results_per_user * max_answers)
+        batches: list[dict[str, Any]] = [
+            {
+                'amount_per_user': options['results_per_user'],
+                'start_idx': start_idx,
+                'end_idx': min(start_idx + batch_size, length),
+                'result_start_id': result_ids.start + start_idx * results_per_user,
+                'answer_start_id': answer_ids.start + start_idx * results_per_user * max_answers,
+                'completion_rate': options['completion_rate'],
+                'answer_skew': options['answer_skew'],
+                'copy': options['copy'],
+            }
+            for start_idx in range(0, length, batch_size)
+        ]
+        processed: int = 0
+        for count in run_batches(self._create_results, batches, seed=seed, workers=options['workers']):
+            processed += count
+            logger.info(f'Создано {processed} | {floor(processed * 100 / length)}%')
 
         logger.info(f'Готово')
@@ -1,46 +1,47 @@
 import logging
 import random
-from typing import Type
+import time
+from typing import Type, Any
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
 from django.db import transaction
+from django.utils import timezone
 
+from ugc.common.db import reserve_id_range
 from ugc.common.decorators import gc_collect
+from ugc.common.loader import load_rows
+from ugc.common.parallel import run_batches
 from ugc.surveys.models import Question, Survey, Choice
 
 logger = logging.getLogger(__name__)
 
+SURVEY_FIELDS = ('id', 'title', 'author_id', 'first_question_id', 'question_count', 'version', 'created_at')
+QUESTION_FIELDS = ('id', 'survey_id', 'text', 'next_id', 'position', 'created_at')
+CHOICE_FIELDS = ('id', 'question_id', 'text', 'order', 'created_at')
+
 WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'lelit']
 
 
 def generate_random_text(min_words_cnt: int = 5, max_words_cnt: int = 15) -> str:
     words_cnt: int = random.randint(min_words_cnt, max_words_cnt)
-    return ' '.join([WORDS[random.randint(0, len(WORDS) - 1)] for _ in range(words_cnt)])
+    return ' '.join(random.choices(WORDS, k=words_cnt))
 
 
-def generate_questions(min_cnt: int, max_cnt: int, **params) -> list[Question]:
-    result: list[Question] = []
+def generate_questions(min_cnt: int, max_cnt: int) -> list[str]:
     cnt: int = random.randint(min_cnt, max_cnt)
-    for idx, _ in enumerate(range(cnt)):
-        text: str = f'Вопрос {idx + 1}'
-        question: Question = Question(text=text, **params)
-        result.append(question)
-    return result
+    return [f'Вопрос {idx + 1}' for idx in range(cnt)]
 
 
-def generate_choices(min_cnt: int, max_cnt: int, **params) -> list[Choice]:
-    result: list[Choice] = []
+def generate_choices(min_cnt: int, max_cnt: int) -> list[str]:
     cnt: int = random.randint(min_cnt, max_cnt)
-    for idx, _ in enumerate(range(cnt)):
-        text: str = generate_random_text()
-        entity: Choice = Choice(text=text, order=idx, **params)
-        result.append(entity)
-    return result
+    return [generate_random_text() for _ in range(cnt)]
 
 
 class Command(BaseCommand):
+    user_ids: list[int]
+
     def add_arguments(self, parser):
         super().add_arguments(parser)
 
@@ -58,55 +59,120 @@ class Command(BaseCommand):
             default=1000000,
             help='Общее кол-во опросов.',
         )
+        parser.add_argument(
+            '--questions',
+            dest='questions',
+            type=int,
+            nargs=2,
+            default=(5, 15),
+            metavar=('MIN', 'MAX'),
+            help='Минимальное и максимальное кол-во вопросов в опросе.',
+        )
+        parser.add_argument(
+            '--choices',
+            dest='choices',
+            type=int,
+            nargs=2,
+            default=(3, 5),
+            metavar=('MIN', 'MAX'),
+            help='Минимальное и максимальное кол-во вариантов ответа на вопрос.',
+        )
+        parser.add_argument(
+            '--copy',
+            dest='copy',
+            action='store_true',
+            default=False,
+            help='Загружать данные через COPY вместо bulk_create.',
+        )
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Кол-во процессов для генерации данных.',
+        )
+        parser.add_argument(
+            '--seed',
+            dest='seed',
+            type=int,
+            help='Зерно генератора случайных чисел. По умолчанию случайное.',
+        )
 
     @gc_collect
-    def _create_surveys(self, amount: int, user_ids: list[int]):
-        with transaction.atomic():
-            surveys: list[Survey] = [
-                Survey(title=f'Заголовок опроса {idx + 1}', author_id=random.choice(user_ids))
-                for idx in range(amount)
-            ]
-            choices: list[Choice] = []
-
-            Survey.objects.bulk_create(surveys)
-
-            for survey in surveys:
-                survey_questions: list[Question] = generate_questions(5, 15, survey=survey)
-
-                Question.objects.bulk_create(survey_questions)
-
-                survey.first_question = survey_questions[0]
-                survey.save()
+    def _create_surveys(
+        self,
+        amount: int,
+        start_id: int,
+        question_start_id: int,
+        choice_start_id: int,
+        questions: tuple[int, int],
+        choices: tuple[int, int],
+        copy: bool,
+    ) -> int:
+        survey_questions: list[list[str]] = [generate_questions(*questions) for _ in range(amount)]
+        created_at = timezone.now()
+        survey_rows: list[tuple] = []
+        question_rows: list[tuple] = []
+        choice_rows: list[tuple] = []
 
-                next_question: Question | None = None
-                for question in survey_questions[::-1]:
-                    question.next = next_question
-                    next_question = question
-                Question.objects.bulk_update(survey_questions, fields=['next'])
-
-                for question in survey_questions:
-                    choices.extend(generate_choices(3, 5, question=question))
-
-            Choice.objects.bulk_create(choices)
+        with transaction.atomic():
+            # Ключи вопросов и вариантов ответа выделены заранее, поэтому опросы и вопросы вставляются со всеми
+            # ссылками сразу. Внешние ключи проверяются в конце транзакции, поэтому порядок вставки не важен.
+            offset: int = 0
+            choice_id: int = choice_start_id
+            for idx, texts in enumerate(survey_questions):
+                survey_id: int = start_id + idx
+                ids: list[int] = list(range(question_start_id + offset, question_start_id + offset + len(texts)))
+                offset += len(texts)
+                survey_rows.append((
+                    survey_id, f'Заголовок опроса {idx + 1}', random.choice(self.user_ids), ids[0], len(ids), 1,
+                    created_at,
+                ))
+                for position, (question_id, next_id, text) in enumerate(zip(ids, [*ids[1:], None], texts), start=1):
+                    question_rows.append((question_id, survey_id, text, next_id, position, created_at))
+                    for order, choice_text in enumerate(generate_choices(*choices)):
+                        choice_rows.append((choice_id, question_id, choice_text, order, created_at))
+                        choice_id += 1
+
+            load_rows(Survey, SURVEY_FIELDS, survey_rows, copy=copy)
+            load_rows(Question, QUESTION_FIELDS, question_rows, copy=copy)
+            load_rows(Choice, CHOICE_FIELDS, choice_rows, copy=copy)
+        return amount
 
     def handle(self, *args, **options):
         user_cls: Type[User] = get_user_model()
-        user_ids: list[int] = list(user_cls.objects.values_list('id', flat=True))
+        # Наследуется процессами пула при fork.
+        self.user_ids = list(user_cls.objects.order_by('id').values_list('id', flat=True))
 
         batch_size: int = options['batch_size']
         amount: int = options['amount']
-        batches: int = amount // batch_size
-
-        logger.info(f'Создаем опросы: {amount} ...')
-
-        if batches > 0:
-            for _ in range(batches):
-                self._create_surveys(amount=batch_size, user_ids=user_ids)
-                logger.info(f'Создано: {batch_size * (_ + 1)}')
-
-        rest: int = amount - batches * batch_size
-        if rest > 0:
-            self._create_surveys(amount=rest, user_ids=user_ids)
-            logger.info(f'Создано: {amount}')
+        seed: int = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+
+        logger.info(f'Создаем опросы: {amount}, процессов: {options['workers']}, зерно: {seed} ...')
+
+        # Ключи выделяем заранее, чтобы они не зависели от порядка выполнения пакетов процессами. Кол-во вопросов
+        # и вариантов ответа пакета известно только после генерации, поэтому на опрос выделяется максимум.
+        max_questions: int = options['questions'][1]
+        max_choices: int = max_questions * options['choices'][1]
+        ids: range = reserve_id_range(Survey, amount)
+        question_ids: range = reserve_id_range(Question, amount * max_questions)
+        choice_ids: range = reserve_id_range(Choice, amount * max_choices)
+        batches: list[dict[str, Any]] = [
+            {
+                'amount': min(batch_size, amount - start),
+                'start_id': ids.start + start,
+                'question_start_id': question_ids.start + start * max_questions,
+                'choice_start_id': choice_ids.start + start * max_choices,
+                'questions': tuple(options['questions']),
+                'choices': tuple(options['choices']),
+                'copy': options['copy'],
+            }
+            for start in range(0, amount, batch_size)
+        ]
+        started_at: float = time.monotonic()
+        created: int = 0
+        for count in run_batches(self._create_surveys, batches, seed=seed, workers=options['workers']):
+            created += count
+            logger.info(f'Создано: {created} | {created / (time.monotonic() - started_at):.0f} опросов/с')
 
         logger.info(f'Готово')
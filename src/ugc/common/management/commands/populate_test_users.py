@@ -1,18 +1,30 @@
 import logging
+import random
+import time
+from math import floor
 from typing import Type, Mapping, Any
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
+from django.utils import timezone
 from faker import Faker
 
+from ugc.common.db import reserve_id_range
 from ugc.common.decorators import gc_collect
+from ugc.common.loader import load_rows
+from ugc.common.parallel import run_batches
 
 logger = logging.getLogger(__name__)
 
 fake = Faker()
 
+USER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'password', 'is_superuser', 'is_staff', 'is_active',
+    'date_joined',
+)
+
 
 class Command(BaseCommand):
     user_cls: Type[User] = get_user_model()
@@ -42,53 +54,80 @@ class Command(BaseCommand):
             help='Генерировать ли пароли для пользователей. Сильно нагружает CPU, с большим кол-вом будет '
                  'очень долго.',
         )
+        parser.add_argument(
+            '--copy',
+            dest='copy',
+            action='store_true',
+            default=False,
+            help='Загружать данные через COPY вместо bulk_create.',
+        )
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Кол-во процессов для генерации данных.',
+        )
+        parser.add_argument(
+            '--seed',
+            dest='seed',
+            type=int,
+            help='Зерно генератора случайных чисел. По умолчанию случайное.',
+        )
 
     # noinspection PyMethodMayBeStatic
-    def _generate_params(self, counter: int, with_password: bool) -> Mapping[str, Any]:
+    def _generate_params(self, user_id: int, counter: int, with_password: bool) -> Mapping[str, Any]:
         username: str = f'{fake.user_name()}{counter}'
         params: dict[str, Any] = {
+            'id': user_id,
             'username': username,
             'email': fake.email(),
             'first_name': fake.first_name(),
             'last_name': fake.last_name(),
+            'password': make_password(username) if with_password else '',
+            'is_superuser': False,
+            'is_staff': False,
+            'is_active': True,
+            'date_joined': timezone.now(),
         }
-        if with_password:
-            params['password'] = make_password(username)
         return params
 
     @gc_collect
-    def _create_users(self, amount: int, start_number: int, with_password: bool):
-        self.user_cls.objects.bulk_create(
-            self.user_cls(**self._generate_params(
-                counter=_ + start_number,
-                with_password=with_password,
-            ))
+    def _create_users(self, amount: int, start_number: int, start_id: int, with_password: bool, copy: bool) -> int:
+        users = (
+            self._generate_params(user_id=_ + start_id, counter=_ + start_number, with_password=with_password)
             for _ in range(amount)
         )
+        return load_rows(
+            self.user_cls, USER_FIELDS, ([user[name] for name in USER_FIELDS] for user in users), copy=copy,
+        )
 
     def handle(self, *args, **options):
         batch_size: int = options['batch_size']
         amount: int = options['amount']
+        seed: int = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
 
-        logger.info(f'Создаем пользователей: {amount} ...')
-
-        batches: int = amount // batch_size
-        if batches > 0:
-            for _ in range(batches):
-                self._create_users(
-                    amount=batch_size,
-                    start_number=batch_size * _,
-                    with_password=options['with_passwords'],
-                )
-                logger.info(f'Создано: {batch_size * (_ + 1)}')
+        logger.info(f'Создаем пользователей: {amount}, процессов: {options['workers']}, зерно: {seed} ...')
 
-        rest: int = amount - batches * batch_size
-        if rest > 0:
-            self._create_users(
-                amount=rest,
-                start_number=batches * batch_size,
-                with_password=options['with_passwords'],
+        # Ключи выделяем заранее, чтобы они не зависели от порядка выполнения пакетов процессами.
+        ids: range = reserve_id_range(self.user_cls, amount)
+        batches: list[dict[str, Any]] = [
+            {
+                'amount': min(batch_size, amount - start_number),
+                'start_number': start_number,
+                'start_id': ids.start + start_number,
+                'with_password': options['with_passwords'],
+                'copy': options['copy'],
+            }
+            for start_number in range(0, amount, batch_size)
+        ]
+        started_at: float = time.monotonic()
+        created: int = 0
+        for count in run_batches(self._create_users, batches, seed=seed, workers=options['workers']):
+            created += count
+            logger.info(
+                f'Создано: {created} | {floor(created * 100 / amount)}% | '
+                f'{created / (time.monotonic() - started_at):.0f} польз./с'
             )
-            logger.info(f'Создано: {amount}')
 
         logger.info(f'Готово')
@@ -0,0 +1,29 @@
+import logging
+
+from django.core.management import BaseCommand
+
+from ugc.surveys.counters import rebuild_counters
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Команда пересчитывает счетчики ответов по сохраненным ответам.
+
+    Нужна после массовой загрузки данных в обход записи ответов (например, populate_test_survey_results).
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            '--survey-id',
+            dest='survey_id',
+            type=int,
+            help='Пересчитать счетчики только одного опроса.',
+        )
+
+    def handle(self, *args, **options):
+        logger.info(f'Пересчитываем счетчики ответов ...')
+        count: int = rebuild_counters(survey_id=options['survey_id'])
+        logger.info(f'Готово, счетчиков: {count}')
@@ -0,0 +1,288 @@
+import json
+import logging
+import platform
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from ugc.common.benchmark import OperationStats, measure, compare_with_baseline
+from ugc.surveys.catalog import SurveyCatalog
+from ugc.surveys.compiled import CompiledSurvey, get_compiled_survey
+from ugc.surveys.models import Survey, Question, Choice, SurveyResult, SurveyResultChoice
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = (
+    'survey_get',
+    'survey_get_repeat',
+    'survey_get_repeat_users',
+    'survey_post',
+    'admin_survey_changelist',
+    'admin_surveyresult_changelist',
+    'survey_catalog_load',
+    'populate_test_users',
+    'populate_test_surveys',
+)
+
+
+@contextmanager
+def rollback() -> Iterator[None]:
+    """Выполнить изменяющие данные операции в транзакции и откатить ее."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+class Command(BaseCommand):
+    """Команда измеряет горячие пути на сгенерированном наборе данных (см. populate_dataset): страницу опроса
+    (GET разными пользователями, повторно одним и повторно многими, POST), списки опросов и результатов опросов
+    в админке, загрузку каталога опросов и команды генерации данных.
+
+    Для каждой операции сохраняются процентили задержки, кол-во SQL-запросов на вызов и пик выделенной памяти.
+    Изменения данных откатываются. Результаты можно сравнить с ранее сохраненным отчетом: команда завершается
+    ошибкой, если кол-во запросов или p95 задержки выросли больше допустимого.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            '--operation',
+            dest='operations',
+            action='append',
+            choices=OPERATIONS,
+            help='Операция для измерения. Можно указать несколько раз. По умолчанию все.',
+        )
+        parser.add_argument(
+            '--iterations',
+            dest='iterations',
+            type=int,
+            default=50,
+            help='Кол-во измеряемых вызовов запросов к страницам.',
+        )
+        parser.add_argument(
+            '--users',
+            dest='users',
+            type=int,
+            default=1000,
+            help='Кол-во пользователей, повторно открывающих страницы опросов в операции survey_get_repeat_users.',
+        )
+        parser.add_argument(
+            '--populate-iterations',
+            dest='populate_iterations',
+            type=int,
+            default=3,
+            help='Кол-во измеряемых вызовов команд генерации данных.',
+        )
+        parser.add_argument(
+            '--output',
+            dest='output',
+            help='Файл для сохранения отчета в JSON.',
+        )
+        parser.add_argument(
+            '--baseline',
+            dest='baseline',
+            help='Отчет для сравнения, например сохраненный ранее через --output.',
+        )
+        parser.add_argument(
+            '--latency-threshold',
+            dest='latency_threshold',
+            type=float,
+            default=0.2,
+            help='Допустимый относительный рост p95 задержки по сравнению с отчетом для сравнения.',
+        )
+        parser.add_argument(
+            '--query-threshold',
+            dest='query_threshold',
+            type=int,
+            default=0,
+            help='Допустимый рост кол-ва запросов на вызов по сравнению с отчетом для сравнения.',
+        )
+
+    # noinspection PyMethodMayBeStatic
+    def _get_client(self, user) -> Client:
+        client: Client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        return client
+
+    # noinspection PyMethodMayBeStatic
+    def _request(self, client: Client, method: str, url: str, data: dict | None = None):
+        response = getattr(client, method)(url, data)
+        if response.status_code != 200:
+            raise CommandError(f'{method.upper()} {url}: статус {response.status_code}')
+        return response
+
+    def _prepare_survey_requests(
+        self,
+        amount: int,
+        incomplete: bool,
+        distinct_users: bool = False,
+    ) -> list[tuple[Client, str, dict]]:
+        """
+        Клиенты пользователей с результатами опросов, URL страницы опроса и ответ на текущий вопрос.
+        :param distinct_users: По одному результату на пользователя.
+        """
+        qs = SurveyResult.objects.select_related('user').order_by('id')
+        if incomplete:
+            qs = qs.filter(current_question__isnull=False)
+        if distinct_users:
+            qs = qs.order_by('user_id', 'id').distinct('user_id')
+        results: list[SurveyResult] = list(qs[:amount])
+        if len(results) < amount:
+            raise CommandError(
+                f'Недостаточно результатов опросов: нужно {amount}, есть {len(results)}. '
+                f'Сгенерируйте данные командой populate_dataset.'
+            )
+
+        clients: dict[int, Client] = {}
+        requests: list[tuple[Client, str, dict]] = []
+        for result in results:
+            if result.user_id not in clients:
+                clients[result.user_id] = self._get_client(result.user)
+            data: dict = {}
+            if incomplete:
+                survey: CompiledSurvey = get_compiled_survey(result.survey_id)
+                data['choice'] = survey.get_question(result.current_question_id).choices[0].id
+            url: str = reverse('survey', kwargs={'survey_id': result.survey_id})
+            requests.append((clients[result.user_id], url, data))
+        self._clients.extend(clients.values())
+        return requests
+
+    def _get_operations(self, options: dict) -> dict[str, tuple[Callable[[int], Any], int]]:
+        iterations: int = options['iterations']
+        populate_iterations: int = options['populate_iterations']
+        # Разогрев, измеряемые вызовы и вызов для измерения памяти.
+        amount: int = iterations + 2
+        selected: list[str] = options['operations'] or list(OPERATIONS)
+        operations: dict[str, tuple[Callable[[int], Any], int]] = {}
+
+        if 'survey_get' in selected:
+            get_requests = self._prepare_survey_requests(amount, incomplete=False)
+            operations['survey_get'] = (
+                lambda idx: self._request(get_requests[idx][0], 'get', get_requests[idx][1]),
+                iterations,
+            )
+        if 'survey_get_repeat' in selected:
+            # Один пользователь много раз открывает страницу одного опроса: сессия, пользователь и опрос в кэше.
+            repeat_client, repeat_url, _ = self._prepare_survey_requests(1, incomplete=False)[0]
+            operations['survey_get_repeat'] = (
+                lambda idx: self._request(repeat_client, 'get', repeat_url),
+                iterations,
+            )
+        if 'survey_get_repeat_users' in selected:
+            # Много пользователей по кругу повторно открывают страницы опросов: сессии и пользователи всех
+            # пользователей должны оставаться в кэше, иначе растет кол-во запросов.
+            users_requests = self._prepare_survey_requests(options['users'], incomplete=False, distinct_users=True)
+            for client, url, _ in users_requests:
+                self._request(client, 'get', url)
+            operations['survey_get_repeat_users'] = (
+                lambda idx: self._request(
+                    users_requests[idx % len(users_requests)][0], 'get', users_requests[idx % len(users_requests)][1],
+                ),
+                iterations,
+            )
+        if 'survey_post' in selected:
+            post_requests = self._prepare_survey_requests(amount, incomplete=True)
+            operations['survey_post'] = (
+                lambda idx: self._request(post_requests[idx][0], 'post', post_requests[idx][1], post_requests[idx][2]),
+                iterations,
+            )
+
+        if {'admin_survey_changelist', 'admin_surveyresult_changelist'} & set(selected):
+            superuser = get_user_model().objects.filter(is_superuser=True).order_by('id').first()
+            if superuser is None:
+                raise CommandError('Нет суперпользователя для запросов к админке.')
+            admin_client: Client = self._get_client(superuser)
+            self._clients.append(admin_client)
+            for name, url in (
+                ('admin_survey_changelist', reverse('admin:surveys_survey_changelist')),
+                ('admin_surveyresult_changelist', reverse('admin:surveys_surveyresult_changelist')),
+            ):
+                if name in selected:
+                    operations[name] = (
+                        lambda idx, url=url: self._request(admin_client, 'get', url),
+                        iterations,
+                    )
+
+        if 'survey_catalog_load' in selected:
+            operations['survey_catalog_load'] = (
+                lambda idx: SurveyCatalog.load(surveys_amount=1000),
+                populate_iterations,
+            )
+        if 'populate_test_users' in selected:
+            operations['populate_test_users'] = (
+                lambda idx: call_command('populate_test_users', amount=1000, batch_size=1000, copy=True, seed=idx),
+                populate_iterations,
+            )
+        if 'populate_test_surveys' in selected:
+            operations['populate_test_surveys'] = (
+                lambda idx: call_command('populate_test_surveys', amount=100, batch_size=100, copy=True, seed=idx),
+                populate_iterations,
+            )
+        return operations
+
+    # noinspection PyMethodMayBeStatic
+    def _get_dataset(self) -> dict[str, int | None]:
+        """Оценка объемов таблиц по статистике PostgreSQL, без полного подсчета строк. None - статистики еще нет."""
+        models = (get_user_model(), Survey, Question, Choice, SurveyResult, SurveyResultChoice)
+        # noinspection PyProtectedMember
+        tables: list[str] = [model._meta.db_table for model in models]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s)', [tables])
+            return {table: (count if count >= 0 else None) for table, count in cursor.fetchall()}
+
+    def handle(self, *args, **options):
+        self._clients: list[Client] = []
+        report: dict[str, Any] = {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'postgresql': connection.pg_version,
+                'platform': platform.platform(),
+            },
+            'dataset': self._get_dataset(),
+            'operations': {},
+        }
+
+        try:
+            operations = self._get_operations(options)
+            for name, (fn, iterations) in operations.items():
+                logger.info(f'{name}: {iterations} вызовов ...')
+                with rollback():
+                    stats: OperationStats = measure(fn, iterations=iterations)
+                report['operations'][name] = stats.as_dict()
+                logger.info(
+                    f'{name}: p50 {stats.latency.p50_ms} мс | p95 {stats.latency.p95_ms} мс | '
+                    f'запросов {stats.queries_max} | память {stats.memory_peak_kib} КиБ'
+                )
+        finally:
+            for client in self._clients:
+                client.logout()
+
+        if options['output']:
+            path: Path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, indent=2))
+
+        if options['baseline']:
+            baseline: dict = json.loads(Path(options['baseline']).read_text())
+            regressions: list[str] = compare_with_baseline(
+                report['operations'],
+                baseline['operations'],
+                latency_threshold=options['latency_threshold'],
+                query_threshold=options['query_threshold'],
+            )
+            if regressions:
+                raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+            logger.info(f'Регрессий относительно {options['baseline']} нет')
+
+        logger.info(f'Готово')
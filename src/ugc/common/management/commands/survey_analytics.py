@@ -0,0 +1,87 @@
+import json
+import logging
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from ugc.surveys.analytics import SurveyAnalytics, analyze_survey
+from ugc.surveys.models import Survey
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Команда считает аналитику по ответам опроса: распределение ответов по вариантам ответа, таблицу
+    сопряженности двух вопросов или полную матрицу совместной встречаемости вариантов ответа.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            '--survey-id',
+            dest='survey_id',
+            type=int,
+            required=True,
+            help='Опрос.',
+        )
+        parser.add_argument(
+            '--question-a',
+            dest='question_a',
+            type=int,
+            help='Вопрос строк таблицы сопряженности.',
+        )
+        parser.add_argument(
+            '--question-b',
+            dest='question_b',
+            type=int,
+            help='Вопрос столбцов таблицы сопряженности.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=100000,
+            help='Кол-во ответов, читаемых из БД за раз.',
+        )
+        parser.add_argument(
+            '--output',
+            dest='output',
+            help='Файл для сохранения результатов в JSON.',
+        )
+
+    def handle(self, *args, **options):
+        survey_id: int = options['survey_id']
+        question_a: int | None = options['question_a']
+        question_b: int | None = options['question_b']
+        if (question_a is None) != (question_b is None):
+            raise CommandError('Для таблицы сопряженности нужно указать оба вопроса.')
+        if not Survey.objects.filter(id=survey_id).exists():
+            raise CommandError(f'Опрос {survey_id} не найден.')
+
+        logger.info(f'Считаем аналитику по опросу {survey_id} ...')
+        started_at: float = time.monotonic()
+        analytics: SurveyAnalytics = analyze_survey(survey_id, chunk_size=options['chunk_size'])
+        logger.info(
+            f'Респондентов: {analytics.respondents}, вариантов ответа: {len(analytics.choice_ids)}, '
+            f'{time.monotonic() - started_at:.2f} с'
+        )
+
+        if question_a is not None:
+            rows, columns, counts = analytics.crosstab(question_a, question_b)
+            if not len(rows) or not len(columns):
+                raise CommandError('Вопросы не найдены в опросе.')
+            self.stdout.write('\t'.join(['', *map(str, columns.tolist())]))
+            for row, values in zip(rows.tolist(), counts.tolist()):
+                self.stdout.write('\t'.join(map(str, [row, *values])))
+        else:
+            for choice_id, question_id, count in zip(
+                analytics.choice_ids.tolist(), analytics.question_ids.tolist(), analytics.marginals.tolist()
+            ):
+                self.stdout.write(f'{question_id}\t{choice_id}\t{count}')
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(analytics.as_dict(question_a, question_b), file)
+
+        logger.info(f'Готово')
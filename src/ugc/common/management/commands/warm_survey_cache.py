@@ -0,0 +1,76 @@
+import logging
+
+from django.core.management import BaseCommand, CommandError
+
+from ugc.surveys import compiled, warmup
+from ugc.surveys.warmup import WarmupStats
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Команда прогревает общий кэш скомпилированных опросов самыми активными опросами (см. ugc.surveys.warmup).
+
+    Запускается после деплоя или перезапуска, до того как на сервер пойдут респонденты. Кэш процессов сервера
+    команда не заполняет, для него есть прогрев при старте (SURVEYS_CACHE_WARMUP['ON_STARTUP']).
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        options: dict = warmup.get_settings()
+        parser.add_argument(
+            '--hours',
+            dest='hours',
+            type=float,
+            default=options.get('HOURS', 24),
+            help='Активность опросов считается по результатам, начатым за это кол-во последних часов.',
+        )
+        parser.add_argument(
+            '--limit',
+            dest='limit',
+            type=int,
+            default=options.get('LIMIT', 1000),
+            help='Максимальное кол-во прогреваемых опросов.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=options.get('BATCH_SIZE', 500),
+            help='Кол-во опросов, загружаемых из БД одним пакетом запросов.',
+        )
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=options.get('WORKERS', 4),
+            help='Кол-во потоков, параллельно загружающих пакеты.',
+        )
+        parser.add_argument(
+            '--memory-budget',
+            dest='memory_budget',
+            type=float,
+            default=options.get('MEMORY_BUDGET_MB', 64),
+            help='Максимальный суммарный размер прогретых опросов, МБ. 0 - без ограничения.',
+        )
+
+    def handle(self, *args, **options):
+        if not compiled.has_shared_cache():
+            raise CommandError(
+                "Общий кэш опросов не задан (SURVEYS_COMPILED_CACHE['CACHE_ALIAS']), прогревать нечего"
+            )
+
+        survey_ids: list[int] = warmup.get_hot_survey_ids(options['hours'], options['limit'])
+        logger.info(f'Прогреваем кэш, активных опросов: {len(survey_ids)} ...')
+        stats: WarmupStats = warmup.warm_compiled_surveys(
+            survey_ids,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            memory_budget=int(options['memory_budget'] * 1024 * 1024) or None,
+        )
+        logger.info(
+            f'Готово, прогрето опросов: {stats.warmed} из {stats.surveys}, '
+            f'не поместилось в бюджет памяти: {stats.skipped}, '
+            f'размер: {stats.size / 1024 / 1024:.1f} МБ, время: {stats.seconds:.2f} сек'
+        )
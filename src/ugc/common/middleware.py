@@ -0,0 +1,130 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest, HttpResponse
+
+from ugc.common import instrumentation, routers
+
+
+class InstrumentationMiddleware:
+    """
+    Middleware собирает метрики запроса (см. ugc.common.instrumentation): SQL-запросы всех соединений с БД,
+    рендеринг шаблонов и общее время. Добавляет заголовок Server-Timing и учитывает запрос в гистограмме
+    представления.
+
+    Включается настройкой REQUEST_INSTRUMENTATION['ENABLED']. Чтобы учитывать запросы других middleware
+    (сессии, пользователь), должен стоять в начале MIDDLEWARE. Работает и в синхронной, и в асинхронной цепочке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options: dict = instrumentation.get_settings()
+        if not options.get('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async: bool = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.server_timing: bool = options.get('SERVER_TIMING', True)
+        instrumentation.instrument_connections()
+        instrumentation.instrument_templates()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        metrics, token = instrumentation.start_request()
+        started_at: float = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.finish_request(token)
+        return self._process_response(request, response, metrics, started_at)
+
+    async def __acall__(self, request):
+        metrics, token = instrumentation.start_request()
+        started_at: float = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.finish_request(token)
+        return self._process_response(request, response, metrics, started_at)
+
+    def _process_response(
+        self, request: HttpRequest, response: HttpResponse, metrics: instrumentation.RequestMetrics, started_at: float,
+    ) -> HttpResponse:
+        metrics.total_seconds = time.perf_counter() - started_at
+
+        # Имя представления, а не путь, чтобы кол-во серий не зависело от id в URL.
+        match = request.resolver_match
+        instrumentation.histogram.observe(match.view_name if match else 'unresolved', metrics)
+        if self.server_timing:
+            response.headers['Server-Timing'] = metrics.get_server_timing()
+        return response
+
+
+class PrimaryPinningMiddleware:
+    """
+    Middleware закрепляет чтение за основной БД (см. ugc.common.routers) на время изменяющего запроса и
+    на DATABASE_REPLICAS['PIN_SECONDS'] секунд после него для того же клиента. Срок закрепления хранится в cookie,
+    поэтому не зависит от процесса, который обслуживает следующий запрос.
+
+    Не используется, если реплики не заданы. Должен стоять до middleware, которые читают из БД (сессии,
+    пользователь). Работает и в синхронной, и в асинхронной цепочке: закрепление хранится в contextvar и
+    передается в потоки sync_to_async.
+    """
+
+    SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'TRACE'})
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not routers.get_replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async: bool = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        options: dict = routers.get_settings()
+        self.pin_seconds: int = options.get('PIN_SECONDS', 5)
+        self.cookie_name: str = options.get('PIN_COOKIE_NAME', 'pin_primary')
+
+    def _is_pinned(self, request: HttpRequest) -> bool:
+        try:
+            pinned_until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            return False
+        return pinned_until > time.time()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        is_write: bool = request.method not in self.SAFE_METHODS
+        if not is_write and not self._is_pinned(request):
+            return self.get_response(request)
+
+        with routers.pin_primary():
+            response = self.get_response(request)
+        return self._process_response(is_write, response)
+
+    async def __acall__(self, request):
+        is_write: bool = request.method not in self.SAFE_METHODS
+        if not is_write and not self._is_pinned(request):
+            return await self.get_response(request)
+
+        with routers.pin_primary():
+            response = await self.get_response(request)
+        return self._process_response(is_write, response)
+
+    def _process_response(self, is_write: bool, response: HttpResponse) -> HttpResponse:
+        if is_write and self.pin_seconds > 0:
+            response.set_cookie(
+                self.cookie_name, str(int(time.time()) + self.pin_seconds), max_age=self.pin_seconds,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,246 @@
+from functools import reduce
+from operator import or_
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, ALL_VAR, PAGE_VAR
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+from ugc.common.paginator import EstimatedCountPaginator
+
+CURSOR_VAR = 'cursor'
+CURSOR_SALT = 'ugc.common.mixins.cursor'
+
+# Направления перехода по курсору: следующая, предыдущая и последняя страницы.
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+CURSOR_LAST = 'l'
+
+
+class LargeTableChangeList(ChangeList):
+    """
+    Список объектов для LargeTableAdminMixin.
+
+    При постраничном просмотре по ключу (keyset_pagination) страница выбирается условием на поля сортировки
+    относительно первой или последней строки соседней страницы, а не через OFFSET, поэтому любая страница
+    читается за одинаковое время. Курсор передается в параметре cursor и подписывается.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Поля сортировки для постраничного просмотра по ключу: пары (имя поля, по убыванию).
+        self.keyset: list[tuple[str, bool]] | None = None
+        self.first_url: str | None = None
+        self.previous_url: str | None = None
+        self.next_url: str | None = None
+        self.last_url: str | None = None
+        super().__init__(*args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Курсор действует только для текущих фильтров и сортировки, в остальные ссылки не переносится.
+        new_params = new_params or {}
+        if CURSOR_VAR not in new_params:
+            remove = [*(remove or ()), CURSOR_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        # noinspection PyUnresolvedReferences
+        fields: tuple[str, ...] = self.model_admin.get_list_only(request)
+        if not fields:
+            return queryset
+        # Поля сортировки нужны для курсоров.
+        for part in queryset.query.order_by:
+            if isinstance(part, str) and part.lstrip('-') != 'pk':
+                try:
+                    field = self.lookup_opts.get_field(part.lstrip('-'))
+                except FieldDoesNotExist:
+                    continue
+                if field.concrete and not field.is_relation:
+                    fields += (field.name,)
+        return queryset.only(*fields)
+
+    def _get_keyset(self, queryset) -> list[tuple[str, bool]] | None:
+        """Поля сортировки, если по ним можно выбирать страницы по ключу. Последнее поле должно быть уникальным,
+        поля не могут быть пустыми или ссылками на связанные объекты (сортировка по их полям)."""
+        keyset: list[tuple[str, bool]] = []
+        for part in queryset.query.order_by:
+            if not isinstance(part, str):
+                return None
+            name: str = part.lstrip('-')
+            try:
+                field = self.lookup_opts.pk if name == 'pk' else self.lookup_opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.null or not field.concrete or field.is_relation and name != field.attname:
+                return None
+            keyset.append((field.attname, part.startswith('-')))
+            if field.primary_key or field.unique:
+                return keyset
+        return None
+
+    def _get_cursor_url(self, direction: str, obj=None) -> str:
+        values: list[str] | None = None if obj is None else [str(getattr(obj, name)) for name, _ in self.keyset]
+        cursor: str = signing.dumps([direction, values], salt=CURSOR_SALT, compress=True)
+        return self.get_query_string({CURSOR_VAR: cursor}, [PAGE_VAR])
+
+    def _load_cursor(self, request) -> tuple[str | None, list | None]:
+        token: str | None = request.GET.get(CURSOR_VAR)
+        if not token:
+            return None, None
+        try:
+            direction, values = signing.loads(token, salt=CURSOR_SALT)
+            if values is not None:
+                if len(values) != len(self.keyset):
+                    raise ValueError(values)
+                values = [
+                    self.lookup_opts.get_field(name).to_python(value)
+                    for (name, _), value in zip(self.keyset, values)
+                ]
+        except (signing.BadSignature, ValueError, TypeError, ValidationError) as e:
+            raise IncorrectLookupParameters(e)
+        return direction, values
+
+    def _filter_after(self, queryset, values: list, backwards: bool):
+        """Строки после курсора в порядке сортировки (или до него при backwards)."""
+        conditions: list[Q] = []
+        equal: dict = {}
+        for (name, descending), value in zip(self.keyset, values):
+            lookup: str = 'lt' if descending != backwards else 'gt'
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': value}))
+            equal[name] = value
+        # Избыточное условие на первое поле, чтобы оно стало границей сканирования индекса.
+        name, descending = self.keyset[0]
+        bound: Q = Q(**{f'{name}__{"lte" if descending != backwards else "gte"}': values[0]})
+        return queryset.filter(bound & reduce(or_, conditions))
+
+    def get_results(self, request):
+        # noinspection PyUnresolvedReferences
+        if self.model_admin.keyset_pagination and not self.list_editable and ALL_VAR not in request.GET:
+            self.keyset = self._get_keyset(self.queryset)
+        if self.keyset is None:
+            return super().get_results(request)
+
+        direction, values = self._load_cursor(request)
+        backwards: bool = direction in (CURSOR_PREVIOUS, CURSOR_LAST)
+        queryset = self.queryset
+        if values is not None:
+            queryset = self._filter_after(queryset, values, backwards)
+        if backwards:
+            queryset = queryset.reverse()
+        # Лишняя строка показывает, есть ли еще страница в направлении перехода.
+        result_list: list = list(queryset[:self.list_per_page + 1])
+        has_more: bool = len(result_list) > self.list_per_page
+        result_list = result_list[:self.list_per_page]
+        if backwards:
+            result_list.reverse()
+
+        # noinspection PyUnresolvedReferences
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        has_previous: bool = has_more if backwards else direction is not None
+        has_next: bool = direction == CURSOR_PREVIOUS or not backwards and has_more
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = has_previous or has_next
+        self.paginator = paginator
+        if has_previous:
+            self.first_url = self.get_query_string(remove=[PAGE_VAR])
+            if result_list:
+                self.previous_url = self._get_cursor_url(CURSOR_PREVIOUS, result_list[0])
+        if has_next:
+            self.last_url = self._get_cursor_url(CURSOR_LAST)
+            if result_list:
+                self.next_url = self._get_cursor_url(CURSOR_NEXT, result_list[-1])
+
+
+class LargeTableAdminMixin:
+    """
+    Миксин списка объектов в админке для больших таблиц.
+
+    - Связанные объекты из list_display загружаются одним запросом (select_related только по ним, а не по всем
+      внешним ключам рекурсивно), а из БД читаются только показываемые поля (only()).
+    - Вместо COUNT(*) при большом кол-ве строк используется оценка по статистике PostgreSQL, общее кол-во
+      объектов без фильтров не считается.
+    - С keyset_pagination страницы выбираются по ключу сортировки вместо OFFSET (см. LargeTableChangeList).
+      Для быстрого перехода нужен индекс по полям сортировки. При сортировке по связанным или необязательным
+      полям используются обычные страницы.
+    """
+    # Поля связанных объектов, которые нужны для их показа в списке (обычно поля __str__). Первичный ключ
+    # загружается всегда. Для внешних ключей не из словаря связанный объект загружается целиком.
+    list_only_related: dict[str, tuple[str, ...]] = {}
+    # Мин. оценка кол-ва объектов, с которой они не считаются точно.
+    estimated_count_threshold: int = 100000
+    keyset_pagination: bool = False
+    show_full_result_count = False
+
+    def _get_list_fields(self, request) -> list | None:
+        """Поля модели из list_display. None, если в list_display есть не только поля модели."""
+        # noinspection PyUnresolvedReferences
+        opts = self.model._meta
+        fields: list = []
+        # noinspection PyUnresolvedReferences
+        for name in self.get_list_display(request):
+            try:
+                fields.append(opts.get_field(name))
+            except FieldDoesNotExist:
+                return None
+        return fields
+
+    def get_list_select_related(self, request):
+        # noinspection PyUnresolvedReferences
+        if self.list_select_related is not False:
+            # noinspection PyUnresolvedReferences
+            return super().get_list_select_related(request)
+        return tuple(
+            field.name
+            for field in self._get_list_fields(request) or ()
+            if field.many_to_one
+        )
+
+    def get_list_only(self, request) -> tuple[str, ...]:
+        """Поля для only() в списке объектов. Пустой кортеж - загружать все поля."""
+        fields: list | None = self._get_list_fields(request)
+        # noinspection PyUnresolvedReferences
+        if fields is None or self.list_editable:
+            return ()
+
+        # noinspection PyUnresolvedReferences
+        names: list[str] = [self.model._meta.pk.name]
+        for field in fields:
+            if field.many_to_one:
+                related: tuple[str, ...] | None = self.list_only_related.get(field.name)
+                if related is None:
+                    names.append(field.name)
+                else:
+                    # noinspection PyProtectedMember
+                    names.extend(
+                        f'{field.name}__{name}'
+                        for name in (field.related_model._meta.pk.name, *related)
+                    )
+            elif field.concrete and not field.is_relation:
+                names.append(field.name)
+            else:
+                return ()
+        return tuple(names)
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return EstimatedCountPaginator(
+            queryset,
+            per_page,
+            orphans,
+            allow_empty_first_page,
+            threshold=self.estimated_count_threshold,
+        )
@@ -0,0 +1,31 @@
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+from ugc.common.db import get_estimated_count, get_planned_count
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: кол-во объектов оценивается по статистике PostgreSQL без COUNT(*).
+
+    Для запроса без фильтров берется оценка кол-ва строк таблицы, для запроса с фильтрами - оценка из плана
+    выполнения. Если оценка меньше порога, объекты считаются точно.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, threshold: int = 100000):
+        """
+        :param threshold: Мин. оценка кол-ва объектов, с которой точный подсчет не выполняется.
+        """
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.threshold = threshold
+        self.is_estimated: bool = False
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        estimate: int = (
+            get_planned_count(queryset) if queryset.query.has_filters() or queryset.query.distinct
+            else get_estimated_count(queryset.model, queryset.db)
+        )
+        self.is_estimated = estimate >= self.threshold
+        return estimate if self.is_estimated else queryset.count()
@@ -0,0 +1,64 @@
+"""
+Параллельное выполнение пакетов генерации данных в пуле процессов.
+
+Каждый пакет выполняется с собственным детерминированным зерном генераторов случайных чисел (random и Faker),
+зависящим только от общего зерна и номера пакета, поэтому сгенерированные данные не зависят от кол-ва
+процессов. Процессы создаются через fork и открывают собственные соединения с БД.
+"""
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Iterable, Iterator
+
+from django.db import connections
+from faker import Faker
+
+# Функция пакета, наследуется процессами пула при fork, поэтому ее не нужно сериализовать.
+_batch_fn: Callable[..., int] | None = None
+
+
+def get_batch_seed(seed: int, index: int) -> str:
+    """Зерно пакета по общему зерну и номеру пакета."""
+    return f'{seed}:{index}'
+
+
+def _run_batch(seed: int, index: int, params: dict[str, Any]) -> int:
+    batch_seed: str = get_batch_seed(seed, index)
+    random.seed(batch_seed)
+    Faker.seed(batch_seed)
+    return _batch_fn(**params)
+
+
+def run_batches(
+    fn: Callable[..., int],
+    batches: Iterable[dict[str, Any]],
+    seed: int,
+    workers: int = 1,
+) -> Iterator[int]:
+    """
+    Выполнить пакеты.
+    :param fn: Функция пакета, принимает параметры пакета и возвращает кол-во созданных объектов.
+    :param batches: Параметры пакетов.
+    :param seed: Общее зерно генераторов случайных чисел.
+    :param workers: Кол-во процессов. При 1 пакеты выполняются последовательно в текущем процессе.
+    :return: Итератор кол-ва созданных объектов по мере завершения пакетов.
+    """
+    global _batch_fn
+    _batch_fn = fn
+    try:
+        if workers <= 1:
+            for index, params in enumerate(batches):
+                yield _run_batch(seed, index, params)
+            return
+
+        # Соединения родителя не должны использоваться в дочерних процессах.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            futures = [
+                executor.submit(_run_batch, seed, index, params)
+                for index, params in enumerate(batches)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        _batch_fn = None
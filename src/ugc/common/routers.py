@@ -0,0 +1,71 @@
+"""
+Маршрутизация запросов к БД между основной БД и репликами только для чтения.
+
+Чтение через ORM (опросы, списки в админке, выгрузка, аналитика) идет на случайную реплику из
+settings.DATABASE_REPLICAS['ALIASES'], запись - в основную БД. Чтение идет в основную БД, если:
+
+- основная БД в транзакции: в ней могут быть еще не зафиксированные изменения;
+- чтение закреплено за основной БД (pin_primary). PrimaryPinningMiddleware закрепляет его на время изменяющего
+  запроса (POST и т.п.) и на DATABASE_REPLICAS['PIN_SECONDS'] секунд после него для того же клиента, чтобы
+  пользователь видел свои изменения, пока они доходят до реплик.
+
+Изменения других пользователей видны с задержкой репликации. В т.ч. опрос, собранный сразу после изменения,
+может попасть в кэш скомпилированных опросов в прежнем виде и обновиться по истечении времени жизни кэша.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+_pinned: ContextVar[bool] = ContextVar('primary_pinned', default=False)
+
+
+def get_settings() -> dict:
+    return getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+def get_replicas() -> list[str]:
+    return get_settings().get('ALIASES', [])
+
+
+def is_pinned() -> bool:
+    return _pinned.get()
+
+
+@contextmanager
+def pin_primary() -> Iterator[None]:
+    """Читать из основной БД внутри блока."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Роутер: чтение с реплик, запись и миграции - в основной БД."""
+
+    def db_for_read(self, model, **hints) -> str | None:
+        replicas: list[str] = get_replicas()
+        if not replicas or is_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # Связанные объекты читаются из той же БД, что и объект, через который к ним обращаются.
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in (DEFAULT_DB_ALIAS, *replicas):
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints) -> str | None:
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool | None:
+        databases: set[str] = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool | None:
+        return db == DEFAULT_DB_ALIAS
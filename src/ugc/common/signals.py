@@ -0,0 +1,15 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ugc.common.auth import invalidate_cached_user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    # Сбрасываем кэш после коммита, чтобы параллельный запрос не закэшировал старое состояние заново.
+    transaction.on_commit(partial(invalidate_cached_user, instance.pk), using=kwargs['using'])
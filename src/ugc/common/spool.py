@@ -0,0 +1,158 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+
+class Spool:
+    """
+    Надежный локальный буфер записей: append-only файл со строками JSON.
+
+    Писатели (в т.ч. из разных процессов) дописывают записи в активный файл под разделяемой блокировкой.
+    Читатель атомарно переименовывает активный файл в сегмент, берет эксклюзивную блокировку, дожидаясь
+    завершения начатых записей, после чего писатели переоткрывают новый активный файл. Обработанная часть
+    сегмента фиксируется в файле смещения, поэтому после сбоя повторно может быть обработан не более чем
+    последний пакет.
+    """
+
+    ACTIVE_SUFFIX = '.log'
+    SEGMENT_SUFFIX = '.ready'
+    OFFSET_SUFFIX = '.offset'
+
+    def __init__(self, directory: str | Path, name: str, fsync: bool = True):
+        """
+        :param directory: Папка буфера. Создается при необходимости.
+        :param name: Имя буфера, используется как префикс файлов.
+        :param fsync: Сбрасывать ли каждую запись на диск. Без этого записи могут потеряться при сбое ОС.
+        """
+        self.directory = Path(directory)
+        self.name = name
+        self.fsync = fsync
+        self._fd: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def active_path(self) -> Path:
+        return self.directory / f'{self.name}{self.ACTIVE_SUFFIX}'
+
+    def append(self, record: dict[str, Any]):
+        """Дописать запись в буфер."""
+        self.append_many([record])
+
+    def append_many(self, records: list[dict[str, Any]]):
+        """Дописать записи в буфер одной записью в файл, чтобы они попали в один сегмент."""
+        line: bytes = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode()
+        with self._lock:
+            while True:
+                fd: int = self._open()
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                try:
+                    # Файл могли забрать на обработку между открытием и блокировкой, тогда открываем новый.
+                    if self._is_current(fd):
+                        os.write(fd, line)
+                        if self.fsync:
+                            os.fsync(fd)
+                        return
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                self._close()
+
+    def rotate(self) -> Path | None:
+        """
+        Превратить активный файл в сегмент для обработки.
+        :return: Путь к сегменту или None, если писать нечего.
+        """
+        try:
+            if self.active_path.stat().st_size == 0:
+                return None
+        except FileNotFoundError:
+            return None
+
+        segment: Path = self.directory / f'{self.name}.{time.time_ns()}{self.SEGMENT_SUFFIX}'
+        os.rename(self.active_path, segment)
+        with open(segment, 'rb') as file:
+            # Дожидаемся писателей, успевших взять блокировку до переименования.
+            fcntl.flock(file, fcntl.LOCK_EX)
+            fcntl.flock(file, fcntl.LOCK_UN)
+        return segment
+
+    def segments(self) -> list[Path]:
+        """Сегменты, ожидающие обработки, от старых к новым."""
+        return sorted(
+            self.directory.glob(f'{self.name}.*{self.SEGMENT_SUFFIX}'),
+            key=lambda path: int(path.name[len(self.name) + 1:-len(self.SEGMENT_SUFFIX)]),
+        )
+
+    def read(self, segment: Path, batch_size: int) -> Iterator[tuple[list[dict[str, Any]], int]]:
+        """
+        Читать необработанные записи сегмента пакетами.
+        :param segment: Сегмент.
+        :param batch_size: Максимальный размер пакета.
+        :return: Итератор пар (записи, смещение конца пакета). Смещение передается в commit после обработки.
+        """
+        with open(segment, 'rb') as file:
+            file.seek(self._read_offset(segment))
+            batch: list[dict[str, Any]] = []
+            for line in file:
+                if not line.endswith(b'\n'):
+                    # Недописанная при сбое строка.
+                    break
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    yield batch, file.tell()
+                    batch = []
+            if batch:
+                yield batch, file.tell()
+
+    def commit(self, segment: Path, offset: int):
+        """Зафиксировать, что записи сегмента до смещения обработаны."""
+        offset_path: Path = self._get_offset_path(segment)
+        tmp_path: Path = offset_path.with_suffix('.tmp')
+        tmp_path.write_text(str(offset))
+        os.replace(tmp_path, offset_path)
+
+    def remove(self, segment: Path):
+        """Удалить полностью обработанный сегмент."""
+        segment.unlink()
+        self._get_offset_path(segment).unlink(missing_ok=True)
+
+    def pending_bytes(self) -> int:
+        """Объем необработанных данных в байтах."""
+        total: int = 0
+        for path in [*self.segments(), self.active_path]:
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                continue
+            if path != self.active_path:
+                total -= self._read_offset(path)
+        return total
+
+    def _open(self) -> int:
+        if self._fd is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.active_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _is_current(self, fd: int) -> bool:
+        try:
+            return os.fstat(fd).st_ino == self.active_path.stat().st_ino
+        except FileNotFoundError:
+            return False
+
+    def _get_offset_path(self, segment: Path) -> Path:
+        return segment.with_suffix(self.OFFSET_SUFFIX)
+
+    def _read_offset(self, segment: Path) -> int:
+        try:
+            return int(self._get_offset_path(segment).read_text())
+        except FileNotFoundError:
+            return 0
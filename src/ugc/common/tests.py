@@ -0,0 +1,175 @@
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from ugc.common import routers
+from ugc.common.auth import CachedModelBackend, invalidate_cached_user
+from ugc.common.middleware import PrimaryPinningMiddleware
+from ugc.common.spool import Spool
+
+
+class SpoolTestCase(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = Spool(directory=directory.name, name='test', fsync=False)
+
+    def test_read_and_commit(self):
+        self.assertIsNone(self.spool.rotate())
+
+        self.spool.append({'n': 1})
+        self.spool.append_many([{'n': 2}, {'n': 3}])
+        segment: Path = self.spool.rotate()
+        # Записи после ротации попадают в новый активный файл.
+        self.spool.append({'n': 4})
+        self.assertEqual(self.spool.segments(), [segment])
+
+        batches = list(self.spool.read(segment, batch_size=2))
+        self.assertEqual([records for records, _ in batches], [[{'n': 1}, {'n': 2}], [{'n': 3}]])
+
+        # Зафиксирован только первый пакет: повторное чтение начинается со второго.
+        self.spool.commit(segment, batches[0][1])
+        self.assertEqual([records for records, _ in self.spool.read(segment, batch_size=2)], [[{'n': 3}]])
+        self.assertEqual(self.spool.pending_bytes(), len(b'{"n":3}\n') + len(b'{"n":4}\n'))
+
+        self.spool.remove(segment)
+        self.assertEqual(self.spool.segments(), [])
+        self.assertEqual(self.spool.pending_bytes(), len(b'{"n":4}\n'))
+
+    def test_partial_line(self):
+        self.spool.append({'n': 1})
+        segment: Path = self.spool.rotate()
+        # Строка, недописанная при сбое, не читается.
+        with open(segment, 'ab') as file:
+            file.write(b'{"n":')
+
+        self.assertEqual([records for records, _ in self.spool.read(segment, batch_size=10)], [[{'n': 1}]])
+
+
+class CachedModelBackendTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='user', password='old')
+
+    def setUp(self):
+        invalidate_cached_user(self.user.id)
+        self.backend = CachedModelBackend()
+
+    def test_cached(self):
+        self.assertEqual(self.backend.get_user(self.user.id), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.id), self.user)
+
+    def test_password_change(self):
+        session_hash: str = self.backend.get_user(self.user.id).get_session_auth_hash()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new')
+            self.user.save()
+            # До коммита в кэше остается прежний пользователь.
+            self.assertTrue(self.backend.get_user(self.user.id).check_password('old'))
+
+        user = self.backend.get_user(self.user.id)
+        self.assertTrue(user.check_password('new'))
+        # Хэш сессии изменился: сессии со старым паролем становятся недействительными.
+        self.assertNotEqual(user.get_session_auth_hash(), session_hash)
+
+    def test_deactivation(self):
+        self.backend.get_user(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertIsNone(self.backend.get_user(self.user.id))
+
+    def test_deletion(self):
+        self.backend.get_user(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+
+        self.assertIsNone(self.backend.get_user(self.user.id))
+
+    async def test_async_update(self):
+        self.assertEqual(await self.backend.aget_user(self.user.id), self.user)
+        # Изменение в обход модели не сбрасывает кэш до истечения времени жизни записи.
+        await get_user_model().objects.filter(id=self.user.id).aupdate(is_active=False)
+        self.assertEqual(await self.backend.aget_user(self.user.id), self.user)
+
+        invalidate_cached_user(self.user.id)
+        self.assertIsNone(await self.backend.aget_user(self.user.id))
+
+
+@override_settings(DATABASE_REPLICAS={'ALIASES': ['replica'], 'PIN_SECONDS': 5, 'PIN_COOKIE_NAME': 'pin_primary'})
+class PrimaryReplicaRouterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        self.model = get_user_model()
+
+    def _get_response(self, request) -> HttpResponse:
+        # Куда пошло бы чтение при обработке запроса.
+        return HttpResponse(self.router.db_for_read(self.model))
+
+    async def _aget_response(self, request) -> HttpResponse:
+        return self._get_response(request)
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(self.model), 'replica')
+        self.assertEqual(self.router.db_for_write(self.model), DEFAULT_DB_ALIAS)
+        with routers.pin_primary():
+            self.assertEqual(self.router.db_for_read(self.model), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(self.model), 'replica')
+
+        # В транзакции основной БД могут быть еще не зафиксированные изменения.
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(self.model), DEFAULT_DB_ALIAS)
+
+        with override_settings(DATABASE_REPLICAS={}):
+            self.assertEqual(self.router.db_for_read(self.model), DEFAULT_DB_ALIAS)
+
+    def test_middleware(self):
+        middleware = PrimaryPinningMiddleware(self._get_response)
+        factory = RequestFactory()
+
+        response = middleware(factory.get('/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn('pin_primary', response.cookies)
+
+        # Изменяющий запрос читает из основной БД и закрепляет за ней следующие запросы клиента.
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.content, DEFAULT_DB_ALIAS.encode())
+        cookie = response.cookies['pin_primary']
+        self.assertEqual(cookie['max-age'], 5)
+        self.assertGreater(int(cookie.value), time.time())
+
+        factory.cookies['pin_primary'] = cookie.value
+        self.assertEqual(middleware(factory.get('/')).content, DEFAULT_DB_ALIAS.encode())
+
+        # Срок закрепления истек.
+        factory.cookies['pin_primary'] = str(int(time.time()) - 1)
+        self.assertEqual(middleware(factory.get('/')).content, b'replica')
+        factory.cookies['pin_primary'] = 'invalid'
+        self.assertEqual(middleware(factory.get('/')).content, b'replica')
+
+    async def test_async_middleware(self):
+        middleware = PrimaryPinningMiddleware(self._aget_response)
+        factory = RequestFactory()
+
+        response = await middleware(factory.post('/'))
+        self.assertEqual(response.content, DEFAULT_DB_ALIAS.encode())
+        factory.cookies['pin_primary'] = response.cookies['pin_primary'].value
+        self.assertEqual((await middleware(factory.get('/'))).content, DEFAULT_DB_ALIAS.encode())
+        # Закрепление не остается в контексте после запроса.
+        self.assertFalse(routers.is_pinned())
+
+    def test_without_replicas(self):
+        with override_settings(DATABASE_REPLICAS={}), self.assertRaises(MiddlewareNotUsed):
+            PrimaryPinningMiddleware(self._get_response)
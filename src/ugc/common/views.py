@@ -0,0 +1,18 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import HttpResponse
+from django.views import View
+
+from ugc.common.instrumentation import histogram, render_prometheus
+
+
+class MetricsView(UserPassesTestMixin, View):
+    """Метрики запросов процесса в текстовом формате Prometheus (см. ugc.common.instrumentation).
+    Доступны только сотрудникам."""
+
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_prometheus(histogram), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'ugc.common.middleware.InstrumentationMiddleware',
+    'ugc.common.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,6 +88,72 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения задаются списком host:port через запятую в DB_REPLICAS, например
+# DB_REPLICAS=replica1:5432,replica2:5432. Для локальной проверки можно указать ту же БД: DB_REPLICAS=localhost:5442.
+for _number, _address in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    _host, _, _port = _address.strip().partition(':')
+    DATABASES[f'replica_{_number}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        # В тестах реплика смотрит в тестовую основную БД.
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['ugc.common.routers.PrimaryReplicaRouter']
+
+# Чтение с реплик (см. ugc.common.routers).
+DATABASE_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    # Сколько секунд после изменяющего запроса клиент читает из основной БД, чтобы видеть свои изменения.
+    'PIN_SECONDS': int(os.getenv('DB_REPLICAS_PIN_SECONDS', 5)),
+    'PIN_COOKIE_NAME': 'pin_primary',
+}
+
+
+# Кэш Django. По умолчанию в памяти процесса. Чтобы процессы и хосты делили кэш, задается общий бэкенд, например
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache и CACHE_LOCATION=redis://redis:6379 (нужен пакет
+# redis) или CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache и CACHE_LOCATION=django_cache (таблица
+# создается командой createcachetable). Файловый кэш не подходит: каждая запись в нем перебирает все файлы кэша.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('CACHE_LOCATION') or 'default',
+        'OPTIONS': {
+            # Кэш хранит сессии и пользователей всех активных пользователей, а при отложенной записи ответов - их
+            # прогресс по опросам, поэтому должен вмещать их все. При переполнении удаляется 1/CULL_FREQUENCY записей.
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    # Фрагменты шаблонов ({% cache %}). Ключи фрагментов включают хэш содержимого и не требуют сброса, поэтому
+    # достаточно кэша процесса.
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Сессии читаются из кэша, а из БД - только при промахе.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'default'
+
+
+# Authentication
+# https://docs.djangoproject.com/en/5.2/topics/auth/customizing/
+
+AUTHENTICATION_BACKENDS = [
+    'ugc.common.auth.CachedModelBackend',
+]
+
+# Кэш пользователей сессий (см. ugc.common.auth).
+AUTH_USER_CACHE = {
+    'CACHE_ALIAS': 'default',
+    # Время жизни записи, сек. Ограничивает устаревание при изменении пользователей в обход моделей.
+    'TTL': 60,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -158,4 +226,72 @@ LOGGING = {
 }
 
 LOGIN_URL = '/login/'
-LOGIN_REDIRECT_URL = '/'
\ No newline at end of file
+LOGIN_REDIRECT_URL = '/'
+
+# Кэш скомпилированных опросов (см. ugc.surveys.compiled).
+SURVEYS_COMPILED_CACHE = {
+    # Максимальное кол-во опросов в LRU-кэше процесса.
+    'MAX_SIZE': int(os.getenv('SURVEYS_COMPILED_CACHE_MAX_SIZE', 1000)),
+    # Время жизни записи в кэше процесса, сек. Ограничивает устаревание в других процессах после изменения опроса.
+    'TTL': 300,
+    # Алиас кэша Django для общего между процессами уровня. None - используется только кэш процесса.
+    'CACHE_ALIAS': os.getenv('SURVEYS_COMPILED_CACHE_ALIAS') or None,
+    # Время жизни записи в общем кэше, сек.
+    'SHARED_TTL': 3600,
+}
+
+
+# Прогрев кэша скомпилированных опросов самыми активными опросами (см. ugc.surveys.warmup). Общий кэш прогревается
+# командой warm_survey_cache, кэш процесса - при старте, если включен ON_STARTUP.
+SURVEYS_CACHE_WARMUP = {
+    'ON_STARTUP': os.getenv('SURVEYS_CACHE_WARMUP_ON_STARTUP') == '1',
+    # Активность опросов считается по результатам, начатым за это кол-во последних часов.
+    'HOURS': 24,
+    # Максимальное кол-во прогреваемых опросов. При старте дополнительно ограничено размером кэша процесса.
+    'LIMIT': 1000,
+    'BATCH_SIZE': 500,
+    'WORKERS': 4,
+    # Максимальный суммарный размер прогретых опросов, МБ. 0 - без ограничения.
+    'MEMORY_BUDGET_MB': 64,
+}
+
+
+# Отложенная запись ответов через локальный буфер (см. ugc.surveys.ingestion).
+# Буфер переносится в БД командой flush_answer_spool, запущенной на том же хосте.
+SURVEYS_ANSWER_BUFFER = {
+    'ENABLED': os.getenv('SURVEYS_ANSWER_BUFFER_ENABLED') == '1',
+    'PATH': os.getenv('SURVEYS_ANSWER_BUFFER_PATH', BASE_DIR.parent / 'var' / 'spool'),
+    # Сбрасывать ли каждую запись на диск.
+    'FSYNC': True,
+    # Кэш прогресса пользователей до переноса ответов в БД. Должен быть общим для процессов (не LocMemCache).
+    'PROGRESS_CACHE_ALIAS': 'default',
+    'PROGRESS_TTL': 24 * 60 * 60,
+    'FLUSH_BATCH_SIZE': 10000,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+
+# Секционирование результатов опросов по диапазонам id опроса (см. ugc.surveys.partitions). Секции создаются
+# заранее и отсоединяются командой manage_partitions, которую нужно запускать периодически.
+SURVEYS_PARTITIONS = {
+    # Кол-во опросов в секции.
+    'SIZE': 100000,
+    # Кол-во секций, создаваемых заранее после секции последнего опроса.
+    'AHEAD': 2,
+    # Отсоединять секции, в которых не было новых опросов и результатов дольше этого кол-ва дней.
+    # None - не отсоединять.
+    'DETACH_AFTER_DAYS': None,
+}
+
+
+# Инструментирование запросов: SQL, шаблоны, заголовок Server-Timing и метрики по представлениям
+# (см. ugc.common.instrumentation). Метрики за последнее окно доступны сотрудникам по /metrics/.
+REQUEST_INSTRUMENTATION = {
+    'ENABLED': os.getenv('REQUEST_INSTRUMENTATION_ENABLED') == '1',
+    'SERVER_TIMING': True,
+    # Верхние границы корзин гистограммы длительности запросов, сек.
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    # Длина скользящего окна, сек, и кол-во интервалов, на которые оно делится.
+    'WINDOW': 60,
+    'SLICES': 6,
+}
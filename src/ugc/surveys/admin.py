@@ -1,17 +1,52 @@
 from django.contrib import admin
 from django.contrib.admin.widgets import AdminTextInputWidget
+from django.core.handlers.asgi import ASGIRequest
+from django.forms.models import BaseInlineFormSet
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.utils.translation import gettext_lazy as _
 
+from ugc.common.mixins import LargeTableAdminMixin
 from ugc.common.utils import render_admin_change_link
 from ugc.surveys import models
+from ugc.surveys.chain import skip_chain_clean, validate_chain
+from ugc.surveys.export import CONTENT_TYPES, aiter_blocks, get_answers, iter_rows, stream_export
 from ugc.surveys.mixins import FormWidgetMixin
 
 
+class QuestionInlineFormSet(BaseInlineFormSet):
+    """Проверяет цепочку вопросов опроса целиком одним запросом (см. ugc.surveys.chain.validate_chain)."""
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+
+        changes: dict[int, int | None] = {}
+        deleted: set[int] = set()
+        new_next_ids: list[int | None] = []
+        for form in self.forms:
+            if not form.has_changed() and form.instance.pk is None:
+                continue
+            next_question: models.Question | None = form.cleaned_data.get('next')
+            next_id: int | None = next_question.pk if next_question else None
+            if form.instance.pk is None:
+                new_next_ids.append(next_id)
+            elif self.can_delete and self._should_delete_form(form):
+                deleted.add(form.instance.pk)
+            else:
+                changes[form.instance.pk] = next_id
+        validate_chain(self.instance.pk, self.instance.first_question_id, changes, deleted, new_next_ids)
+
+
 class QuestionInline(FormWidgetMixin, admin.TabularInline):
     model = models.Question
-    fields = ('get_id', 'get_question', 'text', 'next', 'created_at')
-    readonly_fields = ('get_id', 'get_question', 'created_at')
+    formset = QuestionInlineFormSet
+    fields = ('get_id', 'position', 'get_question', 'text', 'next', 'created_at')
+    readonly_fields = ('get_id', 'position', 'get_question', 'created_at')
     raw_id_fields = ('next',)
+    # Вопросы вне цепочки показываются в конце.
+    ordering = ('position', 'id')
     extra = 0
     max_num = 15
     min_num = 1
@@ -29,13 +64,20 @@ class QuestionInline(FormWidgetMixin, admin.TabularInline):
 
 
 @admin.register(models.Survey)
-class SurveyAdmin(admin.ModelAdmin):
-    fields = ('title', 'author', 'first_question', 'created_at')
-    list_display = ('title', 'author', 'created_at')
-    readonly_fields = ('created_at', 'author')
+class SurveyAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    fields = ('title', 'author', 'first_question', 'question_count', 'created_at')
+    list_display = ('title', 'author', 'question_count', 'created_at')
+    list_only_related = {'author': ('username',)}
+    keyset_pagination = True
+    readonly_fields = ('created_at', 'author', 'question_count')
     raw_id_fields = ('first_question',)
     inlines = (QuestionInline,)
 
+    def changeform_view(self, request, *args, **kwargs):
+        # Ссылки проверяются в QuestionInlineFormSet для всей цепочки сразу.
+        with skip_chain_clean():
+            return super().changeform_view(request, *args, **kwargs)
+
     def save_model(self, request, obj: models.Survey, form, change):
         if not change or obj.author_id is None:
             obj.author = request.user
@@ -55,11 +97,12 @@ class ChoiceInline(FormWidgetMixin, admin.TabularInline):
 
 
 @admin.register(models.Question)
-class QuestionAdmin(admin.ModelAdmin):
-    fields = ('survey', 'text', 'created_at')
-    list_display = ('survey', 'text', 'created_at')
+class QuestionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    fields = ('survey', 'text', 'position', 'created_at')
+    list_display = ('survey', 'position', 'text', 'created_at')
+    list_only_related = {'survey': ()}
     raw_id_fields = ('survey',)
-    readonly_fields = ('created_at',)
+    readonly_fields = ('position', 'created_at')
     inlines = (ChoiceInline,)
 
     def get_readonly_fields(self, request, obj=None):
@@ -69,8 +112,20 @@ class QuestionAdmin(admin.ModelAdmin):
         return fields
 
 
+class SurveyResultChoiceInlineFormSet(BaseInlineFormSet):
+    """Ответы результата с условием на опрос, чтобы они читались из одной секции таблицы ответов."""
+
+    def __init__(self, *args, instance=None, queryset=None, **kwargs):
+        if instance is not None and instance.pk is not None:
+            if queryset is None:
+                queryset = self.model._default_manager
+            queryset = queryset.filter(survey_id=instance.survey_id)
+        super().__init__(*args, instance=instance, queryset=queryset, **kwargs)
+
+
 class SurveyResultChoiceInline(admin.TabularInline):
     model = models.SurveyResultChoice
+    formset = SurveyResultChoiceInlineFormSet
     fields = ('get_choice_text', 'created_at')
     readonly_fields = ('get_choice_text', 'created_at',)
 
@@ -85,12 +140,65 @@ class SurveyResultChoiceInline(admin.TabularInline):
 
 
 @admin.register(models.SurveyResult)
-class SurveyResultAdmin(admin.ModelAdmin):
+class SurveyResultAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     fields = ('survey', 'user', 'created_at')
     raw_id_fields = ('survey', 'user')
     list_display = ('survey', 'user', 'created_at')
+    list_only_related = {'survey': (), 'user': ('username',)}
+    # Для постраничного просмотра по ключу, см. индекс surveys_surveyresult_created.
+    ordering = ('-created_at', '-id')
+    keyset_pagination = True
     readonly_fields = ('created_at',)
     inlines = (SurveyResultChoiceInline,)
+    actions = ('export_csv', 'export_ndjson')
+
+    # noinspection PyMethodMayBeStatic
+    def _export(self, request, queryset, fmt: str):
+        # Если клиент принимает gzip, сжимаем на лету, браузер распакует файл сам.
+        compress: bool = 'gzip' in request.headers.get('Accept-Encoding', '')
+        rows = iter_rows(get_answers(results=queryset))
+        blocks = stream_export(rows, fmt=fmt, compress=compress)
+        response = StreamingHttpResponse(
+            # Под ASGI синхронный итератор был бы прочитан в память целиком до отправки.
+            aiter_blocks(blocks) if isinstance(request, ASGIRequest) else blocks,
+            content_type=CONTENT_TYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename="survey_results.{fmt}"'},
+        )
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    @admin.action(description=_('Выгрузить ответы в CSV'), permissions=('view',))
+    def export_csv(self, request, queryset):
+        return self._export(request, queryset, 'csv')
+
+    @admin.action(description=_('Выгрузить ответы в NDJSON'), permissions=('view',))
+    def export_ndjson(self, request, queryset):
+        return self._export(request, queryset, 'ndjson')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.ChoiceCounter)
+class ChoiceCounterAdmin(admin.ModelAdmin):
+    list_display = ('survey_id', 'question_id', 'choice_id', 'get_choice_text', 'count')
+    list_select_related = ('choice',)
+    search_fields = ('=survey__id',)
+    search_help_text = _('Поиск по id опроса')
+    ordering = ('survey', 'question', 'choice')
+    show_full_result_count = False
+
+    @admin.display(description=_('вариант ответа'))
+    def get_choice_text(self, obj):
+        return obj.choice.text
 
     def has_add_permission(self, request, obj=None):
         return False
@@ -0,0 +1,155 @@
+"""
+Аналитика ответов опроса: маргинальные распределения, таблицы сопряженности и матрица совместной встречаемости
+вариантов ответа.
+
+Пары (результат, вариант ответа) читаются потоком пакетами и накапливаются в массивы NumPy. Для каждого пакета
+строится матрица индикаторов X (респонденты x варианты ответа), совместная встречаемость накапливается как X.T @ X.
+Таблица сопряженности двух вопросов - блок этой матрицы, маргинальные распределения - ее диагональ.
+"""
+from dataclasses import dataclass
+from itertools import chain, islice
+
+import numpy as np
+from django.db import transaction
+
+from ugc.surveys.models import Choice, SurveyResultChoice
+
+
+@dataclass
+class SurveyAnalytics:
+    survey_id: int
+    # Кол-во респондентов, давших хотя бы один ответ.
+    respondents: int
+    # Варианты ответа опроса в порядке вопросов и порядка вариантов, и их вопросы.
+    choice_ids: np.ndarray
+    question_ids: np.ndarray
+    # Кол-во респондентов, выбравших оба варианта ответа, C x C.
+    cooccurrence: np.ndarray
+
+    @property
+    def marginals(self) -> np.ndarray:
+        """Кол-во респондентов, выбравших вариант ответа."""
+        return np.diagonal(self.cooccurrence)
+
+    def crosstab(self, question_a: int, question_b: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Таблица сопряженности двух вопросов.
+        :return: Варианты ответа первого вопроса, второго вопроса и кол-во респондентов по парам вариантов.
+        """
+        mask_a: np.ndarray = self.question_ids == question_a
+        mask_b: np.ndarray = self.question_ids == question_b
+        return self.choice_ids[mask_a], self.choice_ids[mask_b], self.cooccurrence[np.ix_(mask_a, mask_b)]
+
+    def as_dict(self, question_a: int | None = None, question_b: int | None = None) -> dict:
+        """
+        Представление для JSON.
+        :param question_a: Первый вопрос таблицы сопряженности. Если вопросы не заданы, вместо таблицы
+            возвращается полная матрица совместной встречаемости.
+        :param question_b: Второй вопрос таблицы сопряженности.
+        """
+        data: dict = {
+            'id': self.survey_id,
+            'respondents': self.respondents,
+            'choices': [
+                {'id': choice_id, 'question': question_id, 'count': count}
+                for choice_id, question_id, count in zip(
+                    self.choice_ids.tolist(), self.question_ids.tolist(), self.marginals.tolist()
+                )
+            ],
+        }
+        if question_a is not None and question_b is not None:
+            rows, columns, counts = self.crosstab(question_a, question_b)
+            data['crosstab'] = {
+                'rows': rows.tolist(),
+                'columns': columns.tolist(),
+                'counts': counts.tolist(),
+            }
+        else:
+            data['cooccurrence'] = self.cooccurrence.tolist()
+        return data
+
+
+def _accumulate(
+    pairs: np.ndarray,
+    choice_sorter: np.ndarray,
+    sorted_choice_ids: np.ndarray,
+    cooccurrence: np.ndarray,
+) -> int:
+    """Добавить пакет пар (результат, вариант ответа) к матрице совместной встречаемости."""
+    # Ответы с вариантами не из прочитанного списка (например, добавленными после его чтения) пропускаются.
+    if not len(sorted_choice_ids):
+        return 0
+    positions: np.ndarray = np.minimum(np.searchsorted(sorted_choice_ids, pairs[:, 1]), len(sorted_choice_ids) - 1)
+    known: np.ndarray = sorted_choice_ids[positions] == pairs[:, 1]
+    if not known.all():
+        pairs, positions = pairs[known], positions[known]
+        if not len(pairs):
+            return 0
+
+    rows: np.ndarray
+    _, rows = np.unique(pairs[:, 0], return_inverse=True)
+    columns: np.ndarray = choice_sorter[positions]
+
+    indicators: np.ndarray = np.zeros((rows.max() + 1, cooccurrence.shape[0]), dtype=np.float32)
+    indicators[rows, columns] = 1
+    # Значения в пакете не превышают кол-ва его строк, поэтому точности float32 достаточно.
+    cooccurrence += (indicators.T @ indicators).astype(np.int64)
+    return indicators.shape[0]
+
+
+def analyze_survey(survey_id: int, chunk_size: int = 100000) -> SurveyAnalytics:
+    """
+    Посчитать аналитику по ответам опроса.
+    :param survey_id: Опрос.
+    :param chunk_size: Кол-во ответов, читаемых и обрабатываемых за раз. Определяет потребление памяти.
+    """
+    answers = (
+        SurveyResultChoice.objects
+        .filter(survey_id=survey_id)
+        .order_by('result_id')
+        .values_list('result_id', 'choice_id')
+    )
+    # Как в export.iter_rows: в транзакции курсор читает строки по мере выгрузки, а не материализует весь результат.
+    # БД выбирается до транзакции, чтобы чтение осталось на реплике. Варианты ответа читаются из той же БД.
+    db: str = answers.db
+    with transaction.atomic(using=db):
+        choices: np.ndarray = np.array(
+            Choice.objects
+            .using(db)
+            .filter(question__survey_id=survey_id)
+            .order_by('question_id', 'order', 'created_at')
+            .values_list('id', 'question_id'),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        choice_ids: np.ndarray = choices[:, 0]
+        choice_sorter: np.ndarray = np.argsort(choice_ids)
+        sorted_choice_ids: np.ndarray = choice_ids[choice_sorter]
+        cooccurrence: np.ndarray = np.zeros((len(choice_ids), len(choice_ids)), dtype=np.int64)
+
+        rows = answers.using(db).iterator(chunk_size=chunk_size)
+        respondents: int = 0
+        rest: np.ndarray = np.empty((0, 2), dtype=np.int64)
+        while True:
+            chunk: np.ndarray = np.fromiter(
+                chain.from_iterable(islice(rows, chunk_size)),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            pairs: np.ndarray = np.concatenate((rest, chunk))
+            if not len(chunk):
+                if len(pairs):
+                    respondents += _accumulate(pairs, choice_sorter, sorted_choice_ids, cooccurrence)
+                break
+
+            # Ответы последнего результата могут продолжиться в следующем пакете, переносим их.
+            split: int = int(np.searchsorted(pairs[:, 0], pairs[-1, 0]))
+            rest = pairs[split:]
+            if split:
+                respondents += _accumulate(pairs[:split], choice_sorter, sorted_choice_ids, cooccurrence)
+
+    return SurveyAnalytics(
+        survey_id=survey_id,
+        respondents=respondents,
+        choice_ids=choice_ids,
+        question_ids=choices[:, 1],
+        cooccurrence=cooccurrence,
+    )
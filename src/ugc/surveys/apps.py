@@ -6,3 +6,7 @@ class SurveysConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ugc.surveys'
     verbose_name = _('Опросы')
+
+    def ready(self):
+        # noinspection PyUnresolvedReferences
+        from ugc.surveys import signals  # noqa: F401
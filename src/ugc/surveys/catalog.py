@@ -0,0 +1,195 @@
+"""
+Компактный каталог опросов для генерации тестовых результатов.
+
+Структура опросов хранится в виде CSR (compressed sparse row) в массивах NumPy: вопросы опроса i в порядке цепочки -
+question_ids[question_offsets[i]:question_offsets[i + 1]], варианты ответа вопроса j -
+choice_ids[choice_offsets[j]:choice_offsets[j + 1]]. Каталог на сотни тысяч опросов занимает десятки мегабайт
+вместо гигабайт для объектов ORM.
+"""
+from dataclasses import dataclass
+from itertools import chain
+
+import numpy as np
+from django.db.models import F, QuerySet
+
+from ugc.surveys.models import Survey, Question, Choice
+
+
+def _load_pairs(qs: QuerySet, chunk_size: int) -> np.ndarray:
+    """Прочитать пары значений values_list потоком в массив N x 2."""
+    return np.fromiter(
+        chain.from_iterable(qs.iterator(chunk_size=chunk_size)),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+
+@dataclass
+class SurveyCatalog:
+    survey_ids: np.ndarray
+    question_offsets: np.ndarray
+    question_ids: np.ndarray
+    choice_offsets: np.ndarray
+    choice_ids: np.ndarray
+
+    @classmethod
+    def load(cls, surveys_amount: int | None = None, chunk_size: int = 100000) -> 'SurveyCatalog':
+        """
+        Загрузить каталог первых по id опросов.
+        :param surveys_amount: Кол-во опросов. None - все опросы.
+        :param chunk_size: Кол-во строк, читаемых из БД за раз.
+        """
+        survey_ids: np.ndarray = np.fromiter(
+            Survey.objects.order_by('id').values_list('id', flat=True)[:surveys_amount].iterator(chunk_size),
+            dtype=np.int64,
+        )
+        if not len(survey_ids):
+            empty: np.ndarray = np.zeros(0, dtype=np.int64)
+            return cls(survey_ids, np.zeros(1, dtype=np.int64), empty, np.zeros(1, dtype=np.int64), empty)
+        last_survey_id: int = int(survey_ids[-1])
+
+        # Порядок цепочки (Question.position), вопросы вне цепочки - в конце опроса.
+        questions: np.ndarray = _load_pairs(
+            Question.objects
+            .filter(survey_id__lte=last_survey_id)
+            .order_by('survey_id', F('position').asc(nulls_last=True), 'id')
+            .values_list('survey_id', 'id'),
+            chunk_size,
+        )
+        question_offsets: np.ndarray = np.searchsorted(questions[:, 0], np.append(survey_ids, last_survey_id + 1))
+        question_ids: np.ndarray = questions[:, 1]
+
+        choices: np.ndarray = _load_pairs(
+            Choice.objects
+            .filter(question__survey_id__lte=last_survey_id)
+            .order_by('question_id', 'id')
+            .values_list('question_id', 'id'),
+            chunk_size,
+        )
+        # Варианты ответа переставляются в порядок вопросов question_ids.
+        sorter: np.ndarray = np.argsort(question_ids)
+        positions: np.ndarray = sorter[np.searchsorted(question_ids, choices[:, 0], sorter=sorter)]
+        order: np.ndarray = np.argsort(positions, kind='stable')
+        choices, positions = choices[order], positions[order]
+        choice_offsets: np.ndarray = np.zeros(len(question_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(positions, minlength=len(question_ids)), out=choice_offsets[1:])
+
+        return cls(
+            survey_ids=survey_ids,
+            question_offsets=question_offsets.astype(np.int64),
+            question_ids=question_ids,
+            choice_offsets=choice_offsets,
+            choice_ids=choices[:, 1],
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (
+            self.survey_ids, self.question_offsets, self.question_ids, self.choice_offsets, self.choice_ids,
+        ))
+
+    def sample_surveys(
+        self,
+        rng: np.random.Generator,
+        users: int,
+        amount_per_user: int,
+        chunk_elements: int = 1 << 22,
+    ) -> np.ndarray:
+        """
+        Выбрать опросы для пользователей, каждый опрос не более одного раза на пользователя.
+        :param chunk_elements: Ограничение размера матрицы случайных ключей при выборке большой доли каталога.
+        :return: Индексы опросов в каталоге по возрастанию, users x min(amount_per_user, кол-во опросов).
+        """
+        surveys: int = len(self.survey_ids)
+        if surveys <= amount_per_user:
+            return np.tile(np.arange(surveys), (users, 1))
+
+        if amount_per_user ** 2 <= surveys:
+            # Малая доля каталога: повторы редки (парадокс дней рождения), строки с повторами выбираются заново.
+            picks: np.ndarray = rng.integers(surveys, size=(users, amount_per_user))
+            while True:
+                picks.sort(axis=1)
+                duplicates: np.ndarray = (picks[:, 1:] == picks[:, :-1]).any(axis=1)
+                if not duplicates.any():
+                    return picks
+                picks[duplicates] = rng.integers(surveys, size=(int(duplicates.sum()), amount_per_user))
+
+        # Большая доля каталога: выборка без возвращения - опросы с наименьшими случайными ключами.
+        # Ключи генерируются частями по строкам, чтобы матрица users x surveys не занимала всю память.
+        picks = np.empty((users, amount_per_user), dtype=np.int64)
+        rows: int = max(chunk_elements // surveys, 1)
+        for start in range(0, users, rows):
+            keys: np.ndarray = rng.random((min(rows, users - start), surveys))
+            chunk: np.ndarray = np.argpartition(keys, amount_per_user - 1, axis=1)[:, :amount_per_user]
+            chunk.sort(axis=1)
+            picks[start:start + len(chunk)] = chunk
+        return picks
+
+    def sample_progress(self, rng: np.random.Generator, surveys: np.ndarray, completion_rate: float) -> np.ndarray:
+        """
+        Выбрать, на сколько вопросов ответил пользователь в каждом результате.
+        :param surveys: Индексы опросов в каталоге, по одному на результат.
+        :param completion_rate: Доля завершенных опросов, остальные прерываются на случайном вопросе.
+        :return: Кол-во отвеченных вопросов для каждого результата.
+        """
+        counts: np.ndarray = self.question_offsets[surveys + 1] - self.question_offsets[surveys]
+        incomplete: np.ndarray = (rng.random(len(surveys)) >= completion_rate) & (counts > 0)
+        answered: np.ndarray = counts.copy()
+        answered[incomplete] = rng.integers(counts[incomplete])
+        return answered
+
+    def get_current_questions(self, surveys: np.ndarray, answered: np.ndarray) -> np.ndarray:
+        """
+        Текущие вопросы результатов: следующие за последними отвеченными.
+        :return: id вопросов или 0 для завершенных опросов.
+        """
+        positions: np.ndarray = self.question_offsets[surveys] + answered
+        incomplete: np.ndarray = positions < self.question_offsets[surveys + 1]
+        current: np.ndarray = np.zeros(len(surveys), dtype=np.int64)
+        current[incomplete] = self.question_ids[positions[incomplete]]
+        return current
+
+    def sample_answers(
+        self,
+        rng: np.random.Generator,
+        surveys: np.ndarray,
+        answered: np.ndarray | None = None,
+        skew: float = 0,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Выбрать случайные варианты ответа на вопросы опросов.
+
+        Вопросы опроса отвечаются по порядку цепочки, см. load.
+        :param surveys: Индексы опросов в каталоге, по одному на результат.
+        :param answered: Кол-во отвеченных вопросов для каждого результата. По умолчанию все вопросы.
+        :param skew: Перекос популярности вариантов ответа: вероятность k-го варианта пропорциональна
+            1 / (k + 1) ** skew. 0 - равномерно.
+        :return: Пара массивов: индекс результата и id варианта ответа для каждого ответа.
+        """
+        starts: np.ndarray = self.question_offsets[surveys]
+        counts: np.ndarray = self.question_offsets[surveys + 1] - starts if answered is None else answered
+        results: np.ndarray = np.repeat(np.arange(len(surveys)), counts)
+        # Индексы вопросов: для каждого результата подряд идущие вопросы его опроса.
+        questions: np.ndarray = (
+            np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        )
+
+        choice_starts: np.ndarray = self.choice_offsets[questions]
+        choice_counts: np.ndarray = self.choice_offsets[questions + 1] - choice_starts
+        offsets: np.ndarray
+        if skew:
+            # Функции распределения номера варианта ответа для каждого кол-ва вариантов c (строка c).
+            max_choices: int = int(choice_counts.max(initial=0))
+            weights: np.ndarray = (
+                (np.arange(max_choices) < np.arange(max_choices + 1)[:, None])
+                / np.arange(1, max_choices + 1) ** skew
+            )
+            cdf: np.ndarray = np.cumsum(weights, axis=1)
+            cdf /= np.maximum(cdf[:, -1:], 1e-12)
+            offsets = (cdf[choice_counts] < rng.random(len(questions))[:, None]).sum(axis=1)
+            offsets = np.minimum(offsets, np.maximum(choice_counts - 1, 0))
+        else:
+            offsets = (rng.random(len(questions)) * choice_counts).astype(np.int64)
+        choices: np.ndarray = choice_starts + offsets
+        # Вопросы без вариантов ответа пропускаются.
+        answered_questions: np.ndarray = choice_counts > 0
+        return results[answered_questions], self.choice_ids[choices[answered_questions]]
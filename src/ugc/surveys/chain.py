@@ -0,0 +1,216 @@
+"""
+Порядок вопросов опроса.
+
+Порядок задается цепочкой Survey.first_question -> Question.next. Чтобы не обходить цепочку для сортировки
+и показа прогресса, номер вопроса в цепочке (Question.position) и длина цепочки (Survey.question_count)
+хранятся в БД и пересчитываются одним рекурсивным запросом после изменения опроса или его вопросов. Версия опроса
+(Survey.version) увеличивается в транзакции изменения опроса, его вопросов или вариантов ответа.
+
+Цепочка целиком проверяется validate_chain по одному запросу к БД, вместо проверок каждой ссылки в
+Survey.clean и Question.clean.
+"""
+from contextlib import contextmanager
+from typing import Iterator
+
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import F, Q
+from django.utils.translation import gettext_lazy as _
+
+from ugc.surveys.compiled import invalidate_compiled_survey
+from ugc.surveys.models import Survey, Question, chain_clean_skipped
+
+# Атрибут соединения с опросами, ожидающими пересчета после коммита текущей транзакции.
+_PENDING_ATTR = '_surveys_pending_positions'
+
+_UPDATE_POSITIONS_SQL = f'''
+WITH RECURSIVE chain AS (
+    SELECT question.survey_id, question.id, question.next_id, 1 AS position, ARRAY[question.id] AS path
+    FROM {Survey._meta.db_table} AS survey
+    JOIN {Question._meta.db_table} AS question
+        ON question.id = survey.first_question_id AND question.survey_id = survey.id
+    WHERE survey.id = ANY(%(survey_ids)s)
+    UNION ALL
+    SELECT question.survey_id, question.id, question.next_id, chain.position + 1, chain.path || question.id
+    FROM chain
+    JOIN {Question._meta.db_table} AS question
+        ON question.id = chain.next_id AND question.survey_id = chain.survey_id
+    -- Защита от зацикленной цепочки.
+    WHERE NOT question.id = ANY(chain.path)
+), positions AS (
+    UPDATE {Question._meta.db_table} AS question
+    SET position = chain.position
+    FROM {Question._meta.db_table} AS current
+    LEFT JOIN chain ON chain.id = current.id
+    WHERE current.survey_id = ANY(%(survey_ids)s)
+        AND question.id = current.id
+        AND question.position IS DISTINCT FROM chain.position
+)
+UPDATE {Survey._meta.db_table} AS survey
+SET question_count = counts.count
+FROM (
+    SELECT survey.id, COUNT(chain.id) AS count
+    FROM {Survey._meta.db_table} AS survey
+    LEFT JOIN chain ON chain.survey_id = survey.id
+    WHERE survey.id = ANY(%(survey_ids)s)
+    GROUP BY survey.id
+) AS counts
+WHERE survey.id = counts.id AND survey.question_count <> counts.count
+'''
+
+
+def update_positions(survey_ids: list[int], using: str = DEFAULT_DB_ALIAS):
+    """
+    Пересчитать номера вопросов в цепочке и кол-во вопросов опросов одним запросом. Вопросы вне цепочки
+    получают пустой номер.
+    :param survey_ids: Идентификаторы опросов.
+    :param using: Псевдоним БД.
+    """
+    if not survey_ids:
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(_UPDATE_POSITIONS_SQL, {'survey_ids': list(survey_ids)})
+
+
+def bump_versions(survey_ids: list[int], using: str = DEFAULT_DB_ALIAS):
+    """Увеличить версии опросов."""
+    if not survey_ids:
+        return
+    Survey.objects.using(using).filter(id__in=survey_ids).update(version=F('version') + 1)
+
+
+def schedule_survey_update(survey_id: int, using: str = DEFAULT_DB_ALIAS):
+    """
+    Увеличить версию опроса в текущей транзакции и пересчитать порядок вопросов после ее коммита. Опросы, измененные
+    в одной транзакции (например, все вопросы при сохранении опроса в админке), пересчитываются один раз.
+
+    Версия увеличивается в той же транзакции, что и изменение, поэтому становится видна вместе с ним. Survey.save
+    версию не сохраняет, чтобы опрос с ранее загруженной версией не перезаписал ее.
+    """
+    bump_versions([survey_id], using)
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        _update_and_invalidate({survey_id}, using)
+        return
+
+    pending: set[int] | None = getattr(connection, _PENDING_ATTR, None)
+    # Пересчет мог быть запланирован в транзакции или точке сохранения, которая уже откачена.
+    if pending is None or not any(getattr(fn, 'pending', None) is pending for _, fn, _ in connection.run_on_commit):
+        pending = set()
+        setattr(connection, _PENDING_ATTR, pending)
+
+        def flush():
+            if getattr(connection, _PENDING_ATTR, None) is pending:
+                setattr(connection, _PENDING_ATTR, None)
+            _update_and_invalidate(pending, using)
+
+        flush.pending = pending
+        transaction.on_commit(flush, using=using)
+    pending.add(survey_id)
+
+
+def _update_and_invalidate(survey_ids: set[int], using: str):
+    update_positions(sorted(survey_ids), using)
+    # Скомпилированные опросы могли быть собраны до пересчета.
+    for survey_id in survey_ids:
+        invalidate_compiled_survey(survey_id)
+
+
+@contextmanager
+def skip_chain_clean() -> Iterator[None]:
+    """Не проверять ссылки цепочки в Survey.clean и Question.clean, если цепочка проверяется validate_chain."""
+    token = chain_clean_skipped.set(True)
+    try:
+        yield
+    finally:
+        chain_clean_skipped.reset(token)
+
+
+def validate_chain(
+    survey_id: int | None,
+    first_question_id: int | None,
+    changes: dict[int, int | None] | None = None,
+    deleted: set[int] | None = None,
+    new_next_ids: list[int | None] | None = None,
+):
+    """
+    Проверить цепочку вопросов опроса с учетом несохраненных изменений. Вопросы опроса и вопросы, на которые
+    есть ссылки, загружаются одним запросом, дальше проверка выполняется в памяти.
+
+    Проверяется, что первый и следующие вопросы существуют, не удаляются и принадлежат опросу, что цепочка
+    не зациклена и что все вопросы опроса достижимы из первого. Пока первый вопрос не задан, достижимость не
+    проверяется, а новые вопросы в ней не участвуют: на них еще нельзя сослаться.
+    :param survey_id: Идентификатор опроса. None - новый опрос.
+    :param first_question_id: Первый вопрос опроса.
+    :param changes: Новые значения следующего вопроса по id существующих вопросов.
+    :param deleted: Идентификаторы удаляемых вопросов.
+    :param new_next_ids: Следующие вопросы новых вопросов.
+    :raises ValidationError: Список ошибок.
+    """
+    changes = changes or {}
+    deleted = deleted or set()
+    new_next_ids = new_next_ids or []
+
+    referenced: set[int] = {first_question_id, *changes.values(), *new_next_ids} - {None}
+    condition: Q = Q(id__in=referenced)
+    if survey_id is not None:
+        condition |= Q(survey_id=survey_id)
+    next_by_id: dict[int, int | None] = {}
+    survey_by_id: dict[int, int] = {}
+    for question_id, next_id, question_survey_id in Question.objects.filter(condition).values_list(
+        'id', 'next_id', 'survey_id',
+    ):
+        next_by_id[question_id] = next_id
+        survey_by_id[question_id] = question_survey_id
+    next_by_id.update(changes)
+    own: set[int] = {
+        question_id
+        for question_id, question_survey_id in survey_by_id.items()
+        if question_survey_id == survey_id and question_id not in deleted
+    }
+
+    errors: list[ValidationError] = []
+
+    def check_link(target_id: int | None, message):
+        if target_id is None:
+            return
+        if target_id in deleted:
+            errors.append(ValidationError(
+                _('%(message)s: вопрос %(id)d удаляется'), params={'message': message, 'id': target_id},
+            ))
+        elif target_id not in own:
+            errors.append(ValidationError(
+                _('%(message)s: вопрос %(id)d не принадлежит опросу'), params={'message': message, 'id': target_id},
+            ))
+
+    check_link(first_question_id, _('Первый вопрос'))
+    for question_id in sorted(own):
+        next_id: int | None = next_by_id[question_id]
+        if next_id == question_id:
+            errors.append(ValidationError(
+                _('Следующий вопрос для вопроса %(id)d не может быть текущим'), params={'id': question_id},
+            ))
+        else:
+            check_link(next_id, _('Следующий вопрос для вопроса %(id)d') % {'id': question_id})
+    for next_id in new_next_ids:
+        check_link(next_id, _('Следующий вопрос для нового вопроса'))
+    if errors:
+        raise ValidationError(errors)
+
+    if first_question_id is None:
+        return
+    visited: set[int] = set()
+    question_id: int | None = first_question_id
+    while question_id is not None:
+        if question_id in visited:
+            raise ValidationError(
+                _('Цепочка вопросов зациклена на вопросе %(id)d'), params={'id': question_id},
+            )
+        visited.add(question_id)
+        question_id = next_by_id.get(question_id)
+    unreachable: list[int] = sorted(own - visited)
+    if unreachable:
+        raise ValidationError(
+            _('Вопросы %(ids)s не входят в цепочку, начинающуюся с первого вопроса'),
+            params={'ids': ', '.join(map(str, unreachable))},
+        )
@@ -0,0 +1,330 @@
+"""
+Скомпилированное (только для чтения) представление опроса.
+
+Вопросы опроса хранятся в БД связным списком (Survey.first_question -> Question.next), поэтому для показа
+одной страницы опроса приходилось загружать весь опрос с вопросами и вариантами ответов. Здесь опрос один раз
+собирается в неизменяемую структуру: вопросы в порядке цепочки, варианты ответов уже отсортированы. Структура
+хранится в LRU-кэше процесса и, опционально, в кэше Django, и сбрасывается сигналами при изменении опроса,
+его вопросов или вариантов ответов (см. ugc.surveys.signals).
+"""
+import hashlib
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from ugc.common import routers
+from ugc.common.cache import LRUCache
+from ugc.surveys.models import Survey, Question, Choice
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledChoice:
+    id: int
+    text: str
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledQuestion:
+    id: int
+    text: str
+    next_id: int | None
+    # Номер в цепочке вопросов, начиная с 1. None - вопрос вне цепочки.
+    position: int | None
+    choices: tuple[CompiledChoice, ...]
+    # Хэш текста вопроса и вариантов ответа. Входит в ключ кэша разметки вопроса на странице опроса.
+    content_hash: str
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledSurvey:
+    id: int
+    title: str
+    first_question_id: int | None
+    question_count: int
+    version: int
+    # Вопросы в порядке цепочки, начиная с первого.
+    questions: tuple[CompiledQuestion, ...]
+    # Все вопросы опроса по id, в т.ч. не попавшие в цепочку.
+    questions_by_id: dict[int, CompiledQuestion]
+
+    @property
+    def first_question(self) -> CompiledQuestion | None:
+        return self.get_question(self.first_question_id)
+
+    def get_question(self, question_id: int | None) -> CompiledQuestion | None:
+        if question_id is None:
+            return None
+        return self.questions_by_id.get(question_id)
+
+    def to_dict(self) -> dict:
+        """Описание опроса для API."""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'first_question_id': self.first_question_id,
+            'question_count': self.question_count,
+            'version': self.version,
+            'questions': [
+                {
+                    'id': question.id,
+                    'text': question.text,
+                    'next_id': question.next_id,
+                    'position': question.position,
+                    'choices': [{'id': choice.id, 'text': choice.text} for choice in question.choices],
+                }
+                for question in self.questions
+            ],
+        }
+
+
+def _get_settings() -> dict:
+    return getattr(settings, 'SURVEYS_COMPILED_CACHE', {})
+
+
+def _create_local_cache() -> LRUCache:
+    options: dict = _get_settings()
+    return LRUCache(max_size=options.get('MAX_SIZE', 1000), ttl=options.get('TTL', 300))
+
+
+_local_cache: LRUCache = _create_local_cache()
+
+
+def _get_shared_cache():
+    alias: str | None = _get_settings().get('CACHE_ALIAS')
+    return caches[alias] if alias else None
+
+
+def _get_cache_key(survey_id: int) -> str:
+    # Версия в ключе меняется вместе со структурой скомпилированного опроса.
+    return f'surveys:compiled:v4:{survey_id}'
+
+
+def _get_querysets(survey_ids: list[int]):
+    surveys_qs = (
+        Survey.objects
+        .filter(id__in=survey_ids)
+        .values_list('id', 'title', 'first_question_id', 'question_count', 'version')
+    )
+    questions_qs = (
+        Question.objects
+        .filter(survey_id__in=survey_ids)
+        .order_by('id')
+        .values_list('survey_id', 'id', 'text', 'next_id', 'position')
+    )
+    choices_qs = (
+        Choice.objects
+        .filter(question__survey_id__in=survey_ids)
+        .order_by('order', 'created_at')
+        .values_list('question_id', 'id', 'text')
+    )
+    return surveys_qs, questions_qs, choices_qs
+
+
+def _get_content_hash(text: str, choices: tuple[CompiledChoice, ...]) -> str:
+    content: tuple = (text, *((choice.id, choice.text) for choice in choices))
+    return hashlib.md5(repr(content).encode(), usedforsecurity=False).hexdigest()
+
+
+def _build_surveys(
+    surveys: list[tuple[int, str, int | None, int, int]],
+    questions: list[tuple[int, int, str, int | None, int | None]],
+    choices: list[tuple[int, int, str]],
+) -> dict[int, CompiledSurvey]:
+    choices_by_question: dict[int, list[CompiledChoice]] = {}
+    for question_id, choice_id, text in choices:
+        choices_by_question.setdefault(question_id, []).append(CompiledChoice(id=choice_id, text=text))
+
+    questions_by_survey: dict[int, dict[int, CompiledQuestion]] = {survey[0]: {} for survey in surveys}
+    for survey_id, question_id, text, next_id, position in questions:
+        question_choices: tuple[CompiledChoice, ...] = tuple(choices_by_question.get(question_id, ()))
+        questions_by_survey[survey_id][question_id] = CompiledQuestion(
+            id=question_id,
+            text=text,
+            next_id=next_id,
+            position=position,
+            choices=question_choices,
+            content_hash=_get_content_hash(text, question_choices),
+        )
+
+    result: dict[int, CompiledSurvey] = {}
+    for survey_id, title, first_question_id, question_count, version in surveys:
+        questions_by_id: dict[int, CompiledQuestion] = questions_by_survey[survey_id]
+
+        chain: list[CompiledQuestion] = []
+        visited: set[int] = set()
+        question: CompiledQuestion | None = questions_by_id.get(first_question_id)
+        # Защита от зацикленной цепочки.
+        while question is not None and question.id not in visited:
+            visited.add(question.id)
+            chain.append(question)
+            question = questions_by_id.get(question.next_id)
+
+        result[survey_id] = CompiledSurvey(
+            id=survey_id,
+            title=title,
+            first_question_id=first_question_id,
+            question_count=question_count,
+            version=version,
+            questions=tuple(chain),
+            questions_by_id=questions_by_id,
+        )
+    return result
+
+
+def compile_surveys(survey_ids: list[int]) -> dict[int, CompiledSurvey]:
+    """
+    Собрать структуры опросов из БД. Выполняет три запроса независимо от кол-ва опросов.
+    :param survey_ids: Идентификаторы опросов.
+    :return: Скомпилированные опросы по id. Несуществующие опросы отсутствуют в результате.
+    """
+    surveys_qs, questions_qs, choices_qs = _get_querysets(survey_ids)
+    surveys: list[tuple[int, str, int | None, int, int]] = list(surveys_qs)
+    if not surveys:
+        return {}
+    return _build_surveys(surveys, list(questions_qs), list(choices_qs))
+
+
+async def acompile_surveys(survey_ids: list[int]) -> dict[int, CompiledSurvey]:
+    """Асинхронная версия compile_surveys."""
+    surveys_qs, questions_qs, choices_qs = _get_querysets(survey_ids)
+    surveys: list[tuple[int, str, int | None, int, int]] = [row async for row in surveys_qs]
+    if not surveys:
+        return {}
+    return _build_surveys(surveys, [row async for row in questions_qs], [row async for row in choices_qs])
+
+
+def _is_fresh(survey: CompiledSurvey | None, min_version: int | None) -> bool:
+    return survey is not None and (min_version is None or survey.version >= min_version)
+
+
+def get_compiled_survey(survey_id: int, min_version: int | None = None) -> CompiledSurvey | None:
+    """
+    Получить скомпилированный опрос: сначала из кэша процесса, затем из общего кэша, затем из БД.
+    :param survey_id: Идентификатор опроса.
+    :param min_version: Минимальная версия опроса. Более старые версии в кэше (например, в кэше процесса до
+        истечения времени жизни после изменения опроса в другом процессе) пропускаются.
+    :return: Скомпилированный опрос или None, если опрос не существует.
+    """
+    key: str = _get_cache_key(survey_id)
+    survey: CompiledSurvey | None = _local_cache.get(key)
+    if _is_fresh(survey, min_version):
+        return survey
+
+    shared_cache = _get_shared_cache()
+    survey = shared_cache.get(key) if shared_cache is not None else None
+
+    if not _is_fresh(survey, min_version):
+        survey = compile_surveys([survey_id]).get(survey_id)
+        if survey is None:
+            return None
+        if shared_cache is not None:
+            shared_cache.set(key, survey, timeout=_get_settings().get('SHARED_TTL', DEFAULT_TIMEOUT))
+
+    _local_cache.set(key, survey)
+    return survey
+
+
+async def aget_compiled_survey(survey_id: int, min_version: int | None = None) -> CompiledSurvey | None:
+    """Асинхронная версия get_compiled_survey."""
+    key: str = _get_cache_key(survey_id)
+    survey: CompiledSurvey | None = _local_cache.get(key)
+    if _is_fresh(survey, min_version):
+        return survey
+
+    shared_cache = _get_shared_cache()
+    survey = await shared_cache.aget(key) if shared_cache is not None else None
+
+    if not _is_fresh(survey, min_version):
+        survey = (await acompile_surveys([survey_id])).get(survey_id)
+        if survey is None:
+            return None
+        if shared_cache is not None:
+            await shared_cache.aset(key, survey, timeout=_get_settings().get('SHARED_TTL', DEFAULT_TIMEOUT))
+
+    _local_cache.set(key, survey)
+    return survey
+
+
+def get_compiled_question(
+    survey: CompiledSurvey,
+    question_id: int | None,
+) -> tuple[CompiledSurvey, CompiledQuestion | None]:
+    """
+    Получить вопрос скомпилированного опроса.
+
+    Опрос в кэше процесса может устареть: его сбрасывает только процесс, в котором опрос изменили. Если вопроса
+    нет в опросе, это не завершение опроса, а устаревший кэш (например, вопрос добавлен в другом процессе):
+    опрос собирается заново из основной БД и заменяет устаревший в кэше.
+    :param survey: Опрос.
+    :param question_id: Идентификатор вопроса.
+    :return: Пара (опрос, вопрос). Опрос - пересобранный, если он устарел. Вопрос None, если question_id None
+        или вопроса нет в опросе и в БД.
+    """
+    question: CompiledQuestion | None = survey.get_question(question_id)
+    if question is not None or question_id is None:
+        return survey, question
+
+    with routers.pin_primary():
+        fresh: CompiledSurvey | None = compile_surveys([survey.id]).get(survey.id)
+    if fresh is None:
+        return survey, None
+    store_compiled_surveys([fresh])
+    return fresh, fresh.get_question(question_id)
+
+
+async def aget_compiled_question(
+    survey: CompiledSurvey,
+    question_id: int | None,
+) -> tuple[CompiledSurvey, CompiledQuestion | None]:
+    """Асинхронная версия get_compiled_question."""
+    question: CompiledQuestion | None = survey.get_question(question_id)
+    if question is not None or question_id is None:
+        return survey, question
+
+    with routers.pin_primary():
+        fresh: CompiledSurvey | None = (await acompile_surveys([survey.id])).get(survey.id)
+    if fresh is None:
+        return survey, None
+    key: str = _get_cache_key(survey.id)
+    shared_cache = _get_shared_cache()
+    if shared_cache is not None:
+        await shared_cache.aset(key, fresh, timeout=_get_settings().get('SHARED_TTL', DEFAULT_TIMEOUT))
+    _local_cache.set(key, fresh)
+    return fresh, fresh.get_question(question_id)
+
+
+def store_compiled_surveys(surveys: list[CompiledSurvey], local: bool = True):
+    """
+    Положить скомпилированные опросы в общий кэш (одним запросом) и, опционально, в кэш процесса.
+    :param surveys: Опросы.
+    :param local: Класть ли опросы в кэш процесса.
+    """
+    shared_cache = _get_shared_cache()
+    if shared_cache is not None and surveys:
+        shared_cache.set_many(
+            {_get_cache_key(survey.id): survey for survey in surveys},
+            timeout=_get_settings().get('SHARED_TTL', DEFAULT_TIMEOUT),
+        )
+    if local:
+        for survey in surveys:
+            _local_cache.set(_get_cache_key(survey.id), survey)
+
+
+def get_local_cache_size() -> int:
+    """Максимальное кол-во опросов в кэше процесса."""
+    return _local_cache.max_size
+
+
+def has_shared_cache() -> bool:
+    return _get_shared_cache() is not None
+
+
+def invalidate_compiled_survey(survey_id: int):
+    """Сбросить скомпилированный опрос во всех уровнях кэша."""
+    key: str = _get_cache_key(survey_id)
+    _local_cache.delete(key)
+    shared_cache = _get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.delete(key)
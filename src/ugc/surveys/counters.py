@@ -0,0 +1,106 @@
+"""
+Счетчики ответов по вариантам ответа.
+
+Запись ответа добавляет строку в ChoiceCounterDelta в той же транзакции (вставка без обновления общих строк,
+поэтому популярные варианты не становятся точкой конкуренции). Команда compact_choice_counters периодически
+сворачивает приращения в ChoiceCounter, rebuild_choice_counters пересчитывает счетчики с нуля. Удаление
+результатов опросов счетчики не уменьшает, после него счетчики нужно пересчитать.
+"""
+from django.db import connection, transaction
+
+from ugc.surveys.models import Question, Choice, SurveyResultChoice, ChoiceCounter, ChoiceCounterDelta
+
+# noinspection PyProtectedMember
+COMPACT_SQL = f'''
+WITH moved AS (
+    DELETE FROM {ChoiceCounterDelta._meta.db_table}
+    WHERE id IN (
+        SELECT id FROM {ChoiceCounterDelta._meta.db_table}
+        ORDER BY id
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING choice_id, delta
+), totals AS (
+    SELECT choice_id, sum(delta) AS delta
+    FROM moved
+    GROUP BY choice_id
+), counters AS (
+    INSERT INTO {ChoiceCounter._meta.db_table} AS counter (choice_id, question_id, survey_id, count)
+    SELECT totals.choice_id, choice.question_id, question.survey_id, totals.delta
+    FROM totals
+    JOIN {Choice._meta.db_table} AS choice ON choice.id = totals.choice_id
+    JOIN {Question._meta.db_table} AS question ON question.id = choice.question_id
+    ON CONFLICT (choice_id) DO UPDATE
+    SET count = counter.count + EXCLUDED.count
+)
+SELECT count(*) FROM moved
+'''
+
+# noinspection PyProtectedMember
+REBUILD_SQL = f'''
+INSERT INTO {ChoiceCounter._meta.db_table} (choice_id, question_id, survey_id, count)
+SELECT result_choice.choice_id, choice.question_id, question.survey_id, count(*)
+FROM {SurveyResultChoice._meta.db_table} AS result_choice
+JOIN {Choice._meta.db_table} AS choice ON choice.id = result_choice.choice_id
+JOIN {Question._meta.db_table} AS question ON question.id = choice.question_id
+{{where}}
+GROUP BY result_choice.choice_id, choice.question_id, question.survey_id
+'''
+
+
+def compact_deltas(batch_size: int) -> int:
+    """
+    Свернуть пакет приращений в счетчики.
+    :param batch_size: Максимальное кол-во приращений за раз.
+    :return: Кол-во обработанных приращений.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(COMPACT_SQL, {'batch_size': batch_size})
+        return cursor.fetchone()[0]
+
+
+@transaction.atomic
+def rebuild_counters(survey_id: int | None = None) -> int:
+    """
+    Пересчитать счетчики по ответам.
+
+    На время пересчета блокируется запись новых приращений, т.е. и запись ответов.
+    :param survey_id: Опрос. Если не задан, пересчитываются все счетчики.
+    :return: Кол-во счетчиков.
+    """
+    deltas = ChoiceCounterDelta.objects.all()
+    counters = ChoiceCounter.objects.all()
+    where: str = ''
+    params: list[int] = []
+    if survey_id is not None:
+        deltas = deltas.filter(choice__question__survey_id=survey_id)
+        counters = counters.filter(survey_id=survey_id)
+        where = 'WHERE result_choice.survey_id = %s'
+        params = [survey_id]
+
+    with connection.cursor() as cursor:
+        # Ждем транзакции, уже добавившие приращения, и не даем добавлять новые до конца пересчета.
+        # noinspection PyProtectedMember
+        cursor.execute(f'LOCK TABLE {ChoiceCounterDelta._meta.db_table} IN EXCLUSIVE MODE')
+        deltas.delete()
+        counters.delete()
+        cursor.execute(REBUILD_SQL.format(where=where), params)
+        return cursor.rowcount
+
+
+def get_distribution(survey_id: int) -> dict[int, dict[int, int]]:
+    """
+    Распределение ответов по опросу без учета еще не свернутых приращений.
+    :return: Кол-во ответов по id вопроса и id варианта ответа. Варианты без ответов отсутствуют.
+    """
+    result: dict[int, dict[int, int]] = {}
+    qs = (
+        ChoiceCounter.objects
+        .filter(survey_id=survey_id)
+        .order_by('question_id', 'choice_id')
+        .values_list('question_id', 'choice_id', 'count')
+    )
+    for question_id, choice_id, count in qs:
+        result.setdefault(question_id, {})[choice_id] = count
+    return result
@@ -0,0 +1,164 @@
+"""
+Потоковая выгрузка ответов в CSV или NDJSON, по строке на ответ.
+
+Ответы читаются курсором на стороне сервера БД (QuerySet.iterator) пакетами, строки кодируются и при
+необходимости сжимаются gzip на лету, поэтому потребление памяти не зависит от объема выгрузки.
+
+Под ASGI StreamingHttpResponse с синхронным итератором сначала собирает его целиком в список, поэтому для
+ASGI-запросов блоки отдаются асинхронным итератором (aiter_blocks).
+"""
+import csv
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Generator, Iterable, Iterator
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Max, Min, QuerySet
+
+from ugc.surveys.models import SurveyResult, SurveyResultChoice
+
+FORMATS = ('csv', 'ndjson')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Поля строки выгрузки и соответствующие им поля запроса.
+COLUMNS = {
+    'result_id': 'result_id',
+    'user_id': 'result__user_id',
+    'username': 'result__user__username',
+    'survey_id': 'survey_id',
+    'question_id': 'choice__question_id',
+    'question': 'choice__question__text',
+    'choice_id': 'choice_id',
+    'choice': 'choice__text',
+    'result_created_at': 'result__created_at',
+    'answer_created_at': 'created_at',
+}
+
+# Размер блока данных, отдаваемого за раз, байт.
+BLOCK_SIZE = 64 * 1024
+
+
+class _LineBuffer:
+    """Файлоподобный объект для csv.writer, копящий строки до отдачи блоком."""
+
+    def __init__(self):
+        self.parts: list[str] = []
+        self.size: int = 0
+
+    def write(self, value: str):
+        self.parts.append(value)
+        self.size += len(value)
+
+    def pop(self) -> bytes:
+        data: bytes = ''.join(self.parts).encode()
+        self.parts = []
+        self.size = 0
+        return data
+
+
+def get_answers(survey_id: int | None = None, results: QuerySet[SurveyResult] | None = None) -> QuerySet:
+    """
+    Ответы для выгрузки.
+    :param survey_id: Только ответы опроса.
+    :param results: Только ответы этих результатов опросов.
+    """
+    qs = SurveyResultChoice.objects.all()
+    if survey_id is not None:
+        qs = qs.filter(survey_id=survey_id)
+    if results is not None:
+        # Таблицы ответов и результатов секционированы по диапазонам id опроса: условие на диапазон опросов
+        # результатов в обеих таблицах позволяет отбросить лишние секции при планировании запроса, условие на
+        # результаты - нет.
+        bounds: dict = results.aggregate(min_survey_id=Min('survey_id'), max_survey_id=Max('survey_id'))
+        if bounds['min_survey_id'] is None:
+            return qs.none().values_list(*COLUMNS.values())
+        survey_range: tuple[int, int] = (bounds['min_survey_id'], bounds['max_survey_id'])
+        qs = qs.filter(
+            survey__id__range=survey_range,
+            result__survey__id__range=survey_range,
+            result__in=results.values('id'),
+        )
+    return qs.order_by('result_id', 'id').values_list(*COLUMNS.values())
+
+
+def iter_rows(answers: QuerySet, chunk_size: int = 10000) -> Iterator[tuple]:
+    """Читать ответы курсором на стороне сервера БД по chunk_size строк."""
+    # Вне транзакции курсор объявляется WITH HOLD, и PostgreSQL целиком материализует результат запроса
+    # при фиксации первой выборки. В транзакции строки читаются по мере выгрузки.
+    # БД выбирается до транзакции, иначе в транзакции основной БД роутер направил бы чтение в нее, а не на реплику.
+    db: str = answers.db
+    with transaction.atomic(using=db):
+        yield from answers.using(db).iterator(chunk_size=chunk_size)
+
+
+def _format_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode_csv(rows: Iterable[tuple]) -> Iterator[bytes]:
+    buffer: _LineBuffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS.keys())
+    for row in rows:
+        writer.writerow(_format_value(value) for value in row)
+        if buffer.size >= BLOCK_SIZE:
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def _encode_ndjson(rows: Iterable[tuple]) -> Iterator[bytes]:
+    buffer: _LineBuffer = _LineBuffer()
+    names: tuple[str, ...] = tuple(COLUMNS.keys())
+    for row in rows:
+        buffer.write(json.dumps(dict(zip(names, row)), ensure_ascii=False, default=_format_value))
+        buffer.write('\n')
+        if buffer.size >= BLOCK_SIZE:
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def _compress(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for block in blocks:
+        data: bytes = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(rows: Iterable[tuple], fmt: str = 'csv', compress: bool = False) -> Generator[bytes]:
+    """
+    Закодировать строки ответов.
+    :param rows: Строки с полями COLUMNS, например из iter_rows.
+    :param fmt: Формат: csv или ndjson.
+    :param compress: Сжимать ли gzip.
+    :return: Итератор блоков данных.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+    blocks: Iterator[bytes] = _encode_csv(rows) if fmt == 'csv' else _encode_ndjson(rows)
+    if compress:
+        blocks = _compress(blocks)
+    return (block for block in blocks if block)
+
+
+async def aiter_blocks(blocks: Generator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Отдавать блоки синхронного итератора stream_export асинхронно, по одному.
+
+    Все шаги итератора, в т.ч. закрытие при обрыве соединения, выполняются в одном потоке (thread_sensitive),
+    поэтому курсор и транзакция iter_rows используют одно соединение с БД.
+    """
+    get_next = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (block := await get_next(blocks, None)) is not None:
+            yield block
+    finally:
+        await sync_to_async(blocks.close, thread_sensitive=True)()
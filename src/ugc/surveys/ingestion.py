@@ -0,0 +1,247 @@
+"""
+Отложенная запись ответов (write-behind).
+
+В этом режиме ответ проверяется по скомпилированному опросу, дописывается в локальный буфер (ugc.common.spool)
+и сразу возвращается следующий вопрос, а прогресс пользователя запоминается в кэше. В БД ответы переносятся
+пакетами командой flush_answer_spool.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cache
+
+from django.conf import settings
+from django.core.cache import caches, BaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from ugc.common.spool import Spool
+from ugc.surveys.compiled import CompiledSurvey, CompiledQuestion, get_compiled_question
+from ugc.surveys.models import Question, Choice, SurveyResult, SurveyResultChoice, ChoiceCounterDelta
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Перенос пакета ответов в БД одним запросом. Результаты опросов обновляются по последнему ответу
+# пользователя в пакете, ответы на удаленные к этому времени варианты отбрасываются. Приращения счетчиков
+# ответов добавляются уже сгруппированными по варианту ответа.
+# После сбоя между фиксацией транзакции и смещения буфера пакет переносится повторно. Вариант ответа выбирается
+# в результате не более одного раза (цепочка вопросов без циклов), поэтому уже записанные ответы пропускаются,
+# и повтор не дублирует ни ответы, ни приращения счетчиков.
+# noinspection PyProtectedMember
+FLUSH_ANSWERS_SQL = f'''
+WITH batch AS (
+    SELECT item.seq, item.user_id, item.survey_id, item.choice_id, question.id AS next_question_id, item.created_at
+    FROM unnest(%(user_ids)s::bigint[], %(survey_ids)s::bigint[], %(choice_ids)s::bigint[],
+                %(next_question_ids)s::bigint[], %(created_at)s::timestamptz[])
+         WITH ORDINALITY AS item(user_id, survey_id, choice_id, next_question_id, created_at, seq)
+    JOIN {Choice._meta.db_table} AS choice ON choice.id = item.choice_id
+    LEFT JOIN {Question._meta.db_table} AS question ON question.id = item.next_question_id
+), latest AS (
+    SELECT DISTINCT ON (user_id, survey_id)
+        user_id, survey_id, next_question_id, min(created_at) OVER (PARTITION BY user_id, survey_id) AS created_at
+    FROM batch
+    ORDER BY user_id, survey_id, seq DESC
+), result AS (
+    INSERT INTO {SurveyResult._meta.db_table} AS result (user_id, survey_id, current_question_id, created_at)
+    SELECT user_id, survey_id, next_question_id, created_at
+    FROM latest
+    ON CONFLICT (user_id, survey_id) DO UPDATE
+    SET current_question_id = EXCLUDED.current_question_id
+    RETURNING result.id, result.user_id, result.survey_id
+), answer AS (
+    INSERT INTO {SurveyResultChoice._meta.db_table} (result_id, survey_id, choice_id, created_at)
+    SELECT result.id, result.survey_id, batch.choice_id, batch.created_at
+    FROM batch
+    JOIN result ON result.user_id = batch.user_id AND result.survey_id = batch.survey_id
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM {SurveyResultChoice._meta.db_table} AS existing
+        WHERE existing.survey_id = result.survey_id
+            AND existing.result_id = result.id
+            AND existing.choice_id = batch.choice_id
+    )
+    RETURNING choice_id
+), counter AS (
+    INSERT INTO {ChoiceCounterDelta._meta.db_table} (choice_id, delta)
+    SELECT choice_id, count(*)
+    FROM answer
+    GROUP BY choice_id
+)
+SELECT count(*) FROM answer
+'''
+
+
+@dataclass
+class FlushStats:
+    rows: int = 0
+    seconds: float = 0
+    # Максимальное время между ответом пользователя и его записью в БД, сек.
+    max_lag: float = 0
+
+    @property
+    def throughput(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0
+
+
+def _get_settings() -> dict:
+    return getattr(settings, 'SURVEYS_ANSWER_BUFFER', {})
+
+
+def is_enabled() -> bool:
+    return bool(_get_settings().get('ENABLED'))
+
+
+@cache
+def get_spool() -> Spool:
+    options: dict = _get_settings()
+    return Spool(directory=options['PATH'], name='answers', fsync=options.get('FSYNC', True))
+
+
+def _get_progress_cache() -> BaseCache:
+    alias: str = _get_settings().get('PROGRESS_CACHE_ALIAS', 'default')
+    progress_cache: BaseCache = caches[alias]
+    # Прогресс из кэша процесса не виден другим процессам: пользователь, попавший в другой процесс до переноса
+    # ответов в БД, получил бы уже отвеченный вопрос.
+    if isinstance(progress_cache, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            f"Кэш прогресса отложенной записи ответов ('{alias}') должен быть общим для процессов, "
+            f"{type(progress_cache).__name__} не подходит. Задайте общий бэкенд кэша, например CACHE_BACKEND"
+        )
+    return progress_cache
+
+
+def _get_progress_key(user_id: int, survey_id: int) -> str:
+    return f'surveys:progress:{user_id}:{survey_id}'
+
+
+def get_buffered_progress(user_id: int, survey_id: int) -> tuple[bool, int | None]:
+    """
+    Получить текущий вопрос пользователя с учетом еще не перенесенных в БД ответов.
+    :return: Пара (найден ли прогресс в кэше, id текущего вопроса или None, если опрос завершен).
+    """
+    question_id = _get_progress_cache().get(_get_progress_key(user_id, survey_id), _MISSING)
+    if question_id is _MISSING:
+        return False, None
+    return True, question_id
+
+
+def buffer_answer(
+    user_id: int,
+    survey: CompiledSurvey,
+    question: CompiledQuestion | None,
+    choice_id: int,
+) -> int | None:
+    """
+    Проверить ответ на текущий вопрос и записать его в буфер.
+    :param user_id: Идентификатор пользователя.
+    :param survey: Опрос.
+    :param question: Текущий вопрос пользователя.
+    :param choice_id: Идентификатор выбранного варианта ответа.
+    :return: Идентификатор следующего вопроса или None, если опрос завершен.
+    :raises ValidationError: Вариант ответа не относится к текущему вопросу.
+    """
+    if question is None or all(choice.id != choice_id for choice in question.choices):
+        raise ValidationError(_('Вариант ответа не относится к текущему вопросу опроса'))
+
+    get_spool().append({
+        'u': user_id,
+        's': survey.id,
+        'c': choice_id,
+        'n': question.next_id,
+        't': timezone.now().isoformat(),
+    })
+    _get_progress_cache().set(
+        _get_progress_key(user_id, survey.id),
+        question.next_id,
+        timeout=_get_settings().get('PROGRESS_TTL', 24 * 60 * 60),
+    )
+    return question.next_id
+
+
+def buffer_answers(
+    user_id: int,
+    survey: CompiledSurvey,
+    question: CompiledQuestion | None,
+    answers: list[tuple[int, int]],
+) -> int | None:
+    """
+    Проверить пакет ответов, начиная с текущего вопроса, и записать его в буфер. Версия
+    ugc.surveys.services.record_answers для отложенной записи.
+    :param user_id: Идентификатор пользователя.
+    :param survey: Опрос.
+    :param question: Текущий вопрос пользователя.
+    :param answers: Пары (id вопроса, id варианта ответа) в порядке прохождения.
+    :return: Идентификатор следующего вопроса или None, если опрос завершен.
+    :raises ValidationError: Пакет не соответствует цепочке вопросов.
+    """
+    created_at: str = timezone.now().isoformat()
+    records: list[dict] = []
+    for idx, (question_id, choice_id) in enumerate(answers):
+        if question is None:
+            raise ValidationError(_('Опрос уже пройден, ответ %(idx)d лишний') % {'idx': idx + 1})
+        if question_id != question.id:
+            raise ValidationError(
+                _('Ответ %(idx)d должен быть на вопрос с id = %(question_id)d') % {
+                    'idx': idx + 1,
+                    'question_id': question.id,
+                }
+            )
+        if all(choice.id != choice_id for choice in question.choices):
+            raise ValidationError(
+                _('Вариант ответа %(idx)d не относится к вопросу с id = %(question_id)d') % {
+                    'idx': idx + 1,
+                    'question_id': question_id,
+                }
+            )
+        records.append({'u': user_id, 's': survey.id, 'c': choice_id, 'n': question.next_id, 't': created_at})
+        survey, question = get_compiled_question(survey, question.next_id)
+
+    next_question_id: int | None = records[-1]['n']
+    get_spool().append_many(records)
+    _get_progress_cache().set(
+        _get_progress_key(user_id, survey.id),
+        next_question_id,
+        timeout=_get_settings().get('PROGRESS_TTL', 24 * 60 * 60),
+    )
+    return next_question_id
+
+
+def flush_answers(records: list[dict]) -> int:
+    """
+    Перенести пакет ответов из буфера в БД.
+    :return: Кол-во записанных ответов.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(FLUSH_ANSWERS_SQL, {
+            'user_ids': [record['u'] for record in records],
+            'survey_ids': [record['s'] for record in records],
+            'choice_ids': [record['c'] for record in records],
+            'next_question_ids': [record['n'] for record in records],
+            'created_at': [record['t'] for record in records],
+        })
+        return cursor.fetchone()[0]
+
+
+def flush_spool(batch_size: int) -> FlushStats:
+    """Перенести в БД все накопленные в буфере ответы."""
+    spool: Spool = get_spool()
+    spool.rotate()
+
+    stats: FlushStats = FlushStats()
+    started_at: float = time.monotonic()
+    for segment in spool.segments():
+        for records, offset in spool.read(segment, batch_size=batch_size):
+            stats.rows += flush_answers(records)
+            spool.commit(segment, offset)
+            oldest: datetime = datetime.fromisoformat(records[0]['t'])
+            stats.max_lag = max(stats.max_lag, (timezone.now() - oldest).total_seconds())
+        spool.remove(segment)
+    stats.seconds = time.monotonic() - started_at
+    return stats
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Перед добавлением уникальности объединяем дубли: ответы переносим в последний результат пользователя
+        # по опросу, остальные результаты удаляем.
+        migrations.RunSQL(
+            sql=[
+                '''
+                WITH ranked AS (
+                    SELECT id, max(id) OVER (PARTITION BY user_id, survey_id) AS keep_id
+                    FROM surveys_surveyresult
+                )
+                UPDATE surveys_surveyresultchoice AS result_choice
+                SET result_id = ranked.keep_id
+                FROM ranked
+                WHERE result_choice.result_id = ranked.id AND ranked.id <> ranked.keep_id
+                ''',
+                '''
+                DELETE FROM surveys_surveyresult AS result
+                USING (
+                    SELECT id, max(id) OVER (PARTITION BY user_id, survey_id) AS keep_id
+                    FROM surveys_surveyresult
+                ) AS ranked
+                WHERE result.id = ranked.id AND ranked.id <> ranked.keep_id
+                ''',
+                # Отложенные проверки внешних ключей нужно выполнить до изменения схемы таблицы.
+                'SET CONSTRAINTS ALL IMMEDIATE',
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RemoveIndex(
+            model_name='surveyresult',
+            name='surveys_sur_user_id_523fed_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='surveyresult',
+            constraint=models.UniqueConstraint(fields=('user', 'survey'), name='surveys_surveyresult_user_survey_uniq'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0002_surveyresult_user_survey_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceCounterDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField(default=1, verbose_name='приращение')),
+                ('choice', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='surveys.choice', verbose_name='вариант ответа')),
+            ],
+            options={
+                'verbose_name': 'приращение счетчика ответов',
+                'verbose_name_plural': 'приращения счетчиков ответов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChoiceCounter',
+            fields=[
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='surveys.choice', verbose_name='вариант ответа')),
+                ('count', models.BigIntegerField(default=0, verbose_name='кол-во ответов')),
+                ('question', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='surveys.question', verbose_name='вопрос')),
+                ('survey', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='surveys.survey', verbose_name='опрос')),
+            ],
+            options={
+                'verbose_name': 'счетчик ответов',
+                'verbose_name_plural': 'счетчики ответов',
+                'indexes': [models.Index(fields=['survey', 'question', 'choice'], include=('count',), name='surveys_choicecounter_survey')],
+            },
+        ),
+    ]
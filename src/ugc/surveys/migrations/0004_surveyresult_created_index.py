@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:52
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индекс большой таблицы строится без блокировки записи.
+    atomic = False
+
+    dependencies = [
+        ('surveys', '0003_choice_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='surveyresult',
+            index=models.Index(fields=['created_at', 'id'], name='surveys_surveyresult_created'),
+        ),
+    ]
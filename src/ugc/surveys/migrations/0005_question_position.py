@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0004_surveyresult_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='position',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='номер'),
+        ),
+        migrations.AddField(
+            model_name='survey',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='кол-во вопросов'),
+        ),
+        # Номера вопросов по цепочкам всех опросов, как в ugc.surveys.chain.update_positions.
+        migrations.RunSQL(
+            sql='''
+            WITH RECURSIVE chain AS (
+                SELECT question.survey_id, question.id, question.next_id, 1 AS position, ARRAY[question.id] AS path
+                FROM surveys_survey AS survey
+                JOIN surveys_question AS question
+                    ON question.id = survey.first_question_id AND question.survey_id = survey.id
+                UNION ALL
+                SELECT question.survey_id, question.id, question.next_id, chain.position + 1, chain.path || question.id
+                FROM chain
+                JOIN surveys_question AS question
+                    ON question.id = chain.next_id AND question.survey_id = chain.survey_id
+                WHERE NOT question.id = ANY(chain.path)
+            ), positions AS (
+                UPDATE surveys_question AS question
+                SET position = chain.position
+                FROM chain
+                WHERE question.id = chain.id
+            )
+            UPDATE surveys_survey AS survey
+            SET question_count = counts.count
+            FROM (SELECT survey_id, COUNT(*) AS count FROM chain GROUP BY survey_id) AS counts
+            WHERE survey.id = counts.survey_id
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['survey', 'position'], name='surveys_question_position'),
+        ),
+    ]
@@ -0,0 +1,156 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+RESULT_TABLE = 'surveys_surveyresult'
+ANSWER_TABLE = 'surveys_surveyresultchoice'
+
+# Внешние ключи ответов, которые создаются вручную.
+ANSWER_RESULT_FK = 'surveys_surveyresultchoice_result_fk'
+ANSWER_SURVEY_FK = 'surveys_surveyresultchoice_survey_id_fk_surveys_survey_id'
+# Внешний ключ ответов на результат до секционирования.
+ANSWER_RESULT_PLAIN_FK = 'surveys_surveyresult_result_id_491a2ab5_fk_surveys_s'
+
+
+def _get_definitions(cursor, table: str) -> tuple[list[tuple[str, str]], list[str]]:
+    """Ограничения таблицы (кроме первичного ключа и ссылок на результаты и опрос у ответов) и индексы."""
+    cursor.execute(
+        '''
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass AND conparentid = 0 AND contype <> 'p' AND confrelid <> %s::regclass
+            AND NOT conname = ANY(%s)
+        ORDER BY conname
+        ''',
+        [table, RESULT_TABLE, [ANSWER_SURVEY_FK]],
+    )
+    constraints: list[tuple[str, str]] = cursor.fetchall()
+    cursor.execute(
+        '''
+        SELECT indexdef
+        FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s
+            AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+        ORDER BY indexname
+        ''',
+        [table, table],
+    )
+    return constraints, [row[0] for row in cursor.fetchall()]
+
+
+def _replace_tables(cursor, primary_key: str, definitions: dict[str, tuple[list[tuple[str, str]], list[str]]]):
+    """Заменить таблицы результатов и ответов заполненными таблицами <таблица>_new и восстановить на них
+    автоинкремент, первичный ключ, ограничения и индексы старых таблиц."""
+    cursor.execute(f'DROP TABLE {ANSWER_TABLE}, {RESULT_TABLE}')
+    for table in (RESULT_TABLE, ANSWER_TABLE):
+        constraints, indexes = definitions[table]
+        cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+        cursor.execute(f'ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+        )
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({primary_key})')
+        for name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+        for definition in indexes:
+            cursor.execute(definition)
+
+
+def partition_tables(apps, schema_editor):
+    """Пересоздать таблицы результатов и ответов секционированными по диапазонам id опроса."""
+    options: dict = getattr(settings, 'SURVEYS_PARTITIONS', {})
+    size: int = options.get('SIZE', 100000)
+    ahead: int = options.get('AHEAD', 2)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM surveys_survey')
+        max_survey_id: int = cursor.fetchone()[0]
+        definitions = {table: _get_definitions(cursor, table) for table in (RESULT_TABLE, ANSWER_TABLE)}
+
+        cursor.execute(
+            f'CREATE TABLE {RESULT_TABLE}_new (LIKE {RESULT_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (survey_id)'
+        )
+        cursor.execute(
+            f'CREATE TABLE {ANSWER_TABLE}_new (LIKE {ANSWER_TABLE} INCLUDING DEFAULTS, survey_id bigint NOT NULL) '
+            f'PARTITION BY RANGE (survey_id)'
+        )
+        # Секции с запасом, как в ugc.surveys.partitions.get_missing_partitions.
+        for table in (RESULT_TABLE, ANSWER_TABLE):
+            for start in range(0, (max_survey_id // size + 1 + ahead) * size, size):
+                cursor.execute(
+                    f'CREATE TABLE {table}_{start}_{start + size} PARTITION OF {table}_new '
+                    f'FOR VALUES FROM ({start}) TO ({start + size})'
+                )
+            cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table}_new DEFAULT')
+
+        cursor.execute(f'INSERT INTO {RESULT_TABLE}_new SELECT * FROM {RESULT_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {ANSWER_TABLE}_new SELECT answer.*, result.survey_id FROM {ANSWER_TABLE} AS answer '
+            f'JOIN {RESULT_TABLE} AS result ON result.id = answer.result_id'
+        )
+        _replace_tables(cursor, 'id, survey_id', definitions)
+        cursor.execute(
+            f'ALTER TABLE {ANSWER_TABLE} ADD CONSTRAINT {ANSWER_RESULT_FK} FOREIGN KEY (result_id, survey_id) '
+            f'REFERENCES {RESULT_TABLE} (id, survey_id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        cursor.execute(
+            f'ALTER TABLE {ANSWER_TABLE} ADD CONSTRAINT {ANSWER_SURVEY_FK} FOREIGN KEY (survey_id) '
+            f'REFERENCES surveys_survey (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+
+
+def merge_tables(apps, schema_editor):
+    """Вернуть обычные таблицы результатов и ответов. Отсоединенные секции не переносятся."""
+    with schema_editor.connection.cursor() as cursor:
+        definitions = {table: _get_definitions(cursor, table) for table in (RESULT_TABLE, ANSWER_TABLE)}
+        cursor.execute(f'CREATE TABLE {RESULT_TABLE}_new (LIKE {RESULT_TABLE} INCLUDING DEFAULTS)')
+        cursor.execute(f'INSERT INTO {RESULT_TABLE}_new SELECT * FROM {RESULT_TABLE}')
+        cursor.execute(f'CREATE TABLE {ANSWER_TABLE}_new (LIKE {ANSWER_TABLE} INCLUDING DEFAULTS)')
+        cursor.execute(f'ALTER TABLE {ANSWER_TABLE}_new DROP COLUMN survey_id')
+        cursor.execute(
+            f'INSERT INTO {ANSWER_TABLE}_new (id, result_id, choice_id, created_at) '
+            f'SELECT id, result_id, choice_id, created_at FROM {ANSWER_TABLE}'
+        )
+        _replace_tables(cursor, 'id', definitions)
+        cursor.execute(
+            f'ALTER TABLE {ANSWER_TABLE} ADD CONSTRAINT {ANSWER_RESULT_PLAIN_FK} FOREIGN KEY (result_id) '
+            f'REFERENCES {RESULT_TABLE} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0005_question_position'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='surveyresultchoice',
+                    name='survey',
+                    field=models.ForeignKey(
+                        db_index=False,
+                        default=None,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to='surveys.survey',
+                        verbose_name='опрос',
+                    ),
+                    preserve_default=False,
+                ),
+                migrations.AlterField(
+                    model_name='surveyresultchoice',
+                    name='result',
+                    field=models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='surveys.surveyresult',
+                        verbose_name='результат',
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(partition_tables, merge_tables),
+            ],
+        ),
+    ]
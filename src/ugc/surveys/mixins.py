@@ -1,3 +1,7 @@
+from django.http import JsonResponse
+from django.utils.translation import gettext_lazy as _
+
+
 class FormWidgetMixin:
     """Миксин позволяет в админке задавать виджеты для указанных полей."""
 
@@ -23,3 +27,22 @@ class FormWidgetMixin:
             })
 
         return formfield
+
+
+class JsonLoginRequiredMixin:
+    """Миксин для JSON API: вместо перенаправления на страницу входа возвращает ошибку 401."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': _('Требуется авторизация')}, status=401)
+        # noinspection PyUnresolvedReferences
+        return super().dispatch(request, *args, **kwargs)
+
+
+class JsonStaffRequiredMixin(JsonLoginRequiredMixin):
+    """Миксин для служебного JSON API: доступ только сотрудникам."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated and not request.user.is_staff:
+            return JsonResponse({'error': _('Недостаточно прав')}, status=403)
+        return super().dispatch(request, *args, **kwargs)
@@ -1,16 +1,25 @@
 import uuid
+from contextvars import ContextVar
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+# Цепочка вопросов проверяется целиком (см. ugc.surveys.chain.validate_chain), проверки ссылок в clean не нужны.
+chain_clean_skipped: ContextVar[bool] = ContextVar('chain_clean_skipped', default=False)
+
 
 class Survey(models.Model):
     title = models.TextField(verbose_name=_('заголовок'))
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, verbose_name=_('автор'))
     first_question = models.ForeignKey('Question', on_delete=models.SET_NULL, null=True, blank=True,
                                        verbose_name=_('первый вопрос'), related_name='first_question')
+    # Длина цепочки вопросов, пересчитывается в ugc.surveys.chain.
+    question_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('кол-во вопросов'))
+    # Версия описания опроса, увеличивается в транзакции изменения опроса, его вопросов или вариантов ответа
+    # (см. ugc.surveys.chain). Используется в ETag описания опроса в API.
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name=_('версия'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('дата добавления'))
 
     class Meta:
@@ -20,6 +29,7 @@ class Survey(models.Model):
     def clean(self):
         # Доп. проверка корректности ссылок.
         if (
+            not chain_clean_skipped.get() and
             self.first_question_id is not None and
             not Question.objects.filter(id=self.first_question_id, survey_id=self.id).exists()
         ):
@@ -30,6 +40,12 @@ class Survey(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            # Версия увеличивается только запросом version = version + 1 (см. ugc.surveys.chain), загруженное
+            # ранее значение не должно ее перезаписать.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'version'
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -41,15 +57,21 @@ class Question(models.Model):
     text = models.TextField(verbose_name=_('текст вопроса'))
     next = models.ForeignKey('Question', on_delete=models.SET_NULL, null=True, blank=True,
                              verbose_name=_('следующий вопрос'))
+    # Номер в цепочке вопросов опроса, начиная с 1, пересчитывается в ugc.surveys.chain. Пустой для вопросов
+    # вне цепочки.
+    position = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name=_('номер'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('дата добавления'))
 
     class Meta:
         verbose_name = _('вопрос')
         verbose_name_plural = _('вопросы')
+        indexes = [
+            models.Index(fields=['survey', 'position'], name='surveys_question_position'),
+        ]
 
     def clean(self):
         # Доп. проверка корректности ссылок.
-        if self.next_id is not None:
+        if self.next_id is not None and not chain_clean_skipped.get():
             if self.next_id == self.id:
                 raise ValidationError(_('Следующий вопрос не может быть текущим'))
             if not Question.objects.filter(id=self.next_id, survey_id=self.survey_id).exists():
@@ -103,8 +125,12 @@ class SurveyResult(models.Model):
     class Meta:
         verbose_name = _('результат опроса')
         verbose_name_plural = _('результаты опросов')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'survey'], name='surveys_surveyresult_user_survey_uniq'),
+        ]
         indexes = [
-            models.Index(fields=['user', 'survey']),
+            # Постраничный просмотр по ключу в админке.
+            models.Index(fields=['created_at', 'id'], name='surveys_surveyresult_created'),
         ]
 
     def __str__(self):
@@ -112,11 +138,21 @@ class SurveyResult(models.Model):
 
 
 class SurveyResultChoice(models.Model):
+    # Таблицы результатов секционированы по опросу (см. ugc.surveys.partitions), поэтому ссылка на результат
+    # в БД составная (result_id, survey_id) и создана в миграции.
     result = models.ForeignKey(
         SurveyResult,
         on_delete=models.CASCADE,
+        db_constraint=False,
         verbose_name=_('результат'),
     )
+    # Опрос результата, ключ секционирования. Индекс не нужен: опрос входит в первичный ключ.
+    survey = models.ForeignKey(
+        Survey,
+        on_delete=models.PROTECT,
+        db_index=False,
+        verbose_name=_('опрос'),
+    )
     choice = models.ForeignKey(Choice, on_delete=models.PROTECT, verbose_name=_('ответ'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('дата добавления'))
 
@@ -126,6 +162,10 @@ class SurveyResultChoice(models.Model):
 
     def clean(self):
         # Доп. проверка корректности ссылок.
+        if self.result.survey_id != self.survey_id:
+            raise ValidationError(
+                _('Опрос ответа должен совпадать с опросом в результате')
+            )
         if self.result.survey_id != self.choice.question.survey_id:
             raise ValidationError(
                 _('Опрос в результате должно совпадать с опросом в вопросе выбранного ответа')
@@ -137,3 +177,38 @@ class SurveyResultChoice(models.Model):
 
     def __str__(self):
         return f'{_('Вариант ответа')} {self.id}'
+
+
+class ChoiceCounter(models.Model):
+    """Кол-во ответов на вариант ответа. Обновляется командой compact_choice_counters из ChoiceCounterDelta."""
+    choice = models.OneToOneField(Choice, on_delete=models.CASCADE, primary_key=True,
+                                  verbose_name=_('вариант ответа'))
+    # Удаляются каскадно вместе с вариантом ответа, отдельный поиск по вопросу и опросу не нужен.
+    question = models.ForeignKey(Question, on_delete=models.DO_NOTHING, db_index=False, verbose_name=_('вопрос'))
+    survey = models.ForeignKey(Survey, on_delete=models.DO_NOTHING, db_index=False, verbose_name=_('опрос'))
+    count = models.BigIntegerField(default=0, verbose_name=_('кол-во ответов'))
+
+    class Meta:
+        verbose_name = _('счетчик ответов')
+        verbose_name_plural = _('счетчики ответов')
+        indexes = [
+            # Распределение ответов по опросу читается только из индекса.
+            models.Index(fields=['survey', 'question', 'choice'], include=['count'],
+                         name='surveys_choicecounter_survey'),
+        ]
+
+    def __str__(self):
+        return f'{_('Счетчик ответов')} {self.choice_id}'
+
+
+class ChoiceCounterDelta(models.Model):
+    """Приращение счетчика ответов. Добавляется вместе с ответом, чтобы не блокировать строку счетчика."""
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, db_index=False, verbose_name=_('вариант ответа'))
+    delta = models.IntegerField(default=1, verbose_name=_('приращение'))
+
+    class Meta:
+        verbose_name = _('приращение счетчика ответов')
+        verbose_name_plural = _('приращения счетчиков ответов')
+
+    def __str__(self):
+        return f'{_('Приращение счетчика ответов')} {self.id}'
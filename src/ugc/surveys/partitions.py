@@ -0,0 +1,183 @@
+"""
+Секционирование результатов опросов.
+
+SurveyResult и SurveyResultChoice секционированы в PostgreSQL по диапазонам survey_id (миграция 0006) с одинаковыми
+границами секций. Все результаты и ответы опроса лежат в одной секции каждой таблицы, поэтому запросы с условием
+на опрос (страница опроса, запись ответов, выгрузка, аналитика, ответы результата в админке) читают только ее.
+Первичные ключи таблиц - (id, survey_id), ответы ссылаются на результаты составным ключом.
+
+Строки опросов, для которых еще нет секции, попадают в секцию по умолчанию. Команда manage_partitions заранее
+создает секции для новых опросов (переносит в них строки из секции по умолчанию, если они там уже есть) и
+отсоединяет секции старых опросов. Отсоединенные секции остаются в БД отдельными таблицами без внешних ключей.
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Model, Max
+
+from ugc.surveys.models import Survey, SurveyResult, SurveyResultChoice
+
+# Секционированные модели. Секции создаются в этом порядке, отсоединяются в обратном.
+PARTITIONED_MODELS: tuple[type[Model], ...] = (SurveyResult, SurveyResultChoice)
+
+PARTITION_KEY = 'survey_id'
+
+_BOUND_RE = re.compile(r"FOR VALUES FROM \('?(-?\d+)'?\) TO \('?(-?\d+)'?\)")
+
+
+def get_settings() -> dict:
+    return getattr(settings, 'SURVEYS_PARTITIONS', {})
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    # Границы диапазона id опросов [start, end). None у секции по умолчанию.
+    start: int | None
+    end: int | None
+
+    @property
+    def is_default(self) -> bool:
+        return self.start is None
+
+
+def get_partition_name(model: type[Model], start: int, end: int) -> str:
+    # noinspection PyProtectedMember
+    return f'{model._meta.db_table}_{start}_{end}'
+
+
+def get_partitions(model: type[Model], using: str = DEFAULT_DB_ALIAS) -> list[Partition]:
+    """Секции таблицы модели по возрастанию границ, секция по умолчанию - последняя."""
+    # noinspection PyProtectedMember
+    table: str = model._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            '''
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            ''',
+            [table],
+        )
+        rows: list[tuple[str, str]] = cursor.fetchall()
+
+    partitions: list[Partition] = []
+    for name, bound in rows:
+        match: re.Match | None = _BOUND_RE.search(bound)
+        if match:
+            partitions.append(Partition(name, int(match[1]), int(match[2])))
+        else:
+            partitions.append(Partition(name, None, None))
+    partitions.sort(key=lambda partition: (partition.is_default, partition.start or 0))
+    return partitions
+
+
+def create_partition(start: int, end: int, using: str = DEFAULT_DB_ALIAS):
+    """
+    Создать секции диапазона опросов [start, end) во всех секционированных таблицах. Строки этих опросов
+    из секций по умолчанию переносятся в новые секции в той же транзакции.
+    """
+    connection = connections[using]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        # Внешние ключи проверяются сразу, чтобы к созданию секций не осталось отложенных проверок.
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        buffers: list[str] = []
+        moved: list[tuple[type[Model], str]] = []
+        for model in PARTITIONED_MODELS:
+            default: Partition | None = next(
+                (partition for partition in get_partitions(model, using) if partition.is_default),
+                None,
+            )
+            if default is None:
+                continue
+            # noinspection PyProtectedMember
+            table: str = model._meta.db_table
+            buffer: str = f'{table}_moved'
+            cursor.execute(f'CREATE TEMPORARY TABLE {buffer} (LIKE {table}) ON COMMIT DROP')
+            buffers.append(buffer)
+            cursor.execute(
+                f'INSERT INTO {buffer} SELECT * FROM {default.name} '
+                f'WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s',
+                [start, end],
+            )
+            if cursor.rowcount:
+                moved.append((model, buffer))
+
+        # Ответы удаляются раньше результатов, на которые они ссылаются, и вставляются после них.
+        for model, buffer in reversed(moved):
+            # noinspection PyProtectedMember
+            cursor.execute(
+                f'DELETE FROM {model._meta.db_table} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s',
+                [start, end],
+            )
+        for model in PARTITIONED_MODELS:
+            # noinspection PyProtectedMember
+            cursor.execute(
+                f'CREATE TABLE {get_partition_name(model, start, end)} PARTITION OF {model._meta.db_table} '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+        for model, buffer in moved:
+            # noinspection PyProtectedMember
+            cursor.execute(f'INSERT INTO {model._meta.db_table} SELECT * FROM {buffer}')
+        for buffer in buffers:
+            cursor.execute(f'DROP TABLE {buffer}')
+
+
+def detach_partition(start: int, end: int, using: str = DEFAULT_DB_ALIAS):
+    """
+    Отсоединить секции диапазона опросов [start, end) от всех секционированных таблиц. Внешние ключи
+    отсоединенных таблиц удаляются, чтобы они не мешали изменять и удалять пользователей и опросы.
+    """
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for model in reversed(PARTITIONED_MODELS):
+            name: str = get_partition_name(model, start, end)
+            # noinspection PyProtectedMember
+            cursor.execute(f'ALTER TABLE {model._meta.db_table} DETACH PARTITION {name}')
+            cursor.execute(
+                "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+                [name],
+            )
+            for constraint, in cursor.fetchall():
+                cursor.execute(f'ALTER TABLE {name} DROP CONSTRAINT {constraint}')
+
+
+def get_missing_partitions(size: int, ahead: int, using: str = DEFAULT_DB_ALIAS) -> list[tuple[int, int]]:
+    """
+    Диапазоны секций, которых не хватает, чтобы покрыть существующие опросы и еще ahead секций после
+    секции последнего опроса. Новые секции начинаются с конца последней существующей.
+    :param size: Кол-во опросов в секции.
+    :param ahead: Кол-во секций, создаваемых заранее.
+    """
+    max_survey_id: int = Survey.objects.using(using).aggregate(value=Max('id'))['value'] or 0
+    target: int = (max_survey_id // size + 1 + ahead) * size
+    start: int = max(
+        (partition.end for partition in get_partitions(PARTITIONED_MODELS[0], using) if not partition.is_default),
+        default=0,
+    )
+    return [(bound, bound + size) for bound in range(start, target, size)]
+
+
+def get_stale_partitions(before: datetime, using: str = DEFAULT_DB_ALIAS) -> list[Partition]:
+    """
+    Секции опросов, в которых нет опросов и результатов новее before. Секция, в которую еще могут попасть
+    новые опросы, не считается старой.
+    """
+    max_survey_id: int = Survey.objects.using(using).aggregate(value=Max('id'))['value'] or 0
+    stale: list[Partition] = []
+    for partition in get_partitions(PARTITIONED_MODELS[0], using):
+        if partition.is_default or partition.end > max_survey_id:
+            continue
+        surveys = Survey.objects.using(using).filter(id__gte=partition.start, id__lt=partition.end)
+        results = SurveyResult.objects.using(using).filter(
+            survey_id__gte=partition.start,
+            survey_id__lt=partition.end,
+        )
+        if surveys.filter(created_at__gte=before).exists() or results.filter(created_at__gte=before).exists():
+            continue
+        stale.append(partition)
+    return stale
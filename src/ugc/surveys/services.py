@@ -0,0 +1,140 @@
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from ugc.surveys.models import Survey, Question, Choice, SurveyResult, SurveyResultChoice, ChoiceCounterDelta
+
+# Запись ответа одним запросом: проверка варианта ответа, upsert результата опроса с переходом к следующему
+# вопросу, добавление ответа и приращения счетчика ответов. Результат обновляется, только если отвечают на его
+# текущий вопрос, а новый результат создается, только если отвечают на первый вопрос опроса. Если ни одно
+# из условий не выполнилось, запрос не возвращает строк и ответ не сохраняется.
+# noinspection PyProtectedMember
+RECORD_ANSWER_SQL = f'''
+WITH choice AS (
+    SELECT question.id AS question_id, question.next_id, survey.first_question_id
+    FROM {Choice._meta.db_table} AS choice
+    JOIN {Question._meta.db_table} AS question ON question.id = choice.question_id
+    JOIN {Survey._meta.db_table} AS survey ON survey.id = question.survey_id
+    WHERE choice.id = %(choice_id)s AND question.survey_id = %(survey_id)s
+), result AS (
+    INSERT INTO {SurveyResult._meta.db_table} AS result (user_id, survey_id, current_question_id, created_at)
+    SELECT %(user_id)s, %(survey_id)s, choice.next_id, %(now)s
+    FROM choice
+    WHERE choice.question_id = choice.first_question_id OR EXISTS (
+        SELECT 1 FROM {SurveyResult._meta.db_table}
+        WHERE user_id = %(user_id)s AND survey_id = %(survey_id)s
+    )
+    ON CONFLICT (user_id, survey_id) DO UPDATE
+    SET current_question_id = EXCLUDED.current_question_id
+    WHERE result.current_question_id = (SELECT question_id FROM choice)
+    RETURNING result.id, result.current_question_id
+), answer AS (
+    INSERT INTO {SurveyResultChoice._meta.db_table} (result_id, survey_id, choice_id, created_at)
+    SELECT result.id, %(survey_id)s, %(choice_id)s, %(now)s
+    FROM result
+), counter AS (
+    INSERT INTO {ChoiceCounterDelta._meta.db_table} (choice_id, delta)
+    SELECT %(choice_id)s, 1
+    FROM result
+)
+SELECT current_question_id FROM result
+'''
+
+# Получение результата опроса с блокировкой строки. Если результата нет, он создается с первым вопросом опроса
+# в качестве текущего.
+# noinspection PyProtectedMember
+LOCK_RESULT_SQL = f'''
+INSERT INTO {SurveyResult._meta.db_table} AS result (user_id, survey_id, current_question_id, created_at)
+SELECT %(user_id)s, survey.id, survey.first_question_id, %(now)s
+FROM {Survey._meta.db_table} AS survey
+WHERE survey.id = %(survey_id)s
+ON CONFLICT (user_id, survey_id) DO UPDATE
+SET current_question_id = result.current_question_id
+RETURNING result.id, result.current_question_id
+'''
+
+
+def record_answer(user_id: int, survey_id: int, choice_id: int) -> int | None:
+    """
+    Сохранить ответ пользователя на текущий вопрос опроса.
+
+    Выполняется одним запросом к БД и не требует явной транзакции.
+    :param user_id: Идентификатор пользователя.
+    :param survey_id: Идентификатор опроса.
+    :param choice_id: Идентификатор выбранного варианта ответа.
+    :return: Идентификатор следующего вопроса или None, если опрос завершен.
+    :raises ValidationError: Вариант ответа не относится к опросу или к текущему вопросу пользователя.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_ANSWER_SQL, {
+            'user_id': user_id,
+            'survey_id': survey_id,
+            'choice_id': choice_id,
+            'now': timezone.now(),
+        })
+        row: tuple[int | None] | None = cursor.fetchone()
+
+    if row is None:
+        raise ValidationError(_('Вариант ответа не относится к текущему вопросу опроса'))
+    return row[0]
+
+
+@transaction.atomic
+def record_answers(user_id: int, survey_id: int, answers: list[tuple[int, int]]) -> int | None:
+    """
+    Сохранить пакет ответов пользователя, начиная с его текущего вопроса.
+
+    Пакет проверяется целиком одним запросом к вариантам ответов: каждый ответ должен относиться к опросу
+    и идти по цепочке вопросов от текущего. Ответы и приращения счетчиков добавляются одним запросом каждые.
+    :param user_id: Идентификатор пользователя.
+    :param survey_id: Идентификатор опроса.
+    :param answers: Пары (id вопроса, id варианта ответа) в порядке прохождения.
+    :return: Идентификатор следующего вопроса или None, если опрос завершен.
+    :raises ValidationError: Пакет не соответствует цепочке вопросов.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(LOCK_RESULT_SQL, {'user_id': user_id, 'survey_id': survey_id, 'now': timezone.now()})
+        row: tuple[int, int | None] | None = cursor.fetchone()
+    if row is None:
+        raise ValidationError(_('Опрос не найден'))
+    result_id, current_question_id = row
+
+    choices: dict[int, tuple[int, int | None]] = {
+        choice_id: (question_id, next_id)
+        for choice_id, question_id, next_id in Choice.objects.filter(
+            id__in=[choice_id for question_id, choice_id in answers],
+            question__survey_id=survey_id,
+        ).values_list('id', 'question_id', 'question__next_id')
+    }
+
+    for idx, (question_id, choice_id) in enumerate(answers):
+        if current_question_id is None:
+            raise ValidationError(_('Опрос уже пройден, ответ %(idx)d лишний') % {'idx': idx + 1})
+        if question_id != current_question_id:
+            raise ValidationError(
+                _('Ответ %(idx)d должен быть на вопрос с id = %(question_id)d') % {
+                    'idx': idx + 1,
+                    'question_id': current_question_id,
+                }
+            )
+        choice: tuple[int, int | None] | None = choices.get(choice_id)
+        if choice is None or choice[0] != question_id:
+            raise ValidationError(
+                _('Вариант ответа %(idx)d не относится к вопросу с id = %(question_id)d') % {
+                    'idx': idx + 1,
+                    'question_id': question_id,
+                }
+            )
+        current_question_id = choice[1]
+
+    SurveyResultChoice.objects.bulk_create(
+        SurveyResultChoice(result_id=result_id, survey_id=survey_id, choice_id=choice_id)
+        for question_id, choice_id in answers
+    )
+    ChoiceCounterDelta.objects.bulk_create(
+        ChoiceCounterDelta(choice_id=choice_id)
+        for question_id, choice_id in answers
+    )
+    SurveyResult.objects.filter(id=result_id, survey_id=survey_id).update(current_question_id=current_question_id)
+    return current_question_id
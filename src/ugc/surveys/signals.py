@@ -0,0 +1,45 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ugc.surveys.chain import schedule_survey_update
+from ugc.surveys.compiled import invalidate_compiled_survey
+from ugc.surveys.models import Survey, Question, Choice
+
+
+def _invalidate_survey(survey_id: int | None):
+    # Сбрасываем кэш после коммита, чтобы параллельный запрос не закэшировал старое состояние заново.
+    if survey_id is not None:
+        transaction.on_commit(partial(invalidate_compiled_survey, survey_id))
+
+
+@receiver(post_save, sender=Survey)
+@receiver(post_delete, sender=Survey)
+def survey_changed(sender, instance: Survey, **kwargs):
+    _invalidate_survey(instance.id)
+
+
+@receiver(post_save, sender=Survey)
+def survey_saved(sender, instance: Survey, **kwargs):
+    # Мог измениться первый вопрос цепочки.
+    schedule_survey_update(instance.id, using=kwargs['using'])
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance: Question, **kwargs):
+    _invalidate_survey(instance.survey_id)
+    schedule_survey_update(instance.survey_id, using=kwargs['using'])
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance: Choice, **kwargs):
+    survey_id: int | None = (
+        Question.objects.filter(id=instance.question_id).values_list('survey_id', flat=True).first()
+    )
+    _invalidate_survey(survey_id)
+    if survey_id is not None:
+        schedule_survey_update(survey_id, using=kwargs['using'])
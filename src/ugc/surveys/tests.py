@@ -1,3 +1,715 @@
-from django.test import TestCase
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ugc.common.spool import Spool
+from ugc.surveys import ingestion, partitions
+from ugc.surveys.admin import SurveyResultAdmin
+from ugc.surveys.analytics import SurveyAnalytics, analyze_survey
+from ugc.surveys.catalog import SurveyCatalog
+from ugc.surveys.chain import skip_chain_clean, update_positions, validate_chain
+from ugc.surveys.compiled import get_compiled_survey, invalidate_compiled_survey, store_compiled_surveys
+from ugc.surveys.counters import compact_deltas, get_distribution, rebuild_counters
+from ugc.surveys.models import (
+    Survey,
+    Question,
+    Choice,
+    SurveyResult,
+    SurveyResultChoice,
+    ChoiceCounter,
+    ChoiceCounterDelta,
+)
+from ugc.surveys.services import record_answer
+
+
+def create_survey(author, questions: int = 3, choices: int = 2) -> Survey:
+    """Опрос с цепочкой из questions вопросов по порядку создания и choices вариантами ответа на каждый."""
+    survey: Survey = Survey.objects.create(title='Опрос', author=author)
+    next_question: Question | None = None
+    for idx in reversed(range(questions)):
+        next_question = Question.objects.create(survey=survey, text=f'Вопрос {idx + 1}', next=next_question)
+        Choice.objects.bulk_create(
+            Choice(question=next_question, text=f'Ответ {order + 1}', order=order) for order in range(choices)
+        )
+    survey.first_question = next_question
+    survey.save()
+    return survey
+
+
+def get_chain(survey: Survey) -> list[Question]:
+    questions: dict[int, Question] = {question.id: question for question in survey.question_set.all()}
+    chain: list[Question] = []
+    question: Question | None = questions.get(survey.first_question_id)
+    while question is not None:
+        chain.append(question)
+        question = questions.get(question.next_id)
+    return chain
+
+
+class RecordAnswerTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='respondent')
+        cls.survey = create_survey(cls.user)
+        cls.questions = get_chain(cls.survey)
+        cls.choices = [question.choice_set.first() for question in cls.questions]
+
+    def _get_result(self) -> SurveyResult | None:
+        return SurveyResult.objects.filter(user=self.user, survey=self.survey).first()
+
+    def _get_answers(self) -> list[int]:
+        return list(
+            SurveyResultChoice.objects
+            .filter(survey=self.survey, result__user=self.user)
+            .order_by('id')
+            .values_list('choice_id', flat=True)
+        )
+
+    def test_first_answer_creates_result(self):
+        next_id = record_answer(self.user.id, self.survey.id, self.choices[0].id)
+
+        self.assertEqual(next_id, self.questions[1].id)
+        self.assertEqual(self._get_result().current_question_id, self.questions[1].id)
+        self.assertEqual(self._get_answers(), [self.choices[0].id])
+        self.assertEqual(ChoiceCounterDelta.objects.filter(choice=self.choices[0]).count(), 1)
+
+    def test_wrong_question(self):
+        with self.assertRaises(ValidationError):
+            record_answer(self.user.id, self.survey.id, self.choices[1].id)
+
+        self.assertIsNone(self._get_result())
+        self.assertEqual(self._get_answers(), [])
+        self.assertFalse(ChoiceCounterDelta.objects.exists())
+
+    def test_choice_of_another_survey(self):
+        other: Survey = create_survey(self.user)
+        with self.assertRaises(ValidationError):
+            record_answer(self.user.id, self.survey.id, get_chain(other)[0].choice_set.first().id)
+
+        self.assertIsNone(self._get_result())
+
+    def test_duplicate_answer(self):
+        record_answer(self.user.id, self.survey.id, self.choices[0].id)
+
+        # Повторная отправка формы с уже отвеченным вопросом.
+        with self.assertRaises(ValidationError):
+            record_answer(self.user.id, self.survey.id, self.choices[0].id)
+
+        self.assertEqual(self._get_result().current_question_id, self.questions[1].id)
+        self.assertEqual(self._get_answers(), [self.choices[0].id])
+        self.assertEqual(ChoiceCounterDelta.objects.count(), 1)
+
+    def test_completion(self):
+        next_ids = [record_answer(self.user.id, self.survey.id, choice.id) for choice in self.choices]
+
+        self.assertEqual(next_ids, [self.questions[1].id, self.questions[2].id, None])
+        self.assertIsNone(self._get_result().current_question_id)
+        self.assertEqual(self._get_answers(), [choice.id for choice in self.choices])
+
+        with self.assertRaises(ValidationError):
+            record_answer(self.user.id, self.survey.id, self.choices[0].id)
+        self.assertEqual(len(self._get_answers()), len(self.choices))
+
+
+class ValidateChainTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='author')
+        cls.survey = create_survey(cls.user)
+        cls.questions = get_chain(cls.survey)
+        cls.other_questions = get_chain(create_survey(cls.user))
+
+    def _validate(self, **kwargs) -> list[str]:
+        with self.assertRaises(ValidationError) as ctx:
+            validate_chain(self.survey.id, self.survey.first_question_id, **kwargs)
+        return ctx.exception.messages
+
+    def test_valid_changes(self):
+        first, second, third = self.questions
+        validate_chain(self.survey.id, first.id)
+        # Перестановка двух последних вопросов.
+        validate_chain(self.survey.id, first.id, changes={first.id: third.id, third.id: second.id, second.id: None})
+        # Удаление последнего вопроса и новый вопрос вне цепочки, пока на него нельзя сослаться.
+        validate_chain(self.survey.id, first.id, changes={second.id: None}, deleted={third.id}, new_next_ids=[None])
+
+    def test_cycle(self):
+        first, second, third = self.questions
+        messages = self._validate(changes={third.id: first.id})
+        self.assertEqual(messages, [f'Цепочка вопросов зациклена на вопросе {first.id}'])
+
+    def test_self_reference(self):
+        second = self.questions[1]
+        messages = self._validate(changes={second.id: second.id})
+        self.assertEqual(messages, [f'Следующий вопрос для вопроса {second.id} не может быть текущим'])
+
+    def test_unreachable(self):
+        first, second, third = self.questions
+        messages = self._validate(changes={first.id: third.id})
+        self.assertEqual(messages, [f'Вопросы {second.id} не входят в цепочку, начинающуюся с первого вопроса'])
+
+    def test_foreign_question(self):
+        first, second, third = self.questions
+        foreign = self.other_questions[0]
+        messages = self._validate(changes={third.id: foreign.id}, new_next_ids=[foreign.id])
+        self.assertEqual(messages, [
+            f'Следующий вопрос для вопроса {third.id}: вопрос {foreign.id} не принадлежит опросу',
+            f'Следующий вопрос для нового вопроса: вопрос {foreign.id} не принадлежит опросу',
+        ])
+
+        with self.assertRaises(ValidationError) as ctx:
+            validate_chain(self.survey.id, foreign.id)
+        self.assertEqual(ctx.exception.messages, [f'Первый вопрос: вопрос {foreign.id} не принадлежит опросу'])
+
+    def test_deleted_target(self):
+        first, second, third = self.questions
+        messages = self._validate(deleted={second.id})
+        self.assertEqual(messages, [f'Следующий вопрос для вопроса {first.id}: вопрос {second.id} удаляется'])
+
+    def test_queries(self):
+        with self.assertNumQueries(1):
+            validate_chain(self.survey.id, self.survey.first_question_id, changes={self.questions[2].id: None})
+
+
+class SurveyVersionTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='author')
+        cls.survey = create_survey(cls.user)
+
+    def setUp(self):
+        invalidate_compiled_survey(self.survey.id)
+        self.client.force_login(self.user)
+        self.url = reverse('survey_api', args=(self.survey.id,))
+
+    def _get_version(self) -> int:
+        return Survey.objects.values_list('version', flat=True).get(id=self.survey.id)
+
+    def test_changes_bump_version(self):
+        version: int = self._get_version()
+        stale: Survey = Survey.objects.get(id=self.survey.id)
+
+        question: Question = get_chain(self.survey)[-1]
+        question.text = 'Новый текст'
+        question.save()
+        choice: Choice = question.choice_set.first()
+        choice.text = 'Новый ответ'
+        choice.save()
+        self.assertEqual(self._get_version(), version + 2)
+
+        # Опрос, загруженный до изменений, не перезаписывает версию.
+        stale.title = 'Новый заголовок'
+        stale.save()
+        self.assertEqual(self._get_version(), version + 3)
+
+    def test_min_version(self):
+        version: int = get_compiled_survey(self.survey.id).version
+        # Изменение в обход сигналов: кэш процесса не сброшен.
+        Survey.objects.filter(id=self.survey.id).update(version=F('version') + 1)
+
+        self.assertEqual(get_compiled_survey(self.survey.id).version, version)
+        self.assertEqual(get_compiled_survey(self.survey.id, min_version=version + 1).version, version + 1)
+        self.assertEqual(get_compiled_survey(self.survey.id).version, version + 1)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], self._get_version())
+        self.assertIn('private', response['Cache-Control'])
+        etag: str = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        question: Question = get_chain(self.survey)[0]
+        question.text = 'Новый текст'
+        question.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['version'], self._get_version())
+
+
+class StaleCompiledSurveyTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='respondent')
+        cls.survey = create_survey(cls.user)
+
+    def setUp(self):
+        invalidate_compiled_survey(self.survey.id)
+        self.client.force_login(self.user)
+
+    def _create_stale_question(self) -> Question:
+        """Новый последний вопрос, о котором не знает скомпилированный опрос в кэше (как в другом процессе)."""
+        stale = get_compiled_survey(self.survey.id)
+        question: Question = Question.objects.create(survey=self.survey, text='Новый вопрос')
+        Choice.objects.create(question=question, text='Новый ответ', order=0)
+        Question.objects.filter(id=get_chain(self.survey)[-1].id).update(next=question)
+        store_compiled_surveys([stale])
+        SurveyResult.objects.create(user=self.user, survey=self.survey, current_question=question)
+        return question
+
+    def test_unknown_question_recompiles_survey(self):
+        question: Question = self._create_stale_question()
+
+        for name in ('survey', 'survey_async'):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name, args=(self.survey.id,)))
+                self.assertContains(response, question.text)
+                self.assertNotContains(response, 'Спасибо за участие')
+
+        self.assertIsNotNone(get_compiled_survey(self.survey.id).get_question(question.id))
+
+    def test_unknown_question_in_api(self):
+        question: Question = self._create_stale_question()
+
+        response = self.client.get(reverse('survey_api_answers', args=(self.survey.id,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['current_question_id'], question.id)
+
+
+class SurveyCatalogTestCase(SimpleTestCase):
+
+    def _get_catalog(self, surveys: int) -> SurveyCatalog:
+        empty: np.ndarray = np.zeros(0, dtype=np.int64)
+        return SurveyCatalog(
+            survey_ids=np.arange(1, surveys + 1),
+            question_offsets=np.zeros(surveys + 1, dtype=np.int64),
+            question_ids=empty,
+            choice_offsets=np.zeros(1, dtype=np.int64),
+            choice_ids=empty,
+        )
+
+    def _assert_unique(self, picks: np.ndarray, surveys: int):
+        self.assertTrue((picks[:, 1:] > picks[:, :-1]).all())
+        self.assertTrue(((picks >= 0) & (picks < surveys)).all())
+
+    def test_sample_surveys(self):
+        rng: np.random.Generator = np.random.default_rng(0)
+        for surveys, amount_per_user in ((1000, 10), (100, 99), (100, 60), (5, 10)):
+            with self.subTest(surveys=surveys, amount_per_user=amount_per_user):
+                picks: np.ndarray = self._get_catalog(surveys).sample_surveys(rng, 500, amount_per_user)
+                self.assertEqual(picks.shape, (500, min(surveys, amount_per_user)))
+                self._assert_unique(picks, surveys)
+
+    def test_sample_surveys_chunks(self):
+        picks: np.ndarray = self._get_catalog(50).sample_surveys(
+            np.random.default_rng(0), 101, 49, chunk_elements=200,
+        )
+        self.assertEqual(picks.shape, (101, 49))
+        self._assert_unique(picks, 50)
+        # Каждая строка - своя случайная выборка.
+        self.assertGreater(len(np.unique(picks, axis=0)), 1)
+
+
+class SurveyCatalogLoadTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='author')
+        # Вопросы создаются с конца цепочки: порядок id обратен порядку цепочки.
+        cls.surveys = [create_survey(cls.user, questions=3, choices=2), create_survey(cls.user, questions=2)]
+        update_positions([survey.id for survey in cls.surveys])
+
+    def test_chain_order(self):
+        catalog: SurveyCatalog = SurveyCatalog.load()
+        chains: list[list[Question]] = [get_chain(survey) for survey in self.surveys]
+        self.assertEqual(catalog.question_ids.tolist(), [question.id for chain in chains for question in chain])
+
+        results, choice_ids = catalog.sample_answers(np.random.default_rng(0), np.array([0, 1]), np.array([2, 1]))
+        self.assertEqual(results.tolist(), [0, 0, 1])
+        self.assertEqual(
+            [Choice.objects.get(id=choice_id).question_id for choice_id in choice_ids.tolist()],
+            [chains[0][0].id, chains[0][1].id, chains[1][0].id],
+        )
+        self.assertEqual(
+            catalog.get_current_questions(np.array([0, 1]), np.array([2, 1])).tolist(),
+            [chains[0][2].id, chains[1][1].id],
+        )
+
+
+class AnalyzeSurveyTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.survey = create_survey(get_user_model().objects.create_user(username='author'), questions=2, choices=2)
+        cls.choices = [list(question.choice_set.order_by('order')) for question in get_chain(cls.survey)]
+        users = [get_user_model().objects.create_user(username=f'respondent{idx}') for idx in range(3)]
+        for user, answers in zip(users, ((0, 0), (0, 1), (1,))):
+            for question_idx, choice_idx in enumerate(answers):
+                record_answer(user.id, cls.survey.id, cls.choices[question_idx][choice_idx].id)
+
+    def test_cooccurrence(self):
+        # Маленькие пакеты: ответы одного результата попадают в разные пакеты.
+        analytics: SurveyAnalytics = analyze_survey(self.survey.id, chunk_size=1)
+        first, second = self.choices
+        self.assertEqual(analytics.respondents, 3)
+        # Варианты ответа по порядку id вопросов: второй вопрос цепочки создан раньше первого.
+        self.assertEqual(analytics.choice_ids.tolist(), [choice.id for choice in [*second, *first]])
+        self.assertEqual(analytics.marginals.tolist(), [1, 1, 2, 1])
+
+        rows, columns, counts = analytics.crosstab(first[0].question_id, second[0].question_id)
+        self.assertEqual(counts.tolist(), [[1, 1], [0, 0]])
+
+    def test_unknown_choice(self):
+        # Ответ с вариантом, которого нет среди вариантов опроса, не учитывается.
+        foreign: Choice = get_chain(create_survey(self.survey.author))[0].choice_set.first()
+        result: SurveyResult = SurveyResult.objects.create(
+            user=get_user_model().objects.create_user(username='foreign'), survey=self.survey,
+        )
+        # В обход проверок SurveyResultChoice.save.
+        SurveyResultChoice.objects.bulk_create([SurveyResultChoice(result=result, survey=self.survey, choice=foreign)])
+
+        analytics: SurveyAnalytics = analyze_survey(self.survey.id)
+        self.assertEqual(analytics.respondents, 3)
+        self.assertEqual(analytics.marginals.tolist(), [1, 1, 2, 1])
+
+
+class AnswerBufferTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [get_user_model().objects.create_user(username=f'respondent{idx}') for idx in range(2)]
+        cls.survey = create_survey(cls.users[0])
+        cls.questions = get_chain(cls.survey)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        buffer_settings = override_settings(
+            SURVEYS_ANSWER_BUFFER={**settings.SURVEYS_ANSWER_BUFFER, 'ENABLED': True, 'PATH': directory.name,
+                                   'FSYNC': False, 'PROGRESS_CACHE_ALIAS': 'progress'},
+            CACHES={**settings.CACHES, 'progress': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': f'{directory.name}/progress',
+            }},
+        )
+        buffer_settings.enable()
+        self.addCleanup(buffer_settings.disable)
+        ingestion.get_spool.cache_clear()
+        self.addCleanup(ingestion.get_spool.cache_clear)
+        invalidate_compiled_survey(self.survey.id)
+
+    def _answer(self, user, answers: int):
+        """Ответить на answers вопросов опроса первыми вариантами ответа."""
+        survey = get_compiled_survey(self.survey.id)
+        question = survey.first_question
+        for _ in range(answers):
+            ingestion.buffer_answer(user.id, survey, question, question.choices[0].id)
+            question = survey.get_question(question.next_id)
+
+    def _assert_flushed(self):
+        first_choices: list[int] = [question.choice_set.order_by('order').first().id for question in self.questions]
+        self.assertEqual(
+            dict(SurveyResult.objects.filter(survey=self.survey).values_list('user_id', 'current_question_id')),
+            {self.users[0].id: None, self.users[1].id: self.questions[1].id},
+        )
+        self.assertEqual(
+            sorted(SurveyResultChoice.objects.filter(survey=self.survey).values_list('result__user_id', 'choice_id')),
+            sorted([*((self.users[0].id, choice_id) for choice_id in first_choices),
+                    (self.users[1].id, first_choices[0])]),
+        )
+        counters = ChoiceCounterDelta.objects.values('choice_id').annotate(total=Sum('delta'))
+        self.assertEqual(
+            dict(counters.values_list('choice_id', 'total')),
+            {first_choices[0]: 2, first_choices[1]: 1, first_choices[2]: 1},
+        )
+
+    def test_flush(self):
+        self._answer(self.users[0], 3)
+        self._answer(self.users[1], 1)
+        self.assertEqual(
+            ingestion.get_buffered_progress(self.users[1].id, self.survey.id), (True, self.questions[1].id),
+        )
+        self.assertFalse(SurveyResult.objects.exists())
+
+        stats: ingestion.FlushStats = ingestion.flush_spool(batch_size=2)
+        self.assertEqual(stats.rows, 4)
+        self._assert_flushed()
+        self.assertEqual(ingestion.get_spool().segments(), [])
+        self.assertEqual(ingestion.flush_spool(batch_size=2).rows, 0)
+
+    def test_crash_before_offset_commit(self):
+        self._answer(self.users[0], 3)
+        self._answer(self.users[1], 1)
+
+        # Сбой после фиксации первого пакета в БД, но до фиксации смещения в буфере.
+        with mock.patch.object(Spool, 'commit', side_effect=OSError), self.assertRaises(OSError):
+            ingestion.flush_spool(batch_size=2)
+        self.assertEqual(SurveyResultChoice.objects.count(), 2)
+
+        # Первый пакет переносится повторно, но уже записанные ответы пропускаются.
+        self.assertEqual(ingestion.flush_spool(batch_size=2).rows, 2)
+        self._assert_flushed()
+
+
+class ChoiceCounterTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(username='author')
+        cls.surveys = [create_survey(author), create_survey(author)]
+        users = [get_user_model().objects.create_user(username=f'respondent{idx}') for idx in range(3)]
+        for survey in cls.surveys:
+            for user_idx, user in enumerate(users):
+                # Ответы разными вариантами: первый пользователь проходит опрос, остальные - часть вопросов.
+                for question in get_chain(survey)[:user_idx + 1]:
+                    record_answer(user.id, survey.id, question.choice_set.order_by('order')[user_idx % 2].id)
+
+    def _get_answer_counts(self, survey: Survey) -> dict[int, int]:
+        return dict(
+            SurveyResultChoice.objects.filter(survey=survey).values('choice_id').annotate(total=Count('id'))
+            .values_list('choice_id', 'total')
+        )
+
+    def _get_counters(self, survey: Survey) -> dict[int, int]:
+        return dict(ChoiceCounter.objects.filter(survey=survey).values_list('choice_id', 'count'))
+
+    def test_compact(self):
+        deltas: int = ChoiceCounterDelta.objects.count()
+        self.assertEqual(compact_deltas(batch_size=4), 4)
+        self.assertEqual(ChoiceCounterDelta.objects.count(), deltas - 4)
+
+        while compact_deltas(batch_size=4):
+            pass
+        self.assertFalse(ChoiceCounterDelta.objects.exists())
+        for survey in self.surveys:
+            self.assertEqual(self._get_counters(survey), self._get_answer_counts(survey))
+
+        distribution: dict[int, dict[int, int]] = get_distribution(self.surveys[0].id)
+        self.assertEqual(
+            {choice_id: count for counts in distribution.values() for choice_id, count in counts.items()},
+            self._get_answer_counts(self.surveys[0]),
+        )
+
+    def test_rebuild(self):
+        while compact_deltas(batch_size=100):
+            pass
+        # Счетчики разошлись с ответами, а у опроса есть несвернутое приращение.
+        ChoiceCounter.objects.update(count=100)
+        choice: Choice = get_chain(self.surveys[0])[0].choice_set.first()
+        ChoiceCounterDelta.objects.create(choice=choice, delta=5)
+
+        self.assertEqual(rebuild_counters(self.surveys[0].id), len(self._get_answer_counts(self.surveys[0])))
+        self.assertEqual(self._get_counters(self.surveys[0]), self._get_answer_counts(self.surveys[0]))
+        self.assertFalse(ChoiceCounterDelta.objects.exists())
+        # Счетчики другого опроса не пересчитываются.
+        self.assertEqual(set(self._get_counters(self.surveys[1]).values()), {100})
+
+        rebuild_counters()
+        self.assertEqual(self._get_counters(self.surveys[1]), self._get_answer_counts(self.surveys[1]))
+
+
+class KeysetPaginationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser(username='admin')
+        survey: Survey = create_survey(cls.admin)
+        SurveyResult.objects.bulk_create(
+            SurveyResult(survey=survey, user=get_user_model().objects.create_user(username=f'respondent{idx}'))
+            for idx in range(10)
+        )
+        # Одинаковое время у части результатов: страницы разделяются по второму полю сортировки (id).
+        results: list[int] = list(SurveyResult.objects.order_by('id').values_list('id', flat=True))
+        SurveyResult.objects.filter(id__in=results[2:7]).update(created_at=timezone.now())
+        cls.expected = list(SurveyResult.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:surveys_surveyresult_changelist')
+        patcher = mock.patch.object(SurveyResultAdmin, 'list_per_page', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_page(self, query: str = ''):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        cl = response.context['cl']
+        return [result.id for result in cl.result_list], cl
+
+    def test_next_and_previous(self):
+        pages: list[list[int]] = []
+        ids, cl = self._get_page()
+        self.assertIsNone(cl.previous_url)
+        pages.append(ids)
+        while cl.next_url:
+            ids, cl = self._get_page(cl.next_url)
+            pages.append(ids)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 3, 1])
+        self.assertEqual([result_id for ids in pages for result_id in ids], self.expected)
+
+        for ids in reversed(pages[:-1]):
+            page, cl = self._get_page(cl.previous_url)
+            self.assertEqual(page, ids)
+        self.assertIsNone(cl.previous_url)
+
+    def test_last(self):
+        _, cl = self._get_page()
+        ids, cl = self._get_page(cl.last_url)
+        # Последняя страница отсчитывается с конца.
+        self.assertEqual(ids, self.expected[-3:])
+        self.assertIsNone(cl.next_url)
+        ids, cl = self._get_page(cl.previous_url)
+        self.assertEqual(ids, self.expected[-6:-3])
+
+    def test_tampered_cursor(self):
+        _, cl = self._get_page()
+        query: str = cl.next_url
+        # Подпись не совпадает с измененным курсором: страница не открывается, админка сбрасывает параметры.
+        response = self.client.get(self.url + query[:-2] + ('AA' if not query.endswith('AA') else 'BB'))
+        self.assertRedirects(response, self.url + '?e=1', fetch_redirect_response=False)
+
+
+class QuestionPositionTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='author')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.survey = create_survey(cls.user)
+
+    def _get_positions(self) -> tuple[list[int | None], int]:
+        """Номера вопросов по порядку цепочки (вопросы вне цепочки - в конце) и длина цепочки."""
+        positions = Question.objects.filter(survey=self.survey).order_by(F('position').asc(nulls_last=True), 'id')
+        return (
+            list(positions.values_list('position', flat=True)),
+            Survey.objects.values_list('question_count', flat=True).get(id=self.survey.id),
+        )
+
+    def _get_chain_ids(self) -> list[int]:
+        return list(
+            Question.objects.filter(survey=self.survey, position__isnull=False)
+            .order_by('position').values_list('id', flat=True)
+        )
+
+    def test_created(self):
+        self.assertEqual(self._get_positions(), ([1, 2, 3], 3))
+        self.assertEqual(self._get_chain_ids(), [question.id for question in get_chain(self.survey)])
+
+    def test_insert(self):
+        first, second, third = get_chain(self.survey)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            question: Question = Question.objects.create(survey=self.survey, text='Новый вопрос', next=second)
+            first.next = question
+            first.save()
+
+        self.assertEqual(self._get_positions(), ([1, 2, 3, 4], 4))
+        self.assertEqual(self._get_chain_ids(), [first.id, question.id, second.id, third.id])
+        # Изменения одной транзакции пересчитываются один раз.
+        self.assertEqual(sum(hasattr(callback, 'pending') for callback in callbacks), 1)
+
+    def test_move(self):
+        first, second, third = get_chain(self.survey)
+        with self.captureOnCommitCallbacks(execute=True), skip_chain_clean():
+            second.next = None
+            second.save()
+            third.next = first
+            third.save()
+            self.survey.first_question = third
+            self.survey.save()
+
+        self.assertEqual(self._get_positions(), ([1, 2, 3], 3))
+        self.assertEqual(self._get_chain_ids(), [third.id, first.id, second.id])
+
+    def test_exclude(self):
+        first, second, third = get_chain(self.survey)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.next = third
+            first.save()
+
+        # Вопрос вне цепочки остается без номера.
+        self.assertEqual(self._get_positions(), ([1, 2, None], 2))
+        self.assertEqual(self._get_chain_ids(), [first.id, third.id])
+        self.assertIsNone(Question.objects.get(id=second.id).position)
+
+
+class PartitionTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='author')
+        cls.start = max(
+            partition.end for partition in partitions.get_partitions(SurveyResult) if not partition.is_default
+        )
+
+    def _create_result(self, survey_id: int):
+        """Результат с ответом для опроса с заданным id, вне существующих секций."""
+        survey: Survey = Survey.objects.create(id=survey_id, title='Опрос', author=self.user)
+        question: Question = Question.objects.create(survey=survey, text='Вопрос')
+        choice: Choice = Choice.objects.create(question=question, text='Ответ', order=0)
+        result: SurveyResult = SurveyResult.objects.create(user=self.user, survey=survey)
+        SurveyResultChoice.objects.bulk_create([SurveyResultChoice(result=result, survey=survey, choice=choice)])
+
+    def _count_rows(self, survey_id: int) -> dict[str, int]:
+        """Кол-во строк опроса по секциям обеих таблиц."""
+        counts: dict[str, int] = {}
+        with connection.cursor() as cursor:
+            for model in partitions.PARTITIONED_MODELS:
+                # noinspection PyProtectedMember
+                cursor.execute(
+                    f'SELECT tableoid::regclass::text, count(*) FROM {model._meta.db_table} '
+                    f'WHERE survey_id = %s GROUP BY 1',
+                    [survey_id],
+                )
+                counts.update(cursor.fetchall())
+        return counts
+
+    def _manage_partitions(self):
+        with self.assertLogs('ugc.common.management.commands.manage_partitions'):
+            call_command('manage_partitions', size=10, ahead=1)
+
+    def test_manage_partitions(self):
+        start: int = self.start
+        self._create_result(start + 5)
+        self.assertEqual(self._count_rows(start + 5), {
+            f'{model._meta.db_table}_default': 1 for model in partitions.PARTITIONED_MODELS
+        })
+
+        self._manage_partitions()
+        created: list[partitions.Partition] = [
+            partition for partition in partitions.get_partitions(SurveyResult)
+            if not partition.is_default and partition.end > start
+        ]
+        self.assertEqual([(partition.start, partition.end) for partition in created],
+                         [(start, start + 10), (start + 10, start + 20)])
+        # Строки опроса перенесены из секции по умолчанию в новую секцию.
+        self.assertEqual(self._count_rows(start + 5), {
+            partitions.get_partition_name(model, start, start + 10): 1 for model in partitions.PARTITIONED_MODELS
+        })
+
+        # Новые опросы сразу попадают в свою секцию.
+        self._create_result(start + 15)
+        self.assertEqual(self._count_rows(start + 15), {
+            partitions.get_partition_name(model, start + 10, start + 20): 1
+            for model in partitions.PARTITIONED_MODELS
+        })
+
+        # Секция нового опроса стала последней: заранее создается еще одна, повторный запуск ничего не меняет.
+        self._manage_partitions()
+        before: list[list[partitions.Partition]] = [
+            partitions.get_partitions(model) for model in partitions.PARTITIONED_MODELS
+        ]
+        self.assertEqual(before[0][-2], partitions.Partition(
+            partitions.get_partition_name(SurveyResult, start + 20, start + 30), start + 20, start + 30,
+        ))
+        self._manage_partitions()
+        self.assertEqual([partitions.get_partitions(model) for model in partitions.PARTITIONED_MODELS], before)
+        self.assertEqual(partitions.get_missing_partitions(size=10, ahead=1), [])
+        self.assertEqual(SurveyResult.objects.filter(survey_id__gte=start).count(), 2)
@@ -1,7 +1,19 @@
 from django.urls import path
 
-from .views import SurveyView
+from .views import (
+    SurveyView,
+    AsyncSurveyView,
+    SurveyDefinitionApiView,
+    SurveyAnswersApiView,
+    SurveyDistributionApiView,
+    SurveyAnalyticsApiView,
+)
 
 urlpatterns = [
     path('<int:survey_id>/', SurveyView.as_view(), name='survey'),
+    path('<int:survey_id>/async/', AsyncSurveyView.as_view(), name='survey_async'),
+    path('<int:survey_id>/api/', SurveyDefinitionApiView.as_view(), name='survey_api'),
+    path('<int:survey_id>/api/answers/', SurveyAnswersApiView.as_view(), name='survey_api_answers'),
+    path('<int:survey_id>/api/distribution/', SurveyDistributionApiView.as_view(), name='survey_api_distribution'),
+    path('<int:survey_id>/api/analytics/', SurveyAnalyticsApiView.as_view(), name='survey_api_analytics'),
 ]
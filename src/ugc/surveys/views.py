@@ -1,50 +1,318 @@
+import json
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction
-from django.shortcuts import render, get_object_or_404
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.utils.translation import gettext_lazy as _
 from django.views import View
 
-from ugc.surveys.models import Survey, SurveyResult, SurveyResultChoice, Question, Choice
+from ugc.surveys import ingestion
+from ugc.surveys.analytics import SurveyAnalytics, analyze_survey
+from ugc.surveys.compiled import (
+    CompiledSurvey,
+    CompiledQuestion,
+    get_compiled_survey,
+    aget_compiled_survey,
+    get_compiled_question,
+    aget_compiled_question,
+)
+from ugc.surveys.counters import get_distribution
+from ugc.surveys.mixins import JsonLoginRequiredMixin, JsonStaffRequiredMixin
+from ugc.surveys.models import Survey, SurveyResult
+from ugc.surveys.services import record_answer, record_answers
 
 
-class SurveyView(LoginRequiredMixin, View):
-    template_name = 'surveys/survey.html'
+def get_current_question(user_id: int, survey: CompiledSurvey) -> tuple[CompiledSurvey, CompiledQuestion | None]:
+    """
+    Текущий вопрос пользователя с учетом еще не перенесенных в БД ответов при отложенной записи.
+    :return: Пара (опрос, вопрос), см. get_compiled_question. Вопрос None - опрос завершен.
+    """
+    if ingestion.is_enabled():
+        found, question_id = ingestion.get_buffered_progress(user_id, survey.id)
+        if found:
+            return get_compiled_question(survey, question_id)
+
+    result: tuple[int | None] | None = SurveyResult.objects.filter(
+        survey_id=survey.id,
+        user_id=user_id,
+    ).values_list('current_question_id').first()
+    return get_compiled_question(survey, result[0] if result else survey.first_question_id)
 
-    def get(self, request, survey_id: int, *args, **kwargs):
-        survey: Survey = get_object_or_404(
-            Survey.objects.select_related(
-                'first_question',
-            ).prefetch_related(
-                'question_set__choice_set',
-            ),
-            pk=survey_id,
-        )
-
-        result: SurveyResult | None = SurveyResult.objects.select_related('current_question').filter(
-            survey_id=survey_id,
-            user=request.user,
-        ).first()
-        current_question: Question | None = result.current_question if result else survey.first_question
 
+class SurveyPageMixin:
+    template_name = 'surveys/survey.html'
+
+    def _render(self, request, survey: CompiledSurvey, question: CompiledQuestion | None):
         context = {
             'survey': survey,
-            'question': current_question,
+            'question': question,
         }
         return render(request, self.template_name, context)
 
+
+class SurveyView(LoginRequiredMixin, SurveyPageMixin, View):
+    def get(self, request, survey_id: int, *args, **kwargs):
+        survey: CompiledSurvey = self._get_survey(survey_id)
+        return self._render(request, *get_current_question(request.user.id, survey))
+
     def post(self, request, survey_id: int, *args, **kwargs):
         choice_id: str | None = request.POST.get('choice')
-        choice: Choice = get_object_or_404(Choice.objects.select_related('question'), pk=choice_id)
+        if not choice_id or not choice_id.isdigit():
+            raise Http404
+
+        survey: CompiledSurvey = self._get_survey(survey_id)
+        try:
+            if ingestion.is_enabled():
+                survey, question = get_current_question(request.user.id, survey)
+                next_question_id: int | None = ingestion.buffer_answer(
+                    user_id=request.user.id,
+                    survey=survey,
+                    question=question,
+                    choice_id=int(choice_id),
+                )
+            else:
+                next_question_id: int | None = record_answer(
+                    user_id=request.user.id,
+                    survey_id=survey_id,
+                    choice_id=int(choice_id),
+                )
+        except ValidationError:
+            # Ответ не на текущий вопрос (например, повторная отправка формы), показываем текущее состояние.
+            return self.get(request, survey_id, *args, **kwargs)
+
+        return self._render(request, *get_compiled_question(survey, next_question_id))
+
+    # noinspection PyMethodMayBeStatic
+    def _get_survey(self, survey_id: int) -> CompiledSurvey:
+        survey: CompiledSurvey | None = get_compiled_survey(survey_id)
+        if survey is None:
+            raise Http404
+        return survey
+
+
+class AsyncSurveyView(SurveyPageMixin, View):
+    """Асинхронная версия SurveyView. Не занимает поток на время запроса при запуске под ASGI-сервером."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # LoginRequiredMixin обращается к request.user синхронно, поэтому проверяем авторизацию сами.
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        # Подменяем ленивого пользователя, чтобы шаблоны не обращались к БД синхронно.
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def get(self, request, survey_id: int, *args, **kwargs):
+        survey: CompiledSurvey = await self._get_survey(survey_id)
+        return self._render(request, *await self._get_current_question(request.user.id, survey))
+
+    async def post(self, request, survey_id: int, *args, **kwargs):
+        choice_id: str | None = request.POST.get('choice')
+        if not choice_id or not choice_id.isdigit():
+            raise Http404
+
+        survey: CompiledSurvey = await self._get_survey(survey_id)
+        try:
+            if ingestion.is_enabled():
+                survey, question = await self._get_current_question(request.user.id, survey)
+                next_question_id: int | None = await sync_to_async(ingestion.buffer_answer)(
+                    user_id=request.user.id,
+                    survey=survey,
+                    question=question,
+                    choice_id=int(choice_id),
+                )
+            else:
+                next_question_id: int | None = await sync_to_async(record_answer)(
+                    user_id=request.user.id,
+                    survey_id=survey_id,
+                    choice_id=int(choice_id),
+                )
+        except ValidationError:
+            return await self.get(request, survey_id, *args, **kwargs)
+
+        return self._render(request, *await aget_compiled_question(survey, next_question_id))
+
+    # noinspection PyMethodMayBeStatic
+    async def _get_survey(self, survey_id: int) -> CompiledSurvey:
+        survey: CompiledSurvey | None = await aget_compiled_survey(survey_id)
+        if survey is None:
+            raise Http404
+        return survey
+
+    # noinspection PyMethodMayBeStatic
+    async def _get_current_question(
+        self, user_id: int, survey: CompiledSurvey,
+    ) -> tuple[CompiledSurvey, CompiledQuestion | None]:
+        if ingestion.is_enabled():
+            found, question_id = await sync_to_async(ingestion.get_buffered_progress)(user_id, survey.id)
+            if found:
+                return await aget_compiled_question(survey, question_id)
+
+        result: tuple[int | None] | None = await SurveyResult.objects.filter(
+            survey_id=survey.id,
+            user_id=user_id,
+        ).values_list('current_question_id').afirst()
+        return await aget_compiled_question(survey, result[0] if result else survey.first_question_id)
+
+
+class SurveyDefinitionApiView(JsonLoginRequiredMixin, View):
+    """
+    Описание опроса целиком: вопросы в порядке прохождения с вариантами ответов.
+
+    ETag строится по версии опроса (Survey.version), поэтому на запрос с If-None-Match актуальной версии
+    возвращается 304 после одного запроса к таблице опросов, без загрузки вопросов и вариантов ответа.
+    """
+    # Сколько секунд клиент может отдавать описание без перепроверки. По умолчанию перепроверяет на каждый запрос,
+    # чтобы изменения опроса применялись сразу. Описание доступно только авторизованным, поэтому ответ кэширует
+    # только клиент (private), но не промежуточные кэши.
+    max_age = 0
 
-        with transaction.atomic():
-            next_question_id: int = choice.question.next_id
-            result, created = SurveyResult.objects.get_or_create(
-                survey_id=survey_id, user=request.user,
-                defaults={'current_question_id': next_question_id},
-            )
-            if not created:
-                result.current_question_id = next_question_id
-                result.save()
+    def get(self, request, survey_id: int, *args, **kwargs):
+        version: int | None = Survey.objects.filter(id=survey_id).values_list('version', flat=True).first()
+        if version is None:
+            return JsonResponse({'error': _('Опрос не найден')}, status=404)
+
+        response = get_conditional_response(request, etag=self._get_etag(survey_id, version))
+        if response is None:
+            survey: CompiledSurvey | None = get_compiled_survey(survey_id, min_version=version)
+            if survey is None:
+                return JsonResponse({'error': _('Опрос не найден')}, status=404)
+            response = JsonResponse(survey.to_dict())
+            # Версия из кэша может быть новее прочитанной (например, с отстающей реплики), ETag соответствует телу.
+            version = survey.version
+
+        response.headers['ETag'] = self._get_etag(survey_id, version)
+        patch_cache_control(response, private=True, max_age=self.max_age, must_revalidate=True)
+        return response
+
+    # noinspection PyMethodMayBeStatic
+    def _get_etag(self, survey_id: int, version: int) -> str:
+        return quote_etag(f'{survey_id}-{version}')
+
+
+class SurveyAnswersApiView(JsonLoginRequiredMixin, View):
+    """
+    Прогресс пользователя по опросу (GET) и отправка нескольких ответов одним запросом (POST).
+
+    Тело POST-запроса: {"answers": [{"question": <id>, "choice": <id>}, ...]}, ответы идут по порядку,
+    начиная с текущего вопроса пользователя. При отложенной записи ответы пишутся в буфер, как и на странице опроса.
+    """
+    max_answers = 100
+
+    def get(self, request, survey_id: int, *args, **kwargs):
+        survey: CompiledSurvey | None = get_compiled_survey(survey_id)
+        if survey is None:
+            return JsonResponse({'error': _('Опрос не найден')}, status=404)
+
+        question: CompiledQuestion | None = get_current_question(request.user.id, survey)[1]
+        return self._render_progress(question.id if question else None)
+
+    def post(self, request, survey_id: int, *args, **kwargs):
+        try:
+            answers: list[tuple[int, int]] = self._parse_answers(request.body)
+        except ValueError:
+            return JsonResponse({'error': _('Неверный формат ответов')}, status=400)
+
+        try:
+            if ingestion.is_enabled():
+                survey: CompiledSurvey | None = get_compiled_survey(survey_id)
+                if survey is None:
+                    return JsonResponse({'error': _('Опрос не найден')}, status=404)
+                survey, question = get_current_question(request.user.id, survey)
+                next_question_id: int | None = ingestion.buffer_answers(
+                    user_id=request.user.id,
+                    survey=survey,
+                    question=question,
+                    answers=answers,
+                )
+            else:
+                next_question_id: int | None = record_answers(
+                    user_id=request.user.id,
+                    survey_id=survey_id,
+                    answers=answers,
+                )
+        except ValidationError as e:
+            return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+
+        return self._render_progress(next_question_id)
+
+    def _parse_answers(self, body: bytes) -> list[tuple[int, int]]:
+        data = json.loads(body)
+        items = data.get('answers') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not 0 < len(items) <= self.max_answers:
+            raise ValueError
+        answers: list[tuple[int, int]] = []
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError
+            question_id, choice_id = item.get('question'), item.get('choice')
+            if type(question_id) is not int or type(choice_id) is not int:
+                raise ValueError
+            answers.append((question_id, choice_id))
+        return answers
+
+    # noinspection PyMethodMayBeStatic
+    def _render_progress(self, current_question_id: int | None) -> JsonResponse:
+        return JsonResponse({
+            'current_question_id': current_question_id,
+            'completed': current_question_id is None,
+        })
+
+
+class SurveyDistributionApiView(JsonStaffRequiredMixin, View):
+    """Распределение ответов по вариантам ответа из счетчиков (см. ugc.surveys.counters)."""
+
+    def get(self, request, survey_id: int, *args, **kwargs):
+        survey: CompiledSurvey | None = get_compiled_survey(survey_id)
+        if survey is None:
+            return JsonResponse({'error': _('Опрос не найден')}, status=404)
+
+        distribution: dict[int, dict[int, int]] = get_distribution(survey_id)
+        return JsonResponse({
+            'id': survey.id,
+            'questions': [
+                {
+                    'id': question.id,
+                    'text': question.text,
+                    'choices': [
+                        {
+                            'id': choice.id,
+                            'text': choice.text,
+                            'count': distribution.get(question.id, {}).get(choice.id, 0),
+                        }
+                        for choice in question.choices
+                    ],
+                }
+                for question in survey.questions
+            ],
+        })
+
+
+class SurveyAnalyticsApiView(JsonStaffRequiredMixin, View):
+    """
+    Аналитика по ответам опроса (см. ugc.surveys.analytics).
+
+    С параметрами question_a и question_b возвращается таблица сопряженности этих вопросов, без них - полная
+    матрица совместной встречаемости вариантов ответа.
+    """
+
+    def get(self, request, survey_id: int, *args, **kwargs):
+        if not Survey.objects.filter(id=survey_id).exists():
+            return JsonResponse({'error': _('Опрос не найден')}, status=404)
 
-            SurveyResultChoice.objects.create(result=result, choice_id=choice_id)
+        questions: list[int | None] = []
+        for name in ('question_a', 'question_b'):
+            value: str = request.GET.get(name, '')
+            if value and not value.isdigit():
+                return JsonResponse({'error': _('Неверный идентификатор вопроса')}, status=400)
+            questions.append(int(value) if value else None)
+        if (questions[0] is None) != (questions[1] is None):
+            return JsonResponse({'error': _('Для таблицы сопряженности нужно указать оба вопроса')}, status=400)
 
-        return self.get(request, survey_id, *args, **kwargs)
+        analytics: SurveyAnalytics = analyze_survey(survey_id)
+        return JsonResponse(analytics.as_dict(*questions))
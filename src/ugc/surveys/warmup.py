@@ -0,0 +1,149 @@
+"""
+Прогрев кэша скомпилированных опросов (см. ugc.surveys.compiled).
+
+После деплоя или перезапуска кэши пусты, и первые респонденты популярных опросов одновременно собирают их из БД.
+Прогрев заранее загружает самые активные опросы - по кол-ву результатов, начатых за последние часы. Опросы
+собираются пакетами по три запроса к БД на пакет, пакеты собираются параллельно в потоках с собственными
+соединениями. В кэш опросы попадают в порядке активности, пока не исчерпан бюджет памяти. Размер опроса
+оценивается по размеру сериализованной структуры, в таком виде она хранится в общем кэше.
+
+Запускается командой warm_survey_cache (прогревает общий кэш) или при старте процесса сервера (ugc.asgi,
+ugc.wsgi) в фоновом потоке, если включен SURVEYS_CACHE_WARMUP['ON_STARTUP'] (прогревает и кэш процесса).
+"""
+import logging
+import pickle
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import batched
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+
+from ugc.surveys import compiled
+from ugc.surveys.compiled import CompiledSurvey, compile_surveys, store_compiled_surveys
+from ugc.surveys.models import SurveyResult
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WarmupStats:
+    # Кол-во активных опросов, отобранных для прогрева.
+    surveys: int = 0
+    warmed: int = 0
+    # Опросы, не поместившиеся в бюджет памяти.
+    skipped: int = 0
+    # Суммарный размер прогретых опросов, байт.
+    size: int = 0
+    seconds: float = 0
+
+
+def get_settings() -> dict:
+    return getattr(settings, 'SURVEYS_CACHE_WARMUP', {})
+
+
+def get_hot_survey_ids(hours: float, limit: int) -> list[int]:
+    """
+    Самые активные опросы.
+    :param hours: Учитываются результаты, начатые за это кол-во последних часов.
+    :param limit: Максимальное кол-во опросов.
+    :return: Идентификаторы опросов по убыванию кол-ва результатов.
+    """
+    since = timezone.now() - timedelta(hours=hours)
+    return list(
+        SurveyResult.objects
+        .filter(created_at__gte=since)
+        .values('survey_id')
+        .annotate(results=Count('id'))
+        .order_by('-results', 'survey_id')
+        .values_list('survey_id', flat=True)[:limit]
+    )
+
+
+def _compile_batch(survey_ids: tuple[int, ...]) -> dict[int, CompiledSurvey]:
+    try:
+        return compile_surveys(list(survey_ids))
+    finally:
+        # Соединения потоков пула Django не закрывает, закрываем их сами.
+        connections.close_all()
+
+
+def warm_compiled_surveys(
+    survey_ids: list[int],
+    batch_size: int = 500,
+    workers: int = 4,
+    memory_budget: int | None = None,
+    local: bool = False,
+) -> WarmupStats:
+    """
+    Собрать опросы и положить их в общий кэш и, опционально, в кэш процесса.
+    :param survey_ids: Идентификаторы опросов в порядке убывания приоритета.
+    :param batch_size: Кол-во опросов, собираемых одним пакетом запросов.
+    :param workers: Кол-во потоков, параллельно собирающих пакеты.
+    :param memory_budget: Максимальный суммарный размер прогретых опросов, байт. None - без ограничения.
+    :param local: Класть ли опросы в кэш процесса.
+    :return: Статистика прогрева.
+    """
+    stats: WarmupStats = WarmupStats(surveys=len(survey_ids))
+    started_at: float = time.monotonic()
+    batches: list[tuple[int, ...]] = list(batched(survey_ids, batch_size))
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='survey-cache-warmup') as executor:
+        futures: list[Future] = [executor.submit(_compile_batch, batch) for batch in batches]
+        # Пакеты обрабатываются по порядку, чтобы бюджет памяти достался самым активным опросам.
+        for index, (batch, future) in enumerate(zip(batches, futures)):
+            surveys: dict[int, CompiledSurvey] = future.result()
+            accepted: list[CompiledSurvey] = []
+            for position, survey_id in enumerate(batch):
+                survey: CompiledSurvey | None = surveys.get(survey_id)
+                if survey is None:
+                    continue
+                size: int = len(pickle.dumps(survey, pickle.HIGHEST_PROTOCOL))
+                if memory_budget is not None and stats.size + size > memory_budget:
+                    stats.skipped += len(batch) - position
+                    break
+                stats.size += size
+                accepted.append(survey)
+            store_compiled_surveys(accepted, local=local)
+            stats.warmed += len(accepted)
+            if stats.skipped:
+                stats.skipped += sum(map(len, batches[index + 1:]))
+                for pending in futures[index + 1:]:
+                    pending.cancel()
+                break
+    stats.seconds = time.monotonic() - started_at
+    return stats
+
+
+def _warm_on_startup():
+    options: dict = get_settings()
+    try:
+        # Больше опросов кэш процесса не вместит, и первыми вытеснил бы самые активные.
+        limit: int = min(options.get('LIMIT', 1000), compiled.get_local_cache_size())
+        stats: WarmupStats = warm_compiled_surveys(
+            get_hot_survey_ids(options.get('HOURS', 24), limit),
+            batch_size=options.get('BATCH_SIZE', 500),
+            workers=options.get('WORKERS', 4),
+            # 0 - без ограничения, как в команде warm_survey_cache.
+            memory_budget=int(options.get('MEMORY_BUDGET_MB', 64) * 1024 * 1024) or None,
+            local=True,
+        )
+        logger.info(
+            f'Кэш опросов прогрет: {stats.warmed} из {stats.surveys} опросов, '
+            f'{stats.size / 1024 / 1024:.1f} МБ за {stats.seconds:.2f} сек'
+        )
+    except Exception:
+        logger.exception('Не удалось прогреть кэш опросов')
+    finally:
+        connections.close_all()
+
+
+def start_warmup_thread() -> threading.Thread:
+    """Прогреть кэш в фоновом потоке, не задерживая запуск процесса."""
+    thread = threading.Thread(target=_warm_on_startup, name='survey-cache-warmup', daemon=True)
+    thread.start()
+    return thread
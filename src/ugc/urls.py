@@ -18,9 +18,12 @@ from django.contrib import admin
 from django.contrib.auth import views as auth_views
 from django.urls import path, include
 
+from ugc.common.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('surveys/', include('ugc.surveys.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ugc.settings')
 
 application = get_wsgi_application()
+
+# Прогрев кэша скомпилированных опросов процесса сервера. Запускается здесь, а не в AppConfig.ready(), чтобы
+# прогрев не выполнялся в командах управления (migrate, warm_survey_cache, ...).
+from ugc.surveys import warmup  # noqa: E402
+
+if warmup.get_settings().get('ON_STARTUP'):
+    warmup.start_warmup_thread()